@@ -11,14 +11,32 @@ sys.path.append(os.getcwd())
 from frontend.styles import apply_custom_styles
 # Importing the Sidebar logic that returns user configurations
 from frontend.sidebar import render_sidebar
-# Importing the backend function that actually calls the AI API
-from backend.api_client import chat_with_industrial_ai
-# Importing the utility to convert chat history into a downloadable PDF
-from backend.utils import generate_pdf_report
+# Importing the Batch Inspection panel (many images analyzed concurrently)
+from frontend.components.batch_panel import render_batch_panel
+# Importing the Performance panel (latency / throughput percentiles)
+from frontend.components.performance_panel import render_performance_panel
+# Importing the opt-in Debug panel (where the time of each rerun goes)
+from frontend.components.debug_panel import render_debug_panel, debug_panel_enabled
+# Importing the stage timers (rolling per-stage histograms, structured logs, slow-rerun profiles)
+from backend.timing import stage, rerun
+# Importing the background job runner that calls the AI API without blocking the script
+from backend.jobs import submit_analysis, submit_full_audit, submit_speculated, PROTOCOL_QUESTION
+# Importing the opt-in speculative pre-analysis (starts the likely first analysis right after an upload)
+from backend.speculative import speculate, claim as claim_speculation
+# Importing the pane that shows running analyses (streamed text + cancel button)
+from frontend.components.job_panel import render_job_panel, session_has_active_job
+# Importing the Prometheus exporter (serves /metrics for production scraping)
+from backend.metrics import start_metrics_server
+# Importing the cache that builds downloadable PDF reports on demand
+from backend.utils import pdf_report_cache
 # Importing all necessary database functions for saving/loading sessions
-from backend.database import init_db, create_session, add_message, get_session_history, update_session_image, get_session_meta
-# Importing the strict Guardrail prompt that defines the AI's identity and boundaries
-from backend.schemas import GUARDRAIL_PROMPT
+from backend.database import init_db, create_session, get_messages_since, get_session_version, get_session_meta
+# Importing the content-addressed image store (deduplicated uploads + display thumbnails)
+from backend.image_store import attach_image, thumbnail_for
+# Importing the helper that combines the persona, the strict Guardrail prompt and operator instructions
+from backend.schemas import build_system_prompt, is_cacheable, wants_structured_output
+# Importing the app configuration (e.g., whether answers are streamed)
+from config.settings import settings
 
 # --- PAGE CONFIGURATION ---
 # Sets up the browser tab title to "DiagnostiQ", uses the full width of the screen, and sets the icon
@@ -26,10 +44,14 @@ st.set_page_config(page_title="DiagnostiQ", layout="wide", page_icon="🔍")
 
 # --- ASSET DIRECTORY SETUP ---
 # Defines where uploaded images are temporarily stored locally
-ASSETS_DIR = os.path.join("frontend", "assets")
+ASSETS_DIR = settings.ASSETS_DIR
 # Creates the folder if it doesn't exist to prevent "File Not Found" errors
 os.makedirs(ASSETS_DIR, exist_ok=True)
 
+# --- METRICS EXPORTER ---
+# Starts the /metrics endpoint once per process (later reruns are no-ops). METRICS_PORT=0 disables it.
+start_metrics_server()
+
 def render_metrics(u):
     """
     Helper function to display the 3 performance metrics (Tokens, Time, Speed)
@@ -44,10 +66,38 @@ def render_metrics(u):
         tokens = u.get('total_tokens', 0)
         latency = u.get('latency', 0.0)
         speed = u.get('throughput', 0.0)
+        ttft = u.get('ttft', 0.0)
+        decode_tps = u.get('decode_tps', 0.0)
+        image_bytes = u.get('image_bytes', 0)
+        image_saved = u.get('image_bytes_saved', 0)
+        cached = u.get('cached', False)
+        context_dropped = u.get('context_dropped', 0)
     else:
         tokens = getattr(u, 'total_tokens', 0)
         latency = getattr(u, 'latency', 0.0)
         speed = getattr(u, 'throughput', 0.0)
+        ttft = getattr(u, 'ttft', 0.0)
+        decode_tps = getattr(u, 'decode_tps', 0.0)
+        image_bytes = getattr(u, 'image_bytes', 0)
+        image_saved = getattr(u, 'image_bytes_saved', 0)
+        cached = getattr(u, 'cached', False)
+        context_dropped = getattr(u, 'context_dropped', 0)
+
+    # Optional pills: only shown when the data exists (older messages don't have these fields)
+    extra_pills = ""
+    # Served from the response cache: no model call was made for this answer
+    if cached:
+        extra_pills += "<div class='tech-pill'>♻ CACHED</div>"
+    # Older messages were left out of the prompt (summarized) to stay within the token budget
+    if context_dropped:
+        extra_pills += f"<div class='tech-pill'>✂ {context_dropped} OLD MSGS TRIMMED</div>"
+    if ttft:
+        extra_pills += f"<div class='tech-pill'>🚀 TTFT {ttft}s</div>"
+    if decode_tps:
+        extra_pills += f"<div class='tech-pill'>✍ {decode_tps} T/s DECODE</div>"
+    # Image payload pill: uploaded size and how much preprocessing shaved off (in KB)
+    if image_bytes:
+        extra_pills += f"<div class='tech-pill'>🖼 {image_bytes // 1024} KB (-{image_saved // 1024} KB)</div>"
     
     # 2. Render the HTML "Pills" (Visual badges)
     # The CSS class 'tech-pill' is defined in frontend/styles.py
@@ -56,9 +106,72 @@ def render_metrics(u):
         <div class='tech-pill'>🪙 {tokens} TOKENS</div>
         <div class='tech-pill'>⏱ {latency}s</div>
         <div class='tech-pill'>⚡ {speed} T/s</div>
+        {extra_pills}
     </div>
     """, unsafe_allow_html=True)
 
+def sync_chat_history(session_id):
+    """
+    Keeps st.session_state.messages in step with the database without reloading everything.
+
+    - First run, or the operator switched sessions: load the full history once.
+    - The session's version counter changed (something was written): fetch only rows newer
+      than the last message id we already hold.
+    - Otherwise (an idle rerun): do nothing. The version check itself runs no SQL, except one
+      'PRAGMA data_version' at most every DATA_VERSION_CHECK_SECONDS (writes from other processes).
+    """
+    sync = st.session_state.get("history_sync")
+    version = get_session_version(session_id)
+
+    if sync is None or sync["session_id"] != session_id or "messages" not in st.session_state:
+        st.session_state.messages = get_messages_since(session_id)
+    elif sync["version"] != version:
+        st.session_state.messages.extend(get_messages_since(session_id, sync["last_id"]))
+    else:
+        return  # Nothing changed since the last rerun
+
+    last_id = st.session_state.messages[-1]["id"] if st.session_state.messages else 0
+    st.session_state.history_sync = {"session_id": session_id, "version": version, "last_id": last_id}
+
+def ask_question(prompt, active_image, base_instruction, user_requirements):
+    """
+    Starts the analysis of one question about the active image as a background job.
+    Used by the chat input and by the one-click protocol button.
+    """
+    session_id = st.session_state.active_session_id
+
+    # 1. Construct the "Super Prompt"
+    # Combine: Sidebar Persona + Global Guardrails + User Instructions
+    # (+ a request for a JSON copy of the Defect Log, for protocols with structured output)
+    active_protocol = st.session_state.get("active_protocol", "")
+    final_system_prompt = build_system_prompt(
+        base_instruction, user_requirements, structured=wants_structured_output(active_protocol)
+    )
+
+    # 2. Start the analysis as a background job
+    # The script does not wait for the model: the job streams the answer, saves the turn
+    # (question + answer) when it is complete, and can be cancelled from the job pane.
+    # The standard protocol question right after an upload adopts the speculative pre-analysis
+    # (already answered or streaming); any other question discards (aborts) it.
+    speculation = claim_speculation(
+        session_id, prompt, active_image, active_protocol, final_system_prompt, len(st.session_state.messages)
+    )
+    if speculation:
+        submit_speculated(session_id, prompt, speculation, protocol=active_protocol)
+    else:
+        # The image (saved path) is passed straight through: the backend caches the prepared
+        # payload, so follow-up turns skip re-encoding.
+        submit_analysis(
+            session_id,
+            prompt,
+            image=active_image,
+            chat_history=st.session_state.messages,  # Context
+            system_prompt=final_system_prompt,
+            protocol=active_protocol,
+            # Repeated questions on the same image reuse the stored answer (opt-in per protocol)
+            cacheable=is_cacheable(active_protocol)
+        )
+
 def main():
     """
     The main execution function of the application.
@@ -66,8 +179,9 @@ def main():
     """
     
     # 1. Initialize Database
-    # Creates the 'sessions' and 'messages' tables if they don't exist yet
-    init_db()
+    # Applies any pending schema migrations the first time it runs in this process (no-op afterwards)
+    with stage("app.init_db"):
+        init_db()
     
     # 2. Session Management (Persistence)
     # If the user opens the app for the first time, generate a Session ID
@@ -82,21 +196,22 @@ def main():
         st.session_state.trigger_new_chat = False  # Reset flag
 
     # 3. Load Chat History
-    # Fetch messages from the database for the active session
-    current_messages = get_session_history(st.session_state.active_session_id)
-    # Sync database history with Streamlit's session state (UI memory)
-    if "messages" not in st.session_state or st.session_state.messages != current_messages:
-        st.session_state.messages = current_messages
+    # Sync database history with Streamlit's session state (UI memory).
+    # Only new rows are fetched, and idle reruns (theme change, typing) don't query (beyond a throttled data_version check).
+    with stage("app.load_session"):
+        sync_chat_history(st.session_state.active_session_id)
 
-    # Fetch metadata (like the saved image path) for the current session
-    session_meta = get_session_meta(st.session_state.active_session_id)
+        # Fetch metadata (like the saved image path) for the current session
+        session_meta = get_session_meta(st.session_state.active_session_id)
 
     # 4. Render Sidebar Controls
     # Displays the sidebar and returns the user's selected configuration
-    base_instruction, user_requirements, selected_theme = render_sidebar()
+    with stage("app.sidebar"):
+        base_instruction, user_requirements, selected_theme = render_sidebar()
     
     # Apply the CSS theme (Light/Dark) based on sidebar selection
-    apply_custom_styles(mode=selected_theme)
+    with stage("app.styles"):
+        apply_custom_styles(mode=selected_theme)
 
     # 5. Render Main Header
     # Using HTML for precise centering and typography
@@ -114,41 +229,78 @@ def main():
         # CLEAN HEADER: Removed the "1." prefix
         st.markdown("#### COMPONENT SCAN")
         
-        # Check if an image is already saved in the database for this session
-        saved_image_path = session_meta.get('image_path') if session_meta else None
+        with stage("app.image"):
+            # Check if an image is already saved in the database for this session
+            saved_image_path = session_meta.get('image_path') if session_meta else None
         
-        # Render File Uploader Widget
-        uploaded_file = st.file_uploader("Upload", type=["jpg", "png", "jpeg"], label_visibility="collapsed")
+            # Render File Uploader Widget
+            uploaded_file = st.file_uploader("Upload", type=["jpg", "png", "jpeg"], label_visibility="collapsed")
         
-        active_image = None
+            active_image = None
+            display_image = None
         
-        # Logic: User just uploaded a NEW file
-        if uploaded_file:
-            # Save the file to the 'assets' folder with the Session ID as the name
-            file_path = os.path.join(ASSETS_DIR, f"{st.session_state.active_session_id}.png")
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # Logic: User just uploaded a NEW file
+            if uploaded_file:
+                # The uploader keeps returning the same file on every rerun, so it is stored only
+                # the first time it is seen for this session (not rewritten on every click).
+                upload_key = (st.session_state.active_session_id, getattr(uploaded_file, "file_id", None) or uploaded_file.name, uploaded_file.size)
+                stored = st.session_state.get("stored_upload")
+                if not stored or stored["key"] != upload_key:
+                    # Saved under the hash of its content (original format kept) and linked to this session
+                    image = attach_image(st.session_state.active_session_id, uploaded_file.getvalue())
+                    stored = {"key": upload_key, "path": image.path, "thumb_path": image.thumb_path or image.path}
+                    st.session_state.stored_upload = stored
+                    # Opt-in (SPECULATIVE_ANALYSIS): run the protocol analysis while the operator types the first question
+                    upload_protocol = st.session_state.get("active_protocol", "")
+                    speculate(
+                        st.session_state.active_session_id, image.path, upload_protocol,
+                        build_system_prompt(base_instruction, user_requirements, structured=wants_structured_output(upload_protocol)),
+                        st.session_state.messages, cacheable=is_cacheable(upload_protocol)
+                    )
+                active_image = stored["path"]
+                display_image = stored["thumb_path"]
+                st.success("✔ IMAGE SAVED")
             
-            # Update the database to link this image to the current session
-            update_session_image(st.session_state.active_session_id, file_path)
-            active_image = uploaded_file
-            st.success("✔ IMAGE SAVED")
-            
-        # Logic: No new upload, but we have a saved file from before
-        elif saved_image_path and os.path.exists(saved_image_path):
-            active_image = saved_image_path
-            st.info("📂 LOADED FROM ARCHIVE")
-
-        # Display the active image or a placeholder box
-        if active_image:
-            st.image(active_image, width="stretch")
-        else:
-            st.markdown(
-                """<div style="text-align:center; padding: 40px; border: 2px dashed var(--border-color); color: var(--text-secondary);">
-                No visual data source.<br>Upload image to begin.
-                </div>""", 
-                unsafe_allow_html=True
-            )
+            # Logic: No new upload, but we have a saved file from before
+            elif saved_image_path and os.path.exists(saved_image_path):
+                active_image = saved_image_path
+                display_image = thumbnail_for(saved_image_path)
+                st.info("📂 LOADED FROM ARCHIVE")
+
+            # Display the active image (as a display-size thumbnail) or a placeholder box
+            if active_image:
+                st.image(display_image, width="stretch")
+                job_running = session_has_active_job(st.session_state.active_session_id)
+                # One click asks the standard protocol question (the one a speculative pre-analysis answers)
+                run_protocol = st.session_state.get("active_protocol", "")
+                if st.button(f"▶ RUN {run_protocol.upper()}", width="stretch", disabled=job_running):
+                    ask_question(PROTOCOL_QUESTION.format(protocol=run_protocol), active_image,
+                                 base_instruction, user_requirements)
+                    st.rerun()
+                # Full audit: every protocol runs on this image at once (answers stream into tabs, saved together)
+                if st.button("🔎 FULL AUDIT", width="stretch", disabled=job_running):
+                    submit_full_audit(st.session_state.active_session_id, active_image,
+                                      st.session_state.messages, user_requirements)
+                    st.rerun()
+            else:
+                st.markdown(
+                    """<div style="text-align:center; padding: 40px; border: 2px dashed var(--border-color); color: var(--text-secondary);">
+                    No visual data source.<br>Upload image to begin.
+                    </div>""", 
+                    unsafe_allow_html=True
+                )
+
+        # Batch mode: analyze a whole QA lot (many images / ZIP) in one go
+        with stage("app.batch_panel"):
+            render_batch_panel(user_requirements)
+
+        # Latency and throughput percentiles (upstream health and capacity planning)
+        with stage("app.performance_panel"):
+            render_performance_panel()
+
+        # Per-stage rerun timings (opt-in: DEBUG_PANEL=true or ?debug=1)
+        if debug_panel_enabled():
+            render_debug_panel()
 
     # === RIGHT COLUMN: CHAT INTERFACE ===
     with col_chat:
@@ -158,10 +310,18 @@ def main():
             # CLEAN HEADER: Removed the "3." prefix
             st.markdown("#### ANALYSIS LOG")
         with c2:
-            # Show download button only if there is chat history
+            # Show export controls only if there is chat history.
+            # The PDF is built only when the operator asks for it, then cached per
+            # (session, last message), so ordinary reruns don't lay out the report at all.
             if st.session_state.messages:
-                pdf_bytes = generate_pdf_report(st.session_state.messages)
-                st.download_button("📥 EXPORT PDF", data=pdf_bytes, file_name=f"Report.pdf", mime="application/pdf", width="stretch")
+                session_id = st.session_state.active_session_id
+                last_message_id = st.session_state.messages[-1].get("id")
+                pdf_bytes = pdf_report_cache.get(session_id, last_message_id)
+                if pdf_bytes is None and st.button("📄 PREPARE PDF", width="stretch"):
+                    with stage("app.pdf_build"):
+                        pdf_bytes = pdf_report_cache.build(session_id, st.session_state.messages)
+                if pdf_bytes is not None:
+                    st.download_button("📥 EXPORT PDF", data=pdf_bytes, file_name=f"Report.pdf", mime="application/pdf", width="stretch")
 
         # Container for chat messages (Scrollable area)
         chat_container = st.container(height=600, border=True)
@@ -171,73 +331,31 @@ def main():
                 st.markdown("<div style='text-align: center; color: var(--text-secondary); padding-top: 50px;'>SYSTEM STANDBY.</div>", unsafe_allow_html=True)
             
             # Loop through and display all messages (User + AI)
-            for msg in st.session_state.messages:
-                with st.chat_message(msg["role"]):
-                    st.markdown(msg["content"])
-                    # If metrics exist for this message, render the pills
-                    if msg.get("usage"):
-                        render_metrics(msg["usage"])
+            with stage("app.chat_render"):
+                for msg in st.session_state.messages:
+                    with st.chat_message(msg["role"]):
+                        st.markdown(msg["content"])
+                        # If metrics exist for this message, render the pills
+                        if msg.get("usage"):
+                            render_metrics(msg["usage"])
+
+            # Analyses running in the background for this session (streamed text, cancel button)
+            render_job_panel(st.session_state.active_session_id)
 
         # 7. User Input Handling
-        if prompt := st.chat_input("Enter diagnostic command..."):
+        # (Disabled while this session's previous question is still being answered)
+        if prompt := st.chat_input("Enter diagnostic command...", disabled=session_has_active_job(st.session_state.active_session_id)):
             # Validation: Prevent chatting without an image
             if not active_image:
                 st.toast("⚠️ ERR: NO VISUAL INPUT DETECTED", icon="🚫")
             else:
-                # 1. Append User Message to State & Database
-                st.session_state.messages.append({"role": "user", "content": prompt})
-                add_message(st.session_state.active_session_id, "user", prompt)
-                
-                # Render user message immediately
-                with chat_container:
-                    with st.chat_message("user"):
-                        st.markdown(prompt)
-
-                # 2. Construct the "Super Prompt"
-                # Combine: Sidebar Persona + Global Guardrails + User Instructions
-                final_system_prompt = f"{base_instruction}\n\n{GUARDRAIL_PROMPT}"
-                if user_requirements:
-                    final_system_prompt += f"\n\nADDITIONAL OPERATOR INSTRUCTIONS:\n{user_requirements}"
-
-                # 3. Call AI Backend
-                with chat_container:
-                    with st.chat_message("assistant"):
-                        message_placeholder = st.empty()
-                        with st.spinner("PROCESSING..."):
-                            try:
-                                # Prepare image data (Bytes) for API
-                                if isinstance(active_image, str):
-                                    img_for_api = open(active_image, "rb")
-                                    import io
-                                    img_bytes = io.BytesIO(img_for_api.read())
-                                    img_for_api.close()
-                                else:
-                                    img_bytes = active_image
-                                
-                                # Send request to Qubrid AI
-                                response = chat_with_industrial_ai(
-                                    current_question=prompt,
-                                    image_file=img_bytes,
-                                    chat_history=st.session_state.messages[:-1], # Context
-                                    system_prompt=final_system_prompt
-                                )
-                                
-                                # Render AI Text Response
-                                message_placeholder.markdown(response.content)
-                                
-                                # Convert usage object to dict for storage
-                                usage_dict = response.usage.model_dump()
-                                
-                                # Render Metrics Pills
-                                render_metrics(response.usage)
-
-                                # 4. Save AI Response to Database
-                                add_message(st.session_state.active_session_id, "assistant", response.content, usage_dict)
-                                st.session_state.messages.append({"role": "assistant", "content": response.content, "usage": usage_dict})
-
-                            except Exception as e:
-                                st.error(f"SYSTEM FAILURE: {str(e)}")
+                ask_question(prompt, active_image, base_instruction, user_requirements)
+
+                # Redraw right away, so the job pane shows the question and the input is disabled
+                st.rerun()
 
 # Standard Python Entry Point
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Every rerun is timed as a whole (and stage by stage inside main) for the debug panel and logs
+    with rerun("app.main"):
+        main()
\ No newline at end of file
@@ -1,117 +1,612 @@
 import requests  # Standard library for making HTTP requests (GET, POST)
+import httpx  # Async-capable HTTP client used by the asyncio variant below
+import asyncio  # Event loop, semaphores and gather for concurrent requests
 import json  # Used for parsing JSON responses from the API
 import re  # Regular expressions (not strictly used here but good for text parsing)
 import time  # Used to track how long the API call takes (Latency)
+import random  # Used to add "jitter" to retry delays so clients don't retry in lockstep
+import threading  # Used to create the shared HTTP session safely from several Streamlit threads
+from email.utils import parsedate_to_datetime  # Parses the HTTP-date form of the 'Retry-After' header
+from datetime import datetime, timezone  # Used to turn a 'Retry-After' date into a number of seconds
+from typing import Callable, Iterator, List, Optional, Union  # Type hinting
+from requests.adapters import HTTPAdapter  # Lets us size the keep-alive connection pool
 from config.settings import settings  # Import API keys and URLs from the settings file
-from backend.schemas import ChatResponse, UsageMetrics  # Import the strict data models
-from backend.utils import encode_image_to_base64  # Helper to convert image bytes to string
+from backend.schemas import ChatRequest, ChatResponse, UsageMetrics, PreparedImage, ContextWindow  # Import the strict data models
+from backend.utils import get_prepared_image  # Helper to shrink the image and convert it to a Base64 string (cached)
+from backend import response_cache  # Persistent answer cache for repeated questions on the same image
+from backend.context_window import fit_context  # Keeps long inspections within the prompt token budget
+from backend.timing import timed  # Per-call latency histograms (debug panel)
+from backend import metrics  # Prometheus counters/histograms (requests, errors, latency, tokens)
 
-def chat_with_industrial_ai(
-    current_question: str, 
-    image_file, 
-    chat_history: list, 
-    system_prompt: str
-) -> ChatResponse:
+# HTTP status codes that are worth retrying: rate limiting and temporary server failures
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# The shared HTTP session (created lazily on the first API call)
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
     """
-    Sends the user's question + image + history to the AI API and returns the answer.
-    Also calculates performance metrics like Latency and Tokens/Sec.
+    Returns the process-wide keep-alive HTTP session.
+
+    Why this is needed:
+    'requests.post' opens a brand new TCP+TLS connection every time. A shared Session keeps
+    connections open in a pool, so every question after the first skips the handshake.
+    The pool is sized by settings.HTTP_POOL_SIZE and is shared by all Streamlit sessions.
     """
-    
-    # 1. Start the stopwatch to measure Latency
-    start_time = time.time()  # <--- Start Timer
+    global _http_session
+    if _http_session is None:
+        # Double-checked locking: only one thread builds the session, the others reuse it
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                # pool_block=True makes extra threads wait for a free connection
+                # instead of opening (and then throwing away) connections beyond the pool size.
+                # Retries are handled by post_with_retry() below, so urllib3's own retries are off.
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.HTTP_POOL_SIZE,
+                    max_retries=0,
+                    pool_block=True
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
 
-    # 2. Prepare the Request Headers
-    # This tells the server who we are (API Key) and what we are sending (JSON)
-    headers = {
+def _retry_after_seconds(response) -> Optional[float]:
+    """
+    Reads the 'Retry-After' header, which can be either a number of seconds or an HTTP date.
+    Returns None if the header is missing or unreadable.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff_delay(attempt: int) -> float:
+    """
+    Exponential backoff with "full jitter": a random delay between 0 and base * 2^attempt,
+    capped at settings.HTTP_BACKOFF_MAX. The randomness spreads out retries from many operators.
+    """
+    ceiling = min(settings.HTTP_BACKOFF_MAX, settings.HTTP_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+def _retry_delay(response, attempt: int) -> float:
+    """How long to wait before retrying: the server's 'Retry-After' if given (capped), otherwise jittered backoff."""
+    delay = _retry_after_seconds(response)
+    return min(delay, settings.HTTP_BACKOFF_MAX) if delay is not None else _backoff_delay(attempt)
+
+def _request_headers() -> dict:
+    """
+    The HTTP headers for every API call.
+    This tells the server who we are (API Key) and what we are sending (JSON).
+    """
+    return {
         "Authorization": f"Bearer {settings.API_KEY}",
         "Content-Type": "application/json"
     }
 
-    # 3. Build the Conversation History
+def post_with_retry(payload: dict, headers: dict, stream: bool = False):
+    """
+    POSTs the payload to the Qubrid endpoint through the shared session.
+
+    - Uses the connect/read timeouts from settings, so a hung upstream cannot block a thread forever.
+    - Retries 429/5xx responses and connection failures up to settings.HTTP_MAX_RETRIES times.
+    - Honors the server's 'Retry-After' header when it sends one (capped at HTTP_BACKOFF_MAX).
+
+    Read timeouts are NOT retried: the server may still be generating (and billing) that answer.
+    """
+    session = get_http_session()
+    timeout = (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
+    for attempt in range(settings.HTTP_MAX_RETRIES + 1):
+        is_last_attempt = attempt == settings.HTTP_MAX_RETRIES
+        try:
+            response = session.post(settings.API_URL, headers=headers, json=payload, stream=stream, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout):
+            metrics.observe_upstream_error("connection")
+            if is_last_attempt:
+                raise
+            time.sleep(_backoff_delay(attempt))
+            continue
+        except requests.exceptions.ReadTimeout:
+            metrics.observe_upstream_error("timeout")
+            raise
+
+        if response.status_code != 200:
+            metrics.observe_upstream_error(response.status_code)
+        if response.status_code not in RETRYABLE_STATUS_CODES or is_last_attempt:
+            return response
+
+        # Work out how long to wait, then release the connection back to the pool before sleeping
+        delay = _retry_delay(response, attempt)
+        response.close()
+        time.sleep(delay)
+
+def build_payload(
+    current_question: str,
+    image: Optional[PreparedImage],
+    chat_history: list,
+    system_prompt: str,
+    stream: bool = False
+) -> dict:
+    """
+    Builds the JSON body sent to the Qubrid chat endpoint.
+    Shared by the blocking and the streaming code paths so both send exactly the same conversation.
+
+    'image' is the output of backend.utils.prepare_image (already resized and Base64-encoded).
+    """
+    # 1. Build the Conversation History
     # Start with the "System Prompt" (The Guardrails & Identity)
     messages = [{"role": "system", "content": system_prompt}]
-    
+
     # Append all previous messages so the AI remembers the conversation context
     for msg in chat_history:
         messages.append({"role": msg["role"], "content": msg["content"]})
 
-    # 4. Add the User's Current Input (Text + Image)
+    # 2. Add the User's Current Input (Text + Image)
     # The 'user' message is a list that can contain both text and image parts
     user_content = [{"type": "text", "text": current_question}]
-    
-    # If an image file was provided, encode it to Base64 and add it
-    if image_file:
-        base64_img = encode_image_to_base64(image_file)
+
+    # If an image was provided, attach it with its real MIME type (JPEG, PNG or WebP)
+    if image:
         user_content.append({
-            "type": "image_url", 
-            "image_url": {"url": f"data:image/jpeg;base64,{base64_img}"}
+            "type": "image_url",
+            "image_url": {"url": image.data_url}
         })
 
     # Append this combined user message to the list
     messages.append({"role": "user", "content": user_content})
 
-    # 5. Construct the API Payload
+    # 3. Construct the API Payload
     # This dictionary matches the standard OpenAI/Qubrid API format
     payload = {
         "model": settings.MODEL_NAME, # Which AI brain to use (e.g., Qwen-VL-Max)
         "messages": messages,         # The full conversation thread
         "max_tokens": 2048,           # Limit the response length
         "temperature": 0.6,           # Creativity setting (0.6 is balanced)
-        "stream": False               # Wait for the full answer (no streaming)
+        "stream": stream              # True = receive the answer token-by-token (Server-Sent Events)
     }
 
+    # Ask the server to attach token usage to the final streamed chunk (OpenAI-compatible servers)
+    if stream:
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+def build_usage_metrics(
+    raw_usage: dict,
+    latency: float,
+    ttft: float = 0.0,
+    decode_time: float = 0.0,
+    image: Optional[PreparedImage] = None
+) -> UsageMetrics:
+    """
+    Converts the raw 'usage' block returned by the API into our UsageMetrics model.
+
+    Args:
+        raw_usage: The 'usage' dict from the API (prompt/completion/total tokens).
+        latency: End-to-end seconds from sending the request to the last byte.
+        ttft: Seconds until the first token arrived (streaming only).
+        decode_time: Seconds between the first and the last token (streaming only).
+        image: The prepared image that was sent, used to report payload size and bytes saved.
+    """
+    total_tokens = raw_usage.get('total_tokens', 0)
+    completion_tokens = raw_usage.get('completion_tokens', 0)
+
+    # Tokens per Second = Total Tokens / Time Taken
+    # We add a check (latency > 0) to avoid "Division by Zero" errors
+    tps = round(total_tokens / latency, 2) if latency > 0 else 0
+
+    # Decode speed only counts the generated tokens over the generation window,
+    # which is the number that reflects how fast the answer "types out" on screen.
+    decode_tps = round(completion_tokens / decode_time, 2) if decode_time > 0 else 0
+
+    return UsageMetrics(
+        prompt_tokens=raw_usage.get('prompt_tokens', 0),
+        completion_tokens=completion_tokens,
+        total_tokens=total_tokens,
+        latency=latency,
+        throughput=tps,
+        ttft=round(ttft, 2),
+        decode_tps=decode_tps,
+        image_bytes=image.prepared_bytes if image else 0,
+        image_bytes_saved=image.bytes_saved if image else 0,
+        model=settings.MODEL_NAME
+    )
+
+def iter_sse_events(response) -> Iterator[dict]:
+    """
+    Parses a Server-Sent-Events HTTP response into JSON chunks, one at a time.
+
+    The server sends lines like:
+        data: {"choices": [{"delta": {"content": "Hel"}}]}
+        data: [DONE]
+    Blank lines separate events and lines starting with ':' are keep-alive comments.
+    """
+    for raw_line in response.iter_lines(decode_unicode=True):
+        chunk = parse_sse_line(raw_line)
+        if chunk is SSE_DONE:
+            break
+        if chunk is not None:
+            yield chunk
+
+# Returned by parse_sse_line for the end-of-stream sentinel
+SSE_DONE = object()
+
+def parse_sse_line(raw_line: str):
+    """
+    Parses one line of a Server-Sent-Events stream.
+    Returns the JSON chunk (dict), SSE_DONE at the end of the stream, or None for lines to skip.
+    """
+    # Skip keep-alive blank lines and SSE comments
+    if not raw_line or raw_line.startswith(":"):
+        return None
+    if not raw_line.startswith("data:"):
+        return None
+
+    data = raw_line[len("data:"):].strip()
+    # The end-of-stream sentinel used by OpenAI-compatible servers
+    if data == "[DONE]":
+        return SSE_DONE
+    try:
+        return json.loads(data)
+    except json.JSONDecodeError:
+        return None  # Ignore partial or malformed chunks instead of killing the whole answer
+
+def extract_delta(chunk: dict) -> str:
+    """
+    Pulls the new piece of text out of a single streamed chunk.
+    Handles the same response formats as the blocking path ('choices' or plain 'content').
+    """
+    if chunk.get('choices'):
+        choice = chunk['choices'][0]
+        delta = choice.get('delta') or choice.get('message') or {}
+        return delta.get('content') or ""
+    return chunk.get('content') or ""
+
+def parse_completion(data: dict, latency: float, image: Optional[PreparedImage] = None) -> ChatResponse:
+    """
+    Converts a complete (non-streamed) JSON answer into a ChatResponse.
+    Shared by the synchronous and the asyncio clients.
+    """
+    # Extract the AI's text answer.
+    # Handles different API response formats (some nest it under 'choices', some under 'content')
+    if 'choices' in data:
+        content = data['choices'][0]['message']['content']
+    elif 'content' in data:
+        content = data['content']
+    else:
+        content = "Error: No content returned."
+
+    # Extract Token Usage Stats & Package the Metrics
+    # Defaults to 0 if the API doesn't send usage data
+    raw_usage = data.get("usage", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+    metrics = build_usage_metrics(raw_usage, latency, image=image)
+
+    # Returns a clean object containing the text answer and the metrics
+    return ChatResponse(content=content, usage=metrics)
+
+@timed()
+def chat_with_industrial_ai(
+    current_question: str,
+    image_file,
+    chat_history: list,
+    system_prompt: str,
+    on_token: Optional[Callable[[str], None]] = None,
+    cacheable: bool = False
+) -> ChatResponse:
+    """
+    Sends the user's question + image + history to the AI API and returns the answer.
+    Also calculates performance metrics like Latency and Tokens/Sec.
+
+    'image_file' may be an uploaded file, a path to a saved image, or a PreparedImage.
+
+    If 'on_token' is given, the answer is streamed: the callback is called with each new
+    piece of text as soon as it arrives, and TTFT / decode speed are recorded in the metrics.
+
+    If 'cacheable' is True (see backend.schemas.is_cacheable), an identical earlier request is
+    answered from the response cache (usage.cached=True) and new answers are stored in it.
+    """
+
+    # 1. Start the stopwatch to measure Latency
+    start_time = time.time()  # <--- Start Timer
+
+    # 2. Prepare the Request Headers
+    headers = _request_headers()
+
+    # 3. Build the payload (conversation + image + generation settings)
+    # The image is downscaled and re-encoded first, which cuts upload size and image tokens.
+    # The result is cached by content, so turns 2..N on the same image cost no encoding work.
+    # The history is trimmed to the token budget, so turn 30 sends about as much text as turn 3.
+    stream = on_token is not None
+    image = get_prepared_image(image_file) if image_file else None
+    window = fit_context(chat_history, system_prompt, current_question)
+    payload = build_payload(current_question, image, window.messages, window.system_prompt, stream=stream)
+
+    # 4. Response Cache
+    # Same image + prompts + history + question + settings = same key. A hit skips the model call entirely.
+    cache_key = _cache_key_for(payload, cacheable)
+    if cache_key:
+        cached = response_cache.lookup(cache_key)
+        if cached:
+            metrics.observe_cached(stream)
+            _replay(cached, on_token)
+            return _with_context_metrics(cached, window)
+
+    # 5-8. Cache miss: call the model, then remember the answer for next time
     try:
-        # 6. Send the POST Request
+        response = _send(payload, headers, start_time, stream, on_token, image)
+    except RuntimeError:
+        metrics.observe_failure(stream)
+        raise
+    metrics.observe_answer(response.usage, stream)
+    if cache_key:
+        response_cache.store(cache_key, response)
+    return _with_context_metrics(response, window)
+
+def _with_context_metrics(response: ChatResponse, window: ContextWindow) -> ChatResponse:
+    """Records what the context window left out, so truncation is visible next to the other metrics."""
+    response.usage.context_dropped = window.dropped_messages
+    response.usage.context_summarized = window.summarized
+    response.usage.context_tokens_est = window.estimated_tokens
+    return response
+
+def _cache_key_for(payload: dict, cacheable: bool) -> Optional[str]:
+    """The response cache key for this payload, or None if caching is off for this call."""
+    if cacheable and settings.RESPONSE_CACHE_ENABLED:
+        return response_cache.cache_key(payload)
+    return None
+
+def _replay(cached: ChatResponse, on_token: Optional[Callable[[str], None]]):
+    """Delivers a cached answer through the streaming callback in one piece, so the UI code path is the same."""
+    if on_token:
+        on_token(cached.content)
+
+def _send(payload: dict, headers: dict, start_time: float, stream: bool,
+          on_token: Optional[Callable[[str], None]], image: Optional[PreparedImage]) -> ChatResponse:
+    """Performs the actual API call for chat_with_industrial_ai (blocking or streaming)."""
+    try:
+        # 5. Send the POST Request
         # This is where the code waits for the server to reply
-        response = requests.post(settings.API_URL, headers=headers, json=payload)
-        
+        # (Shared keep-alive connection, with timeouts and automatic retry on 429/5xx)
+        response = post_with_retry(payload, headers, stream=stream)
+
+        # 6. Check for Errors
+        # If the server returned 400, 401, 500, etc., raise an error
+        if response.status_code != 200:
+            raise RuntimeError(f"API Error: {response.text}")
+
+        if stream:
+            return _consume_stream(response, start_time, on_token, image)
+
         # 7. Stop the stopwatch
         # Calculate how many seconds passed since step 1
         end_time = time.time()
         latency = round(end_time - start_time, 2)
         # -------------------------------
 
-        # 8. Check for Errors
-        # If the server returned 400, 401, 500, etc., raise an error
-        if response.status_code != 200:
-            raise RuntimeError(f"API Error: {response.text}")
+        # 8. Parse the JSON Response into the answer text + metrics
+        return parse_completion(response.json(), latency, image)
+
+    except Exception as e:
+        # If anything goes wrong (network fail, bad JSON), crash gracefully with a message
+        raise RuntimeError(f"Connection failed: {str(e)}")
+
+class _StreamAccumulator:
+    """
+    Collects a streamed answer chunk by chunk, forwarding text to 'on_token'
+    and timing the first and last tokens. Shared by the synchronous and the asyncio clients.
+    """
+
+    def __init__(self, start_time: float, on_token: Optional[Callable[[str], None]], image: Optional[PreparedImage]):
+        self.start_time = start_time
+        self.on_token = on_token
+        self.image = image
+        self.parts = []
+        self.raw_usage = None
+        self.first_token_time = None
+        self.chunk_count = 0
+
+    def feed(self, chunk: dict):
+        # The final chunk of an OpenAI-compatible stream carries the token usage
+        if chunk.get("usage"):
+            self.raw_usage = chunk["usage"]
+
+        delta = extract_delta(chunk)
+        if not delta:
+            return
+
+        # Time-To-First-Token: the moment the operator actually sees something happen
+        if self.first_token_time is None:
+            self.first_token_time = time.time()
+        self.chunk_count += 1
+        self.parts.append(delta)
+        if self.on_token:
+            self.on_token(delta)
+
+    def finish(self) -> ChatResponse:
+        end_time = time.time()
+        latency = round(end_time - self.start_time, 2)
+        content = "".join(self.parts) or "Error: No content returned."
 
-        # 9. Parse the JSON Response
-        data = response.json()
-        
-        # Extract the AI's text answer. 
-        # Handles different API response formats (some nest it under 'choices', some under 'content')
-        if 'choices' in data:
-            content = data['choices'][0]['message']['content']
-        elif 'content' in data:
-            content = data['content']
-        else:
-            content = "Error: No content returned."
-
-        # 10. Extract Token Usage Stats
-        # Defaults to 0 if the API doesn't send usage data
-        raw_usage = data.get("usage", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
-        total_tokens = raw_usage.get('total_tokens', 0)
-        
-        # 11. Calculate Throughput (Speed)
-        # Tokens per Second = Total Tokens / Time Taken
-        # We add a check (latency > 0) to avoid "Division by Zero" errors
-        tps = round(total_tokens / latency, 2) if latency > 0 else 0
-
-        # 12. Package the Metrics
-        # Store all the stats in the Pydantic model defined in schemas.py
-        metrics = UsageMetrics(
-            prompt_tokens=raw_usage.get('prompt_tokens', 0),
-            completion_tokens=raw_usage.get('completion_tokens', 0),
-            total_tokens=total_tokens,
-            latency=latency,
-            throughput=tps
-        )
-
-        # 13. Return the Final Result
-        # Returns a clean object containing the text answer and the metrics
+        # Some servers do not report usage when streaming.
+        # In that case each content chunk is roughly one token, which is a good enough estimate.
+        raw_usage = self.raw_usage
+        if not raw_usage:
+            raw_usage = {"prompt_tokens": 0, "completion_tokens": self.chunk_count, "total_tokens": self.chunk_count}
+
+        ttft = (self.first_token_time - self.start_time) if self.first_token_time else 0.0
+        decode_time = (end_time - self.first_token_time) if self.first_token_time else 0.0
+        metrics = build_usage_metrics(raw_usage, latency, ttft=ttft, decode_time=decode_time, image=self.image)
         return ChatResponse(content=content, usage=metrics)
 
+def _consume_stream(
+    response,
+    start_time: float,
+    on_token: Callable[[str], None],
+    image: Optional[PreparedImage] = None
+) -> ChatResponse:
+    """Reads a streaming (requests) response chunk by chunk into a ChatResponse."""
+    accumulator = _StreamAccumulator(start_time, on_token, image)
+    try:
+        for chunk in iter_sse_events(response):
+            accumulator.feed(chunk)
+    finally:
+        # Hand the keep-alive connection back to the pool (we may have stopped reading at [DONE]).
+        # If 'on_token' raised (a cancelled job), this drops the connection mid-answer, which
+        # aborts the request upstream.
+        response.close()
+    return accumulator.finish()
+
+# --- ASYNCIO CLIENT ---
+# An asyncio-native twin of chat_with_industrial_ai for running many analyses at once.
+# It shares the payload building, SSE parsing, retry policy and metrics code above,
+# but waits on the network with coroutines instead of one OS thread per request.
+
+def _new_async_client(max_connections: int) -> httpx.AsyncClient:
+    """Creates an httpx client with the same timeouts as the synchronous session."""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    )
+
+async def async_post_with_retry(client: httpx.AsyncClient, payload: dict, headers: dict, stream: bool = False) -> httpx.Response:
+    """The asyncio version of post_with_retry (same retry budget, backoff and Retry-After handling)."""
+    for attempt in range(settings.HTTP_MAX_RETRIES + 1):
+        is_last_attempt = attempt == settings.HTTP_MAX_RETRIES
+        try:
+            request = client.build_request("POST", settings.API_URL, headers=headers, json=payload)
+            response = await client.send(request, stream=stream)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            metrics.observe_upstream_error("connection")
+            if is_last_attempt:
+                raise
+            await asyncio.sleep(_backoff_delay(attempt))
+            continue
+        except httpx.ReadTimeout:
+            metrics.observe_upstream_error("timeout")
+            raise
+
+        if response.status_code != 200:
+            metrics.observe_upstream_error(response.status_code)
+        if response.status_code not in RETRYABLE_STATUS_CODES or is_last_attempt:
+            return response
+
+        delay = _retry_delay(response, attempt)
+        await response.aclose()
+        await asyncio.sleep(delay)
+
+async def async_chat_with_industrial_ai(
+    current_question: str,
+    image_file,
+    chat_history: list,
+    system_prompt: str,
+    on_token: Optional[Callable[[str], None]] = None,
+    client: Optional[httpx.AsyncClient] = None,
+    cacheable: bool = False
+) -> ChatResponse:
+    """
+    Asyncio counterpart of chat_with_industrial_ai (same arguments, same ChatResponse).
+
+    'client' lets many calls share one connection pool (see chat_many_async); if omitted,
+    a short-lived client is created for this call.
+    """
+    if client is None:
+        async with _new_async_client(1) as own_client:
+            return await async_chat_with_industrial_ai(
+                current_question, image_file, chat_history, system_prompt, on_token, own_client, cacheable
+            )
+
+    start_time = time.time()
+    headers = _request_headers()
+    stream = on_token is not None
+
+    # Image preparation is CPU work (Pillow), so it runs in a worker thread to keep the event loop free
+    image = await asyncio.to_thread(get_prepared_image, image_file) if image_file else None
+    window = fit_context(chat_history, system_prompt, current_question)
+    payload = build_payload(current_question, image, window.messages, window.system_prompt, stream=stream)
+
+    # The cache lives in SQLite, so lookups and stores also run in a worker thread
+    cache_key = _cache_key_for(payload, cacheable)
+    if cache_key:
+        cached = await asyncio.to_thread(response_cache.lookup, cache_key)
+        if cached:
+            metrics.observe_cached(stream)
+            _replay(cached, on_token)
+            return _with_context_metrics(cached, window)
+
+    try:
+        response = await _async_send(client, payload, headers, start_time, stream, on_token, image)
+    except RuntimeError:
+        metrics.observe_failure(stream)
+        raise
+    metrics.observe_answer(response.usage, stream)
+    if cache_key:
+        await asyncio.to_thread(response_cache.store, cache_key, response)
+    return _with_context_metrics(response, window)
+
+async def _async_send(client: httpx.AsyncClient, payload: dict, headers: dict, start_time: float, stream: bool,
+                      on_token: Optional[Callable[[str], None]], image: Optional[PreparedImage]) -> ChatResponse:
+    """Performs the actual API call for async_chat_with_industrial_ai (blocking or streaming)."""
+    try:
+        response = await async_post_with_retry(client, payload, headers, stream=stream)
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                raise RuntimeError(f"API Error: {response.text}")
+
+            if stream:
+                accumulator = _StreamAccumulator(start_time, on_token, image)
+                async for raw_line in response.aiter_lines():
+                    chunk = parse_sse_line(raw_line)
+                    if chunk is SSE_DONE:
+                        break
+                    if chunk is not None:
+                        accumulator.feed(chunk)
+                return accumulator.finish()
+
+            await response.aread()
+            latency = round(time.time() - start_time, 2)
+            return parse_completion(response.json(), latency, image)
+        finally:
+            await response.aclose()
+
     except Exception as e:
-        # If anything goes wrong (network fail, bad JSON), crash gracefully with a message
-        raise RuntimeError(f"Connection failed: {str(e)}")
\ No newline at end of file
+        # Same error contract as the synchronous client
+        raise RuntimeError(f"Connection failed: {str(e)}")
+
+async def chat_many_async(requests_list: List[ChatRequest], concurrency: int = 8) -> List[Union[ChatResponse, Exception]]:
+    """
+    Runs many analyses concurrently, with at most 'concurrency' requests in flight.
+
+    Returns one entry per request, in the same order as 'requests_list'. Each entry is either the
+    ChatResponse or the Exception that request raised, so one failure never cancels the others
+    (like asyncio.gather(..., return_exceptions=True)).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with _new_async_client(concurrency) as client:
+        async def run_one(req: ChatRequest):
+            async with semaphore:
+                return await async_chat_with_industrial_ai(
+                    req.current_question, req.image_file, req.chat_history, req.system_prompt,
+                    on_token=req.on_token, client=client, cacheable=req.cacheable
+                )
+
+        return await asyncio.gather(*(run_one(r) for r in requests_list), return_exceptions=True)
+
+def chat_many(requests_list: List[ChatRequest], concurrency: int = 8) -> List[Union[ChatResponse, Exception]]:
+    """
+    Synchronous wrapper around chat_many_async, for callers without an event loop
+    (Streamlit scripts, the batch CLI). Runs the whole fan-out on a fresh event loop.
+    """
+    return asyncio.run(chat_many_async(requests_list, concurrency))
@@ -0,0 +1,270 @@
+import argparse  # Command line interface (python -m backend.batch ...)
+import io  # Wraps raw image bytes in a file-like object for the API client
+import os  # Folder walking and file paths
+import threading  # Locks for the rate limiter and the shared progress counters
+import time  # Timing (elapsed time, throughput, rate limiting)
+import uuid  # A new Session ID per analyzed image
+import zipfile  # Reading QA lots delivered as ZIP archives
+from concurrent.futures import ThreadPoolExecutor, as_completed  # Bounded-concurrency fan-out
+from typing import Callable, List, Optional, Tuple  # Type hinting
+from config.settings import settings  # Concurrency, rate limit and flush size defaults
+from backend.api_client import chat_with_industrial_ai  # The single-image analysis call
+from backend.database import init_db, save_batch_results, release_images  # Bulk persistence (+ undoing a failed group's image references)
+from backend.image_store import store_image  # Deduplicated image files + thumbnails
+from backend.schemas import PROMPTS, BatchItemResult, BatchProgress, build_system_prompt, is_cacheable, wants_structured_output
+from backend.defects import extract_defect_report  # Structured defect rows from Defect Inspection answers
+
+# The question asked for every image in a batch (the same "analyze this" operators type by hand)
+BATCH_QUESTION = "Analyze this component according to the protocol."
+
+# File types accepted in folders and ZIP archives (same as the single-image uploader)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+class RateLimiter:
+    """
+    Spaces out request starts so no more than 'rate' requests begin per second.
+
+    Why this is needed:
+    Concurrency alone caps how many calls are in flight, but a burst of fast answers can still
+    start dozens of requests in one second and trip the provider's 429 rate limit.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Blocks until this caller's slot comes up."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def load_images_from_folder(folder: str) -> List[Tuple[str, bytes]]:
+    """Reads every image in a folder (recursively). Returns (relative name, bytes) pairs, sorted by name."""
+    images = []
+    for root, _, files in os.walk(folder):
+        for file_name in files:
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(root, file_name)
+                with open(path, "rb") as f:
+                    images.append((os.path.relpath(path, folder), f.read()))
+    return sorted(images)
+
+def load_images_from_zip(zip_source) -> List[Tuple[str, bytes]]:
+    """
+    Reads every image inside a ZIP archive.
+    'zip_source' can be a path or a file-like object (e.g., a Streamlit UploadedFile).
+    """
+    images = []
+    with zipfile.ZipFile(zip_source) as archive:
+        for info in archive.infolist():
+            # Skip folders and macOS metadata files like '__MACOSX/._photo.jpg'
+            base_name = os.path.basename(info.filename)
+            if info.is_dir() or base_name.startswith("._"):
+                continue
+            if info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                images.append((info.filename, archive.read(info)))
+    return sorted(images)
+
+def load_images(source: str) -> List[Tuple[str, bytes]]:
+    """Loads a lot from either a folder or a .zip file path."""
+    if os.path.isdir(source):
+        return load_images_from_folder(source)
+    return load_images_from_zip(source)
+
+def _analyze_one(name: str, data: bytes, system_prompt: str, question: str,
+                 limiter: RateLimiter, assets_dir: str, cacheable: bool = False) -> BatchItemResult:
+    """Analyzes a single image. Errors are captured in the result instead of stopping the batch."""
+    session_id = str(uuid.uuid4())
+    try:
+        limiter.wait()
+        response = chat_with_industrial_ai(
+            current_question=question,
+            image_file=io.BytesIO(data),
+            chat_history=[],
+            system_prompt=system_prompt,
+            cacheable=cacheable  # Re-running a lot only pays for images that were not analyzed before
+        )
+        # Stored in the image store like interactive uploads (duplicates in a lot share one file)
+        stored = store_image(data, assets_dir)
+        return BatchItemResult(name=name, session_id=session_id, image_path=stored.path, image=stored,
+                               content=response.content, usage=response.usage)
+    except Exception as e:
+        return BatchItemResult(name=name, error=str(e))
+
+def run_batch(
+    images: List[Tuple[str, bytes]],
+    protocol: str,
+    user_requirements: str = "",
+    question: str = BATCH_QUESTION,
+    concurrency: int = None,
+    rate_limit: float = None,
+    flush_size: int = None,
+    assets_dir: str = None,
+    on_progress: Optional[Callable[[BatchProgress], None]] = None
+) -> List[BatchItemResult]:
+    """
+    Analyzes a whole lot of images under one protocol from backend.schemas.PROMPTS.
+
+    - Up to 'concurrency' images are analyzed at the same time (thread pool).
+    - No more than 'rate_limit' requests are started per second.
+    - Successful results are written to SQLite in groups of 'flush_size' (one transaction each),
+      each image becoming its own inspection session in the archive. If a group cannot be saved,
+      its images are reported as failed and the rest of the lot carries on.
+    - 'on_progress' is called after every finished image with a BatchProgress snapshot.
+
+    Returns one BatchItemResult per input image, in the original order.
+    """
+    if protocol not in PROMPTS:
+        raise ValueError(f"Unknown protocol: {protocol}")
+
+    concurrency = concurrency or settings.BATCH_CONCURRENCY
+    rate_limit = settings.BATCH_RATE_LIMIT if rate_limit is None else rate_limit
+    flush_size = flush_size or settings.BATCH_FLUSH_SIZE
+    assets_dir = assets_dir or settings.ASSETS_DIR
+    os.makedirs(assets_dir, exist_ok=True)
+    init_db()
+
+    system_prompt = build_system_prompt(PROMPTS[protocol], user_requirements, structured=wants_structured_output(protocol))
+    limiter = RateLimiter(rate_limit)
+    progress = BatchProgress(total=len(images))
+    results: List[Optional[BatchItemResult]] = [None] * len(images)
+    pending_records = []  # (index in 'images', record) pairs waiting for the next flush
+    started = time.time()
+
+    def flush():
+        group = list(pending_records)
+        pending_records.clear()
+        try:
+            save_batch_results([record for _, record in group])
+        except Exception as e:
+            # The group was rolled back: give back the image references store_image took for it and
+            # report its images as failed, instead of losing every result still to come
+            try:
+                release_images([record["image_path"] for _, record in group if record.get("image_hash")])
+            except Exception:
+                pass  # A reference left behind only keeps a file on disk
+            for index, _ in group:
+                results[index] = BatchItemResult(name=results[index].name, error=f"The result could not be saved: {e}")
+            progress.completed -= len(group)
+            progress.failed += len(group)
+            if on_progress:
+                on_progress(progress.model_copy())
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(_analyze_one, name, data, system_prompt, question, limiter, assets_dir,
+                            is_cacheable(protocol)): index
+            for index, (name, data) in enumerate(images)
+        }
+        # as_completed hands results back on this (the calling) thread, so the counters,
+        # the pending list and the SQLite writes below need no extra locking.
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+
+            if result.error:
+                progress.failed += 1
+            else:
+                progress.completed += 1
+                answer, defect_report = result.content, None
+                if wants_structured_output(protocol):
+                    answer, defect_report = extract_defect_report(result.content)
+                pending_records.append((futures[future], {
+                    "session_id": result.session_id,
+                    "title": f"[BATCH] {os.path.basename(result.name)}"[:60],
+                    "image_path": result.image_path,
+                    "image_hash": result.image.hash,
+                    "mode": protocol,
+                    "question": question,
+                    "answer": answer,
+                    "usage": result.usage.model_dump() if result.usage else None,
+                    "defect_report": defect_report.model_dump() if defect_report else None,
+                }))
+                if len(pending_records) >= flush_size:
+                    flush()
+
+            progress.elapsed = round(time.time() - started, 2)
+            progress.throughput = round(progress.done / progress.elapsed * 60, 1) if progress.elapsed > 0 else 0.0
+            if on_progress:
+                on_progress(progress.model_copy())
+
+    flush()  # Write whatever is left over
+    return results
+
+class BatchRun:
+    """A run_batch call on a background thread: the latest progress, then the results (or the error)."""
+
+    def __init__(self, total: int):
+        self.progress = BatchProgress(total=total)  # Replaced by a fresh snapshot after every image
+        self.results: Optional[List[BatchItemResult]] = None
+        self.error: Optional[str] = None
+        self.finished = threading.Event()
+
+def start_batch(images: List[Tuple[str, bytes]], protocol: str, **options) -> BatchRun:
+    """
+    Starts run_batch (same arguments, except 'on_progress') on a background thread and returns at once,
+    so a UI can keep redrawing while the lot is analyzed. Poll the returned BatchRun for progress.
+    """
+    run = BatchRun(len(images))
+
+    def update(progress: BatchProgress):
+        run.progress = progress
+
+    def work():
+        try:
+            run.results = run_batch(images, protocol, on_progress=update, **options)
+        except Exception as e:
+            run.error = str(e)
+        finally:
+            run.finished.set()
+
+    threading.Thread(target=work, name="batch", daemon=True).start()
+    return run
+
+def main():
+    """
+    Command line entry point.
+
+    Example:
+        python -m backend.batch lot_42.zip --protocol "Defect Inspection" --concurrency 8 --rate 4
+    """
+    parser = argparse.ArgumentParser(description="DiagnostiQ batch inspection")
+    parser.add_argument("source", help="Folder or .zip file of component images")
+    parser.add_argument("--protocol", default="Defect Inspection", choices=list(PROMPTS.keys()))
+    parser.add_argument("--instructions", default="", help="Additional operator instructions")
+    parser.add_argument("--question", default=BATCH_QUESTION)
+    parser.add_argument("--concurrency", type=int, default=settings.BATCH_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=settings.BATCH_RATE_LIMIT, help="Max requests started per second")
+    args = parser.parse_args()
+
+    images = load_images(args.source)
+    print(f"Loaded {len(images)} images from {args.source}")
+
+    def print_progress(p: BatchProgress):
+        print(f"\r{p.done}/{p.total} done | {p.failed} failed | {p.throughput} img/min", end="", flush=True)
+
+    results = run_batch(
+        images,
+        args.protocol,
+        user_requirements=args.instructions,
+        question=args.question,
+        concurrency=args.concurrency,
+        rate_limit=args.rate,
+        on_progress=print_progress
+    )
+    print()
+    for r in results:
+        if r.error:
+            print(f"FAILED {r.name}: {r.error}")
+    failed = sum(1 for r in results if r.error)
+    print(f"Finished: {len(results) - failed} succeeded, {failed} failed")
+
+if __name__ == "__main__":
+    main()
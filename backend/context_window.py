@@ -0,0 +1,118 @@
+import math  # Rounding token estimates up
+from functools import lru_cache  # Caches the one-line summary of each dropped message
+from typing import List, Dict  # Type hinting
+from config.settings import settings  # Token budget and how many recent messages are always kept
+from backend.schemas import ContextWindow  # The trimmed conversation returned to the API client
+
+# Rough characters-per-token ratio for English text with the Qwen tokenizer.
+# An estimate is enough here: the budget only has to keep the prompt size roughly constant.
+CHARS_PER_TOKEN = 4
+# Chat formatting overhead per message (role markers, separators)
+TOKENS_PER_MESSAGE = 4
+
+# Heading of the summary block appended to the system prompt
+SUMMARY_HEADER = "EARLIER IN THIS INSPECTION (summary of older messages):"
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a piece of text (no tokenizer download needed)."""
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN) + TOKENS_PER_MESSAGE
+
+@lru_cache(maxsize=1024)
+def summarize_message(role: str, content: str) -> str:
+    """
+    One summary line for an old message.
+    - Operator questions are kept (shortened).
+    - AI answers keep their Markdown headings and status lines (e.g. "## QA Status: FAIL"),
+      which carry the verdicts later questions usually refer back to.
+    Cached, so each message is summarized once no matter how many later turns drop it again.
+    """
+    text = " ".join((content or "").split())
+    if role == "user":
+        return f"- Operator asked: {text[:150]}"
+
+    key_lines = []
+    for line in (content or "").splitlines():
+        line = line.strip()
+        if line.startswith("#") or "status" in line.lower():
+            key_lines.append(line.lstrip("# ").strip())
+        if len(key_lines) == 3:
+            break
+    gist = " | ".join(key_lines) if key_lines else text[:150]
+    return f"- AI reported: {gist[:200]}"
+
+def build_rolling_summary(dropped: List[Dict], max_tokens: int) -> str:
+    """
+    Joins the summary lines of the dropped messages, keeping the most recent ones
+    when everything does not fit in 'max_tokens'.
+    """
+    lines = []
+    used = estimate_tokens(SUMMARY_HEADER)
+    for msg in reversed(dropped):
+        line = summarize_message(msg["role"], msg["content"])
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return ""
+    return SUMMARY_HEADER + "\n" + "\n".join(reversed(lines))
+
+def fit_context(
+    chat_history: List[Dict],
+    system_prompt: str,
+    current_question: str,
+    budget: int = None,
+    keep_recent: int = None,
+    summary_tokens: int = None
+) -> ContextWindow:
+    """
+    Trims the conversation so the text part of the prompt stays within 'budget' tokens.
+
+    Always kept: the system prompt (persona + guardrails + operator instructions), the current
+    question and the last 'keep_recent' messages. Older messages are added back newest-first while
+    they fit; whatever does not fit is replaced by a short rolling summary in the system prompt.
+
+    Without this, every turn re-sends the whole inspection, so prompt tokens (and latency) grow
+    with each question until the model's context limit is hit.
+    """
+    budget = budget or settings.CONTEXT_TOKEN_BUDGET
+    keep_recent = settings.CONTEXT_KEEP_MESSAGES if keep_recent is None else keep_recent
+    summary_tokens = settings.CONTEXT_SUMMARY_TOKENS if summary_tokens is None else summary_tokens
+
+    history = [{"role": m["role"], "content": m["content"]} for m in chat_history]
+    fixed = estimate_tokens(system_prompt) + estimate_tokens(current_question)
+    costs = [estimate_tokens(m["content"]) for m in history]
+
+    # 1. Fast path: everything fits
+    if fixed + sum(costs) <= budget:
+        return ContextWindow(system_prompt=system_prompt, messages=history, estimated_tokens=fixed + sum(costs))
+
+    # 2. Walk back from the newest message, reserving room for the summary
+    available = budget - fixed - summary_tokens
+    start = len(history)
+    used = 0
+    while start > 0:
+        cost = costs[start - 1]
+        is_protected = len(history) - start < keep_recent
+        if not is_protected and used + cost > available:
+            break
+        used += cost
+        start -= 1
+
+    # 3. Never start the kept history on an AI answer whose question was dropped
+    while start < len(history) and history[start]["role"] == "assistant" and len(history) - start > keep_recent:
+        used -= costs[start]
+        start += 1
+
+    dropped, kept = history[:start], history[start:]
+    summary = build_rolling_summary(dropped, summary_tokens) if dropped else ""
+    final_prompt = f"{system_prompt}\n\n{summary}" if summary else system_prompt
+
+    return ContextWindow(
+        system_prompt=final_prompt,
+        messages=kept,
+        dropped_messages=len(dropped),
+        summarized=bool(summary),
+        estimated_tokens=fixed + used + (estimate_tokens(summary) if summary else 0)
+    )
@@ -1,21 +1,129 @@
 import sqlite3  # Standard library for interacting with SQLite databases
+import atexit  # Commits queued writes when the process exits
 import json  # Used to serialize dictionaries (like usage metrics) into text strings for storage
 import os  # Used to check if files exist and remove them (for deleting images)
+import queue  # Thread-safe queue used as the pool of idle connections
+import re  # Splits search text into words for the full-text query
+import threading  # Protects the creation of the connection pool (and runs the write-behind writer)
+import time  # How old the last data_version check is
+from concurrent.futures import Future  # Durability acknowledgement of a queued write
+from contextlib import contextmanager  # Lets get_connection() be used in a 'with' block
 from datetime import datetime  # Used for timestamping (though SQLite handles defaults automatically)
-from typing import List, Dict, Any  # Type hinting for better code readability
+from typing import Any, Callable, Dict, List  # Type hinting for better code readability
+from backend.timing import timed  # Per-call latency histograms (debug panel)
 
 # The filename of the local SQLite database. It will be created in the root directory.
 DB_NAME = "apex_industrial.db"
 
-def init_db():
+# How many idle connections are kept open for reuse (extra ones are opened on bursts and then closed).
+DB_POOL_SIZE = 8
+# How long (milliseconds) a writer waits for another writer's lock before failing with "database is locked".
+DB_BUSY_TIMEOUT_MS = 5000
+# How many compiled SQL statements each connection keeps (prepared-statement reuse).
+DB_STATEMENT_CACHE = 128
+
+def _open_connection(db_name: str) -> sqlite3.Connection:
     """
-    Initializes the database.
-    This function runs on app startup. It creates the necessary tables ('sessions' and 'messages')
-    if they do not already exist. This ensures the app doesn't crash on a fresh install.
+    Opens and tunes a new SQLite connection.
+
+    - WAL journal mode: readers no longer block the writer (and vice versa), which removes most
+      "database is locked" errors when several operators use the app at once.
+    - synchronous=NORMAL: safe with WAL, and avoids an fsync on every single commit.
+    - busy_timeout: wait for a lock instead of failing immediately.
+    """
+    conn = sqlite3.connect(
+        db_name,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,  # Connections are handed between Streamlit threads by the pool
+        cached_statements=DB_STATEMENT_CACHE
+    )
+    conn.row_factory = sqlite3.Row  # Allows accessing columns by name (row['title'])
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    return conn
+
+class ConnectionPool:
+    """
+    A small pool of open SQLite connections.
+
+    Why this is needed:
+    Opening a connection (and setting it up) on every function call is slow, and a single
+    Streamlit rerun calls several database functions. Reusing open connections also keeps
+    SQLite's compiled-statement cache warm, so repeated queries skip the SQL parser.
+    """
+
+    def __init__(self, db_name: str, size: int):
+        self.db_name = db_name
+        self._idle = queue.LifoQueue(maxsize=size)  # LIFO: the most recently used (warmest) connection first
+
+    def acquire(self) -> sqlite3.Connection:
+        """Takes an idle connection, or opens a new one if none is free (never blocks)."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return _open_connection(self.db_name)
+
+    def release(self, conn: sqlite3.Connection):
+        """Returns a connection to the pool, closing it if the pool is already full."""
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        """Closes every idle connection (used when DB_NAME changes)."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ConnectionPool:
+    """Returns the process-wide pool, rebuilding it if DB_NAME was changed (e.g., by a benchmark)."""
+    global _pool
+    if _pool is None or _pool.db_name != DB_NAME:
+        with _pool_lock:
+            if _pool is None or _pool.db_name != DB_NAME:
+                if _pool is not None:
+                    _pool.close_all()
+                    _reset_read_caches()  # Cached rows belong to the previous file
+                _pool = ConnectionPool(DB_NAME, DB_POOL_SIZE)
+    return _pool
+
+@contextmanager
+def get_connection():
+    """
+    Borrows a pooled connection for the duration of a 'with' block.
+    Commits if the block succeeds, rolls back if it raises, and always returns the connection to the pool.
+
+    Usage:
+        with get_connection() as conn:
+            conn.execute("UPDATE ...")
     """
-    conn = sqlite3.connect(DB_NAME)  # Connect to the file (creates it if missing)
-    c = conn.cursor()  # A cursor allows us to execute SQL commands
-    
+    pool = _get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+# --- SCHEMA MIGRATIONS ---
+# The database stores its schema version in SQLite's built-in 'PRAGMA user_version' (0 on a fresh file).
+# Each function below upgrades the schema by exactly one version, and MIGRATIONS lists them in order:
+# MIGRATIONS[0] takes the database from version 0 to 1, MIGRATIONS[1] from 1 to 2, and so on.
+# To change the schema, append a new function to the list. Never edit or reorder existing ones,
+# because databases in the field have already applied them.
+
+def _migration_base_tables(c):
+    """v1: Creates the 'sessions' and 'messages' tables (IF NOT EXISTS, so pre-versioning databases are adopted)."""
     # Table 1: Sessions
     # This table stores the high-level metadata for each chat session.
     # - id: The unique UUID string.
@@ -31,7 +139,7 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    
+
     # Table 2: Messages
     # This table stores the actual conversation history.
     # - session_id: Links the message to a specific session in the table above (Foreign Key).
@@ -49,182 +157,1311 @@ def init_db():
             FOREIGN KEY(session_id) REFERENCES sessions(id)
         )
     ''')
-    conn.commit()  # Save changes
-    conn.close()   # Close connection
+
+def _migration_session_mode(c):
+    """v2: Adds the 'mode' column to sessions tables created by very old versions of the app."""
+    if not _column_exists(c, "sessions", "mode"):
+        c.execute("ALTER TABLE sessions ADD COLUMN mode TEXT DEFAULT 'General Analysis'")
+
+def _migration_archive_indexes(c):
+    """
+    v3: Indexes for the archive and history queries.
+    - messages(session_id, id): finds a session's messages without scanning the whole table,
+      already sorted by id for get_session_history, and makes the EXISTS check in get_all_sessions instant.
+    - sessions(created_at, id): lets the archive list be read newest-first, one page at a time.
+    """
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions(created_at, id)")
+
+def _migration_response_cache(c):
+    """
+    v4: Table for the persistent AI response cache (see backend/response_cache.py).
+    - key: SHA-256 of everything that determines the answer (image, model, prompts, history, params).
+    - created_at / last_hit_at: Unix timestamps used for TTL expiry and least-recently-used eviction.
+    - size_bytes: approximate storage cost of the row, used for size-based eviction.
+    """
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            content TEXT,
+            usage_data TEXT,
+            created_at REAL,
+            last_hit_at REAL,
+            hits INTEGER DEFAULT 0,
+            size_bytes INTEGER
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_last_hit ON response_cache(last_hit_at)")
+
+def _migration_image_store(c):
+    """
+    v5: Registry of the content-addressed image store (see backend/image_store.py).
+    - hash: SHA-256 of the image bytes (the file is named after it, so identical photos are stored once).
+    - path / thumb_path: the full image and its display-size thumbnail.
+    - refcount: how many sessions point at this image; the files are deleted when it drops to 0.
+    Images saved before the store existed stay where they are and are not listed here.
+    """
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS images (
+            hash TEXT PRIMARY KEY,
+            path TEXT UNIQUE,
+            thumb_path TEXT,
+            size_bytes INTEGER,
+            refcount INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _migration_defects(c):
+    """
+    v6: Structured results of Defect Inspection answers (see backend/defects.py).
+    - defect_reports: one row per analyzed answer (message) with its QA verdict (PASS / FAIL).
+    - defects: one row per line of the answer's Defect Log table.
+    Indexed by severity, zone and date so fleet-wide questions ("Critical anomalies on dies this month")
+    are answered from these small tables instead of re-reading every message.
+    """
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS defect_reports (
+            message_id INTEGER PRIMARY KEY,
+            session_id TEXT,
+            qa_status TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(message_id) REFERENCES messages(id)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS defects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER,
+            session_id TEXT,
+            zone TEXT,
+            anomaly TEXT,
+            severity TEXT,
+            rejection_criteria TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(message_id) REFERENCES defect_reports(message_id)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_defect_reports_status ON defect_reports(qa_status, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_defect_reports_session ON defect_reports(session_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_defects_severity ON defects(severity, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_defects_zone ON defects(zone COLLATE NOCASE, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_defects_created_at ON defects(created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_defects_session ON defects(session_id)")
+
+def _migration_search_index(c):
+    """
+    v7: SQLite FTS5 full-text index over message content and session titles (see search_sessions).
+    - messages_fts reads the text straight from 'messages' (external content, no second copy of every answer).
+      The prefix indexes make search-as-you-type queries ("corr*") as fast as whole words.
+    - sessions_fts holds the titles, keyed by session id.
+    Triggers keep both in sync on every insert/update/delete, so add_message, update_session_title,
+    save_batch_results and delete_session need no extra code. Existing rows are indexed once here.
+    """
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='id', tokenize='porter unicode61', prefix='2 3')")
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS sessions_fts USING fts5(session_id UNINDEXED, title, tokenize='porter unicode61')")
+
+    # (One execute per trigger: executescript() would commit the migration's transaction early)
+    triggers = [
+        '''CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+        END;''',
+        '''CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END;''',
+        '''CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+        END;''',
+        '''CREATE TRIGGER IF NOT EXISTS sessions_fts_insert AFTER INSERT ON sessions BEGIN
+            INSERT INTO sessions_fts(session_id, title) VALUES (new.id, new.title);
+        END;''',
+        '''CREATE TRIGGER IF NOT EXISTS sessions_fts_delete AFTER DELETE ON sessions BEGIN
+            DELETE FROM sessions_fts WHERE session_id = old.id;
+        END;''',
+        '''CREATE TRIGGER IF NOT EXISTS sessions_fts_update AFTER UPDATE OF title ON sessions BEGIN
+            DELETE FROM sessions_fts WHERE session_id = old.id;
+            INSERT INTO sessions_fts(session_id, title) VALUES (new.id, new.title);
+        END;''',
+    ]
+    for trigger in triggers:
+        c.execute(trigger)
+
+    # Index everything written before this version
+    c.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+    c.execute("DELETE FROM sessions_fts")
+    c.execute("INSERT INTO sessions_fts(session_id, title) SELECT id, title FROM sessions")
+
+# The performance numbers of an AI answer (backend.schemas.UsageMetrics), stored one typed column each
+# in 'message_metrics' (name, SQL type). A new UsageMetrics field needs a new migration adding its column here.
+METRIC_COLUMNS = [
+    ("prompt_tokens", "INTEGER"),
+    ("completion_tokens", "INTEGER"),
+    ("total_tokens", "INTEGER"),
+    ("latency", "REAL"),
+    ("throughput", "REAL"),
+    ("ttft", "REAL"),
+    ("decode_tps", "REAL"),
+    ("image_bytes", "INTEGER"),
+    ("image_bytes_saved", "INTEGER"),
+    ("cached", "INTEGER"),
+    ("context_dropped", "INTEGER"),
+    ("context_summarized", "INTEGER"),
+    ("context_tokens_est", "INTEGER"),
+    ("model", "TEXT"),
+]
+# Columns holding True/False (SQLite stores them as 0/1)
+BOOLEAN_METRICS = {"cached", "context_summarized"}
+
+def _migration_message_metrics(c):
+    """
+    v8: Typed metrics table, one row per AI answer (replaces the JSON text in messages.usage_data).
+    With real columns, percentiles and averages are computed by SQLite (see get_performance_stats)
+    instead of loading and json-parsing every message in Python.
+    - protocol: the session's mode when the answer was saved, so stats stay correct if the mode changes later.
+    Existing usage_data JSON is copied over with SQLite's json_extract (the old column is left as it was).
+    Flags older JSON does not have (e.g. 'cached') are copied as 0, like a new answer's False.
+    """
+    columns = ",\n".join(f"            {name} {sql_type}" for name, sql_type in METRIC_COLUMNS)
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS message_metrics (
+            message_id INTEGER PRIMARY KEY,
+            session_id TEXT,
+            protocol TEXT,
+{columns},
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(message_id) REFERENCES messages(id)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_message_metrics_created_at ON message_metrics(created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_message_metrics_protocol ON message_metrics(protocol, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_message_metrics_session ON message_metrics(session_id)")
+
+    names = [name for name, _ in METRIC_COLUMNS]
+    extracts = ", ".join(
+        f"COALESCE(json_extract(m.usage_data, '$.{name}'), 0)" if name in BOOLEAN_METRICS
+        else f"json_extract(m.usage_data, '$.{name}')"
+        for name in names
+    )
+    c.execute(f'''
+        INSERT OR IGNORE INTO message_metrics (message_id, session_id, protocol, {", ".join(names)}, created_at)
+        SELECT m.id, m.session_id, s.mode, {extracts}, m.timestamp
+        FROM messages m LEFT JOIN sessions s ON s.id = m.session_id
+        WHERE m.usage_data IS NOT NULL AND json_valid(m.usage_data)
+    ''')
+
+def _migration_jobs(c):
+    """
+    v9: Creates the 'jobs' table for background analyses (backend/jobs.py).
+
+    One row per analysis: its status (queued, running, done, failed, cancelled), the question,
+    and, once saved, the ids of the question/answer messages. 'owner' is the host:pid of the
+    app process running it, so a restarted process can tell its own interrupted jobs apart
+    from jobs other processes on the same database are still running.
+    """
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            session_id TEXT,
+            question TEXT,
+            protocol TEXT,
+            status TEXT,
+            error TEXT,
+            owner TEXT,
+            question_message_id INTEGER,
+            answer_message_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs(session_id, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+
+def _migration_metric_flags(c):
+    """
+    v10: Sets the True/False metrics (BOOLEAN_METRICS) that v8 copied as NULL to 0.
+    Usage JSON saved before those flags existed has no 'cached' key, and get_performance_stats
+    keeps only 'cached = 0' rows, so databases migrated by the first v8 showed no history at all.
+    """
+    for name in sorted(BOOLEAN_METRICS):
+        c.execute(f"UPDATE message_metrics SET {name} = 0 WHERE {name} IS NULL")
+
+MIGRATIONS = [
+    _migration_base_tables,     # -> v1
+    _migration_session_mode,    # -> v2
+    _migration_archive_indexes, # -> v3
+    _migration_response_cache,  # -> v4
+    _migration_image_store,     # -> v5
+    _migration_defects,         # -> v6
+    _migration_search_index,    # -> v7
+    _migration_message_metrics, # -> v8
+    _migration_jobs,            # -> v9
+    _migration_metric_flags,    # -> v10
+]
+
+def _column_exists(c, table: str, column: str) -> bool:
+    """Checks whether a table already has a column (used to make ALTER TABLE migrations safe)."""
+    return any(row[1] == column for row in c.execute(f"PRAGMA table_info({table})"))
+
+def get_schema_version() -> int:
+    """Returns the schema version currently stored in the database file."""
+    with get_connection() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations():
+    """
+    Applies every pending migration, one transaction per version.
+
+    'BEGIN IMMEDIATE' takes the write lock before the version is re-read, so if several
+    app processes start at the same time, only one of them applies each migration and
+    the others simply see the new version and skip it. If a migration fails, its
+    transaction is rolled back and the database stays at the previous version.
+    """
+    with get_connection() as conn:
+        for target_version, migration in enumerate(MIGRATIONS, start=1):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if current_version >= target_version:
+                    conn.rollback()  # Already applied (by us earlier, or by another process)
+                    continue
+                migration(conn.cursor())
+                # PRAGMA does not accept '?' parameters; target_version is our own integer
+                conn.execute(f"PRAGMA user_version = {target_version}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            _reset_read_caches()  # A migration may rewrite rows a cached read already holds
+
+# Which database file has already been migrated by this process.
+# Lets init_db() return instantly on every Streamlit rerun after the first one.
+_schema_ready_for = None
+_schema_lock = threading.Lock()
+
+@timed()
+def init_db():
+    """
+    Initializes the database.
+    This function runs on app startup (and is called on every rerun). The first call in
+    each process brings the schema up to date through run_migrations(); every later call
+    is a no-op that costs nothing, so reruns never touch the database for schema management.
+    """
+    global _schema_ready_for
+    if _schema_ready_for == DB_NAME:
+        return  # Fast path: schema already checked in this process
+
+    with _schema_lock:
+        if _schema_ready_for != DB_NAME:
+            run_migrations()
+            _schema_ready_for = DB_NAME
+
+# --- CHANGE TRACKING (Read Caches) ---
+# Every function that writes to a session bumps that session's version number (and the
+# archive version) AFTER its commit. Readers remember the version they loaded, so a
+# Streamlit rerun can tell "nothing changed" without running any query.
+# Those counters only see this process's writes. Writes from other processes on the same file
+# (service.py workers next to the Streamlit app) are caught by SQLite's 'PRAGMA data_version',
+# read on a dedicated connection that never writes: its value changes whenever any other
+# connection, in any process, commits. Every cache version includes it.
+# The PRAGMA is run at most once per DATA_VERSION_CHECK_SECONDS (the value is shared by every reader),
+# so a burst of reruns still executes no SQL; another process's write shows up within that interval.
+DATA_VERSION_CHECK_SECONDS = 0.5
+_watch = None  # (db_name, the never-writing connection, last data_version, time.monotonic() it was read)
+_watch_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_session_versions = {}  # session_id -> int (bumped on every write to that session)
+_archive_version = 0    # bumped on every write to any session
+_meta_cache = {}        # session_id -> (version, meta dict or None)
+_archive_cache = {}     # (limit, before_created_at, before_id) -> (archive version, rows)
+ARCHIVE_CACHE_ENTRIES = 64  # Max cached archive pages (a page is small; this just bounds memory)
+
+def _data_version() -> int:
+    """
+    Changes whenever anything (this process or another one) committed to DB_NAME.
+    One cheap PRAGMA, re-run only when the last one is older than DATA_VERSION_CHECK_SECONDS.
+    """
+    global _watch
+    with _watch_lock:
+        now = time.monotonic()
+        if _watch is not None and _watch[0] == DB_NAME and now - _watch[3] < DATA_VERSION_CHECK_SECONDS:
+            return _watch[2]
+        if _watch is None or _watch[0] != DB_NAME:
+            if _watch is not None:
+                _watch[1].close()
+            conn = _open_connection(DB_NAME)
+        else:
+            conn = _watch[1]
+        _watch = (DB_NAME, conn, conn.execute("PRAGMA data_version").fetchone()[0], now)
+        return _watch[2]
+
+def _archive_cache_version() -> tuple:
+    with _cache_lock:
+        local = _archive_version
+    return (local, _data_version())
+
+def _bump_versions(session_id: str):
+    """Marks a session (and the archive list) as changed. Call after the write has committed."""
+    global _archive_version
+    with _cache_lock:
+        _session_versions[session_id] = _session_versions.get(session_id, 0) + 1
+        _archive_version += 1
+
+def _reset_read_caches():
+    """Forgets every cached read (used when DB_NAME points at a different file)."""
+    global _archive_version
+    with _cache_lock:
+        _session_versions.clear()
+        _meta_cache.clear()
+        _archive_cache.clear()
+        _archive_version += 1
+
+def get_session_version(session_id: str) -> tuple:
+    """
+    Returns the change marker of a session (a counter plus the file's data_version; at most one
+    PRAGMA per DATA_VERSION_CHECK_SECONDS, see _data_version).
+    If it is the same as last time, the session's messages and metadata have not changed,
+    whichever process wrote to the database.
+    """
+    with _cache_lock:
+        local = _session_versions.get(session_id, 0)
+    return (local, _data_version())
 
 def create_session(session_id: str, title: str = "New Inspection", mode: str = "General Analysis"):
     """
     Creates a new entry in the 'sessions' table.
     This is called when the app starts or when the user clicks 'New Inspection'.
     """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    # "INSERT OR IGNORE": If we accidentally try to create a session with an ID that already exists,
-    # this command silently fails instead of crashing the app.
-    c.execute("INSERT OR IGNORE INTO sessions (id, title, mode) VALUES (?, ?, ?)", (session_id, title, mode))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        # "INSERT OR IGNORE": If we accidentally try to create a session with an ID that already exists,
+        # this command silently fails instead of crashing the app.
+        conn.execute("INSERT OR IGNORE INTO sessions (id, title, mode) VALUES (?, ?, ?)", (session_id, title, mode))
+    _bump_versions(session_id)
 
 def update_session_mode(session_id: str, mode: str):
     """
     Updates the analysis protocol (e.g., changing from 'General' to 'Defect')
     for a specific session. This ensures the app 'remembers' your settings.
     """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    # This try-except block handles a specific edge case called a "Schema Migration".
-    # If a user has an old version of the database without the 'mode' column,
-    # the first command will fail. The 'except' block catches that failure,
-    # adds the missing column, and then tries the update again.
-    try:
-        c.execute("UPDATE sessions SET mode = ? WHERE id = ?", (mode, session_id))
-    except sqlite3.OperationalError:
-        try:
-            c.execute("ALTER TABLE sessions ADD COLUMN mode TEXT DEFAULT 'General Analysis'")
-            c.execute("UPDATE sessions SET mode = ? WHERE id = ?", (mode, session_id))
-        except:
-            pass  # If it still fails, we ignore it to prevent a crash
-    conn.commit()
-    conn.close()
+    # (Older databases without the 'mode' column are upgraded by the migrations in init_db)
+    with get_connection() as conn:
+        conn.execute("UPDATE sessions SET mode = ? WHERE id = ?", (mode, session_id))
+    _bump_versions(session_id)
+
+# --- IMAGE REFERENCES ---
+# Sessions point at files in the content-addressed image store, and several sessions may share one file.
+# Files are only removed while holding this lock, and backend/image_store.py only writes files while
+# holding it too. store_image() takes the new link's reference in the same locked step (retain_image),
+# so a file can never be deleted between "it is stored" and "a session links to it", however long the
+# caller takes to link it (a batch saves its sessions in groups, long after storing the images).
+image_files_lock = threading.RLock()
+
+def retain_image(content_hash: str, image_path: str, thumb_path: str = None, size_bytes: int = 0):
+    """
+    Registers a stored image and adds one reference to it, for a session that is about to link it
+    (update_session_image / save_batch_results take it over; release_images gives it back).
+    Called by backend/image_store.py while holding image_files_lock.
+    """
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO images (hash, path, thumb_path, size_bytes, refcount) VALUES (?, ?, ?, ?, 0)",
+            (content_hash, image_path, thumb_path, size_bytes)
+        )
+        conn.execute("UPDATE images SET refcount = refcount + 1 WHERE hash = ?", (content_hash,))
+
+def release_images(image_paths: List[str]):
+    """Gives back references taken by retain_image that no session took over (e.g. a batch group that failed to save)."""
+    with image_files_lock:
+        with get_connection() as conn:
+            orphaned = [p for path in image_paths for p in _release_image(conn, path)]
+        _remove_files(orphaned)  # After the commit (see _remove_files)
+
+def _release_image(c, image_path: str) -> List[str]:
+    """
+    Drops one session's reference to an image (inside an open transaction, AFTER the session row
+    itself was updated or deleted). Returns the files that are no longer used by any session.
+    """
+    if not image_path:
+        return []
+    row = c.execute("SELECT hash, thumb_path, refcount FROM images WHERE path = ?", (image_path,)).fetchone()
+    if row is None:
+        # A file saved before the image store existed: delete it only if no other session uses it
+        still_used = c.execute("SELECT 1 FROM sessions WHERE image_path = ? LIMIT 1", (image_path,)).fetchone()
+        return [] if still_used else [image_path]
+    if row["refcount"] > 1:
+        c.execute("UPDATE images SET refcount = refcount - 1 WHERE hash = ?", (row["hash"],))
+        return []
+    c.execute("DELETE FROM images WHERE hash = ?", (row["hash"],))
+    return [p for p in (image_path, row["thumb_path"]) if p]
 
-def update_session_image(session_id: str, image_path: str):
+def _remove_files(paths: List[str]):
+    """
+    Deletes files from disk, reporting (not raising) failures.
+    Called AFTER the transaction that released them has committed (a rollback must never leave rows
+    pointing at deleted files), but still holding image_files_lock, so nobody can store and link
+    the same image in between.
+    """
+    for path in paths:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except Exception as e:
+                print(f"Error deleting file: {e}")
+
+def update_session_image(session_id: str, image_path: str, content_hash: str = None,
+                         thumb_path: str = None, size_bytes: int = 0):
     """
     Links an uploaded image file path to a specific session ID.
     This allows us to reload the image if the user comes back to this chat later.
+
+    If 'content_hash' is given, the image comes from the image store (store_image), which already
+    took the reference this link uses; the session's previous image is released (and deleted if
+    nobody else uses it). Relinking the image the session already has just gives that extra
+    reference back; without 'content_hash' it is a no-op (no write at all).
     """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    try:
-        c.execute("UPDATE sessions SET image_path = ? WHERE id = ?", (image_path, session_id))
-    except sqlite3.OperationalError:
-        pass
-    conn.commit()
-    conn.close()
+    if not content_hash:
+        meta = get_session_meta(session_id)
+        if meta and meta.get("image_path") == image_path:
+            return
 
+    with image_files_lock:
+        with get_connection() as conn:
+            old = conn.execute("SELECT image_path FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            old_path = old["image_path"] if old else None
+            conn.execute("UPDATE sessions SET image_path = ? WHERE id = ?", (image_path, session_id))
+            # The old image loses this session's reference (the same image: the new reference is the extra one)
+            orphaned = _release_image(conn, old_path) if old_path else []
+        _remove_files(orphaned)  # After the commit (see _remove_files)
+    _bump_versions(session_id)
+
+@timed()
 def get_session_meta(session_id: str) -> Dict:
     """
     Retrieves the metadata (Title, Mode, Image Path) for a single session.
     Used by app.py to set up the UI state when loading a chat.
+
+    The result is cached until the session's version changes, so repeated calls
+    during reruns don't touch the database.
+    """
+    version = get_session_version(session_id)  # Read BEFORE the query, so a concurrent write invalidates it
+    with _cache_lock:
+        cached = _meta_cache.get(session_id)
+    if cached and cached[0] == version:
+        return dict(cached[1]) if cached[1] else None
+
+    with get_connection() as conn:
+        # Pooled connections use sqlite3.Row, which allows accessing columns by name (row['title'])
+        row = conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    meta = dict(row) if row else None  # Convert SQLite Row object to a standard Python Dictionary
+
+    with _cache_lock:
+        _meta_cache[session_id] = (version, meta)
+    return dict(meta) if meta else None
+
+def _metric_values(usage: Dict) -> tuple:
+    """The METRIC_COLUMNS values of a usage dict, in column order (missing fields become NULL)."""
+    return tuple(
+        int(bool(usage.get(name))) if name in BOOLEAN_METRICS else usage.get(name)
+        for name, _ in METRIC_COLUMNS
+    )
+
+def _insert_metrics_sql(message_id_sql: str = "?") -> str:
     """
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  # Crucial: Allows accessing columns by name (row['title']) instead of index (row[1])
-    c = conn.cursor()
-    c.execute("SELECT * FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
-    conn.close()
-    return dict(row) if row else None  # Convert SQLite Row object to a standard Python Dictionary
+    INSERT for one metrics row. Parameters: those of 'message_id_sql', the METRIC_COLUMNS values,
+    then the session id (the session's current mode is recorded as the protocol).
+    """
+    return (
+        f"INSERT OR REPLACE INTO message_metrics (message_id, {', '.join(n for n, _ in METRIC_COLUMNS)}, session_id, protocol) "
+        f"SELECT {message_id_sql}, {', '.join('?' * len(METRIC_COLUMNS))}, id, mode FROM sessions WHERE id = ?"
+    )
 
-def add_message(session_id: str, role: str, content: str, usage: Dict = None):
+@timed()
+def add_message(session_id: str, role: str, content: str, usage: Dict = None, defect_report: Dict = None) -> int:
     """
     Saves a single message (User or AI) to the database.
     Also handles the 'Auto-Renaming' feature.
+
+    'defect_report' (optional) is the structured result of a Defect Inspection answer,
+    as produced by backend.defects (qa_status + defects rows); it is saved in the same transaction.
+
+    Returns the new message's id (used by app.py to track what it has already loaded).
     """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    # Convert the usage dictionary (tokens, latency) into a JSON string because SQLite cannot store dictionaries directly.
-    usage_json = json.dumps(usage) if usage else None
-    
-    c.execute(
-        "INSERT INTO messages (session_id, role, content, usage_data) VALUES (?, ?, ?, ?)",
-        (session_id, role, content, usage_json)
+    with get_connection() as conn:
+        message_id = _insert_message(conn, session_id, role, content, usage, defect_report)
+    _bump_versions(session_id)
+    return message_id
+
+def _insert_message(conn, session_id: str, role: str, content: str, usage: Dict = None, defect_report: Dict = None) -> int:
+    """The writes of add_message on an open connection (shared with the write-behind turn writer)."""
+    cursor = conn.execute(
+        "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+        (session_id, role, content)
     )
-    
+    message_id = cursor.lastrowid
+    # The usage dictionary (tokens, latency) goes to its own typed columns
+    if usage:
+        conn.execute(_insert_metrics_sql(), (message_id,) + _metric_values(usage) + (session_id,))
+    if defect_report:
+        _insert_defect_report(conn, session_id, message_id, defect_report)
+
     # Auto-Renaming Logic:
     # If the user sends a message and the title is still the default "New Inspection",
     # we update the title to be the first ~30 characters of their message.
     # This helps users find chats easily in the sidebar.
     if role == "user":
         new_title = (content[:30] + '...') if len(content) > 30 else content
-        c.execute("UPDATE sessions SET title = ? WHERE id = ? AND title = 'New Inspection'", (new_title, session_id))
-        
-    conn.commit()
-    conn.close()
+        conn.execute("UPDATE sessions SET title = ? WHERE id = ? AND title = 'New Inspection'", (new_title, session_id))
+    return message_id
+
+@timed()
+def save_batch_results(records: List[Dict]):
+    """
+    Saves many finished analyses at once (used by batch inspection).
+
+    Each record is a dict with: session_id, title, image_path, mode, question, answer, usage (dict or None),
+    and optionally image_hash for images kept in the image store (stored with store_image, whose
+    reference the session takes over) and defect_report (structured Defect Inspection result, see add_message).
+    Every record becomes its own session with two messages (the question and the answer).
+    All rows are written in ONE transaction with executemany, so a lot of 500 images costs
+    a handful of commits instead of 1,500.
+    """
+    if not records:
+        return
+
+    sessions = [(r["session_id"], r["title"], r["image_path"], r["mode"]) for r in records]
+    messages = []
+    for r in records:
+        messages.append((r["session_id"], "user", r["question"]))
+        messages.append((r["session_id"], "assistant", r["answer"]))
+
+    with image_files_lock:
+        with get_connection() as conn:
+            conn.executemany("INSERT OR IGNORE INTO sessions (id, title, image_path, mode) VALUES (?, ?, ?, ?)", sessions)
+            conn.executemany("INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)", messages)
+            # Metrics of each session's (only) answer, whose id is looked up by session
+            conn.executemany(
+                _insert_metrics_sql("(SELECT MAX(id) FROM messages WHERE session_id = ? AND role = 'assistant')"),
+                [(r["session_id"],) + _metric_values(r["usage"]) + (r["session_id"],) for r in records if r.get("usage")]
+            )
+            # Each new session has exactly one answer, so its id is found by session
+            for r in records:
+                if r.get("defect_report"):
+                    message_id = conn.execute(
+                        "SELECT MAX(id) FROM messages WHERE session_id = ? AND role = 'assistant'", (r["session_id"],)
+                    ).fetchone()[0]
+                    _insert_defect_report(conn, r["session_id"], message_id, r["defect_report"])
+
+    for r in records:
+        _bump_versions(r["session_id"])
+
+# --- WRITE-BEHIND QUEUE ---
+# A chat turn used to cost two commits (question + answer) on the Streamlit thread, each waiting for
+# SQLite to reach the disk. Turns are now handed to one background writer thread instead:
+# - submit_turn() returns immediately with a Future; the operator never waits for the commit.
+# - The writer drains everything queued so far and commits it as ONE transaction (group commit),
+#   so ten operators finishing answers at the same moment cost one commit, not twenty.
+# - Each queued write runs inside its own SAVEPOINT, so one bad write fails alone (its Future gets
+#   the exception) without losing the others in its group.
+# - Read-your-writes: Future.result() (or flush_writes() for everything) waits until the write is
+#   committed and the session's version counter has been bumped.
+
+# Most writes committed in one transaction (a bigger backlog is split into several commits)
+WRITE_BATCH_MAX = 256
+
+class WriteBehindQueue:
+    """One writer thread that group-commits queued writes. Started lazily on the first submit."""
+
+    def __init__(self, batch_max: int):
+        self.batch_max = batch_max
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, write: Callable, *args) -> Future:
+        """
+        Queues write(conn, *args) -> (result, [session ids it changed]).
+        The returned Future resolves to 'result' once the transaction holding it has committed.
+        """
+        future = Future()
+        self._ensure_started()
+        self._queue.put((write, args, future))
+        return future
+
+    def flush(self, timeout: float = None):
+        """Blocks until every write queued before this call is committed (a barrier)."""
+        if self._thread is None:
+            return
+        self.submit(lambda conn: (None, [])).result(timeout)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]  # Sleep until there is work
+            # Group commit: take whatever else piled up while the previous transaction was committing
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    @timed("database.write_batch")
+    def _commit(self, batch: list):
+        outcomes, changed = [], set()
+        try:
+            with get_connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")  # Take the write lock once for the whole group
+                for write, args, future in batch:
+                    conn.execute("SAVEPOINT queued_write")
+                    try:
+                        result, session_ids = write(conn, *args)
+                        conn.execute("RELEASE queued_write")
+                        outcomes.append((future, result, None))
+                        changed.update(session_ids)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO queued_write")
+                        conn.execute("RELEASE queued_write")
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            # The commit itself failed: nothing in this group was saved
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        for session_id in changed:
+            _bump_versions(session_id)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+# The process-wide writer (shared by every Streamlit session)
+_writer = WriteBehindQueue(WRITE_BATCH_MAX)
+
+def _write_turn(conn, session_id: str, question: str, answer: str, usage: Dict, defect_report: Dict):
+    """One chat turn (question, answer, metrics, defects, auto-rename) as a queued write."""
+    question_id = _insert_message(conn, session_id, "user", question)
+    answer_id = None
+    if answer is not None:
+        answer_id = _insert_message(conn, session_id, "assistant", answer, usage, defect_report)
+    return (question_id, answer_id), [session_id]
+
+def submit_turn(session_id: str, question: str, answer: str = None, usage: Dict = None,
+                defect_report: Dict = None) -> Future:
+    """
+    Saves a whole chat turn in the background, in a single transaction.
+    'answer' may be None (the model call failed): the question is still saved.
+
+    Returns a Future resolving to (question message id, answer message id or None) after the commit.
+    """
+    return _writer.submit(_write_turn, session_id, question, answer, usage, defect_report)
+
+def _write_audit(conn, session_id: str, question: str, answers: List[Dict]):
+    """A full audit (one question, one answer per protocol) as a single queued write."""
+    question_id = _insert_message(conn, session_id, "user", question)
+    answer_ids = [
+        _insert_message(conn, session_id, "assistant", a["content"], a.get("usage"), a.get("defect_report"))
+        for a in answers
+    ]
+    return (question_id, answer_ids), [session_id]
+
+def submit_audit(session_id: str, question: str, answers: List[Dict]) -> Future:
+    """
+    Saves a full audit in one transaction, so the session never shows some protocols' answers without the others.
+    'answers' are dicts with 'content' and optional 'usage' / 'defect_report' (may be empty: all calls failed).
 
-def get_all_sessions() -> List[Dict]:
+    Returns a Future resolving to (question message id, [answer message ids]) after the commit.
     """
-    Fetches all sessions to display in the Sidebar History list.
+    return _writer.submit(_write_audit, session_id, question, answers)
+
+def flush_writes(timeout: float = None):
+    """Waits until every write queued so far is committed (before reads that must see them)."""
+    _writer.flush(timeout)
+
+# Writes still in the queue are committed before the interpreter exits
+atexit.register(flush_writes, 10)
+
+@timed()
+def get_all_sessions(limit: int = None, before_created_at: str = None, before_id: str = None) -> List[Dict]:
+    """
+    Fetches sessions (newest first) to display in the Sidebar History list.
     It includes logic to filter out 'Ghost Sessions' (empty sessions created by accident).
+
+    Pagination ("keyset" style):
+        - limit: maximum number of sessions to return (None = all of them).
+        - before_created_at / before_id: the 'created_at' and 'id' of the last session of the
+          previous page. Only older sessions are returned. Unlike OFFSET, this stays fast on
+          page 100 because SQLite jumps straight to that spot in the created_at index.
     """
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    # Complex Query Explanation:
+    # Filter Explanation:
     # We want sessions that match ANY of these criteria:
-    # 1. Have at least one message (m.id IS NOT NULL)
+    # 1. Have been renamed by the user (s.title != 'New Inspection')
     # 2. Have an image uploaded (s.image_path IS NOT NULL)
-    # 3. Have been renamed by the user (s.title != 'New Inspection')
+    # 3. Have at least one message (EXISTS stops at the first match via the messages index,
+    #    instead of joining every message and de-duplicating with DISTINCT)
     # This filters out empty "New Inspection" sessions that happen when you refresh the page.
-    c.execute("""
-        SELECT DISTINCT s.*
+    query = """
+        SELECT s.*
         FROM sessions s
-        LEFT JOIN messages m ON s.id = m.session_id
-        WHERE m.id IS NOT NULL 
-           OR s.image_path IS NOT NULL 
-           OR s.title != 'New Inspection'
-        ORDER BY s.created_at DESC
-    """)
-    rows = c.fetchall()
-    conn.close()
+        WHERE (s.title != 'New Inspection'
+               OR s.image_path IS NOT NULL
+               OR EXISTS (SELECT 1 FROM messages m WHERE m.session_id = s.id))
+    """
+    params = []
+
+    # Keyset cursor: strictly older than the last row we already showed.
+    # (created_at only has 1-second resolution, so 'id' breaks ties between sessions created in the same second)
+    if before_created_at is not None:
+        query += " AND (s.created_at < ? OR (s.created_at = ? AND s.id < ?))"
+        params += [before_created_at, before_created_at, before_id or ""]
+
+    query += " ORDER BY s.created_at DESC, s.id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    # Serve the page from the cache if no session has changed since it was loaded
+    cache_key = (limit, before_created_at, before_id)
+    version = _archive_cache_version()  # Read BEFORE the query, so a concurrent write invalidates it
+    with _cache_lock:
+        cached = _archive_cache.get(cache_key)
+    if cached and cached[0] == version:
+        return [dict(row) for row in cached[1]]
+
+    with get_connection() as conn:
+        rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+
+    with _cache_lock:
+        if len(_archive_cache) >= ARCHIVE_CACHE_ENTRIES:
+            _archive_cache.clear()
+        _archive_cache[cache_key] = (version, rows)
+    return [dict(row) for row in rows]
+
+# Title matches count double: a session named "Corroded flange" beats one that mentions it once
+SEARCH_TITLE_WEIGHT = 2.0
+# BM25 ranking costs time per matching message. For very common words (hundreds of thousands of hits)
+# only the most recent SEARCH_RANK_WINDOW matching messages are ranked, which keeps a search under ~100 ms.
+# Sessions whose only hits are older are still found: they follow the ranked ones, newest hit first.
+SEARCH_RANK_WINDOW = 2000
+
+def _fts_query(text: str) -> str:
+    """
+    Turns free text typed by the operator into a safe FTS5 query.
+    Every word must match (AND); each word is quoted so characters like '-' or ':' are not
+    read as FTS5 operators, and the last word also matches as a prefix (search-as-you-type).
+    A single letter is not used as a prefix: it would match most of the index (and there is no
+    1-letter prefix index). Returns "" if the text has no searchable words.
+    """
+    words = re.findall(r"\w+", text or "")
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    if len(words[-1]) >= 2:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+def _snippet(content: str, words: List[str], width: int = 120) -> str:
+    """
+    A short excerpt of 'content' around the first search hit, with the hits in **bold**.
+    Built in Python from the page's few messages: FTS5's own snippet() has to re-scan every
+    expanded term of a prefix query for each row, which took ~10 ms per result.
+    Words are matched by their start (as in the index, "cracks" also finds "cracked").
+    """
+    stems = [w.lower() if len(w) <= 5 else w.lower()[:-2] for w in words]
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(s) for s in stems) + r")\w*", re.IGNORECASE)
+    flat = " ".join((content or "").split())
+    first = pattern.search(flat)
+    start = max(0, first.start() - width // 3) if first else 0
+    excerpt = flat[start:start + width]
+    excerpt = pattern.sub(lambda m: f"**{m.group(0)}**", excerpt)
+    return ("…" if start > 0 else "") + excerpt + ("…" if start + width < len(flat) else "")
+
+@timed()
+def search_sessions(text: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+    """
+    Full-text search over session titles and message content (FTS5, ranked by BM25).
+
+    Returns one dict per matching session, best match first:
+        {"id", "title", "created_at", "snippet"}
+    where 'snippet' is a short excerpt of the best matching message with the hits in **bold**
+    (empty when only the title matched). Use 'offset' to page through the results.
+    Every matching session is returned; those matched only by messages older than the ranking
+    window (SEARCH_RANK_WINDOW) come last, by their newest hit.
+
+    Results are cached until any session changes, so reruns with the same search box text are free.
+    """
+    match = _fts_query(text)
+    if not match:
+        return []
+
+    cache_key = ("search", match, limit, offset)
+    version = _archive_cache_version()  # Read BEFORE the query, so a concurrent write invalidates it
+    with _cache_lock:
+        cached = _archive_cache.get(cache_key)
+    if cached and cached[0] == version:
+        return [dict(row) for row in cached[1]]
+
+    with get_connection() as conn:
+        # 1. Find where the ranking window starts: the id of the SEARCH_RANK_WINDOW-th newest match
+        #    (walking the index by id is cheap; nothing is ranked yet). No row = few matches, rank them all.
+        window_start = conn.execute(
+            "SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+            (match, SEARCH_RANK_WINDOW - 1)
+        ).fetchone()
+
+        # 2. Rank sessions by their best hit. (SQLite fills the bare 'message_id' column from
+        #    the row that produced MIN(rank), i.e. the best matching message of each session.)
+        start = window_start[0] if window_start else 0
+        ranked = [dict(row) for row in conn.execute('''
+            SELECT session_id, MIN(rank) AS rank, message_id FROM (
+                SELECT m.session_id AS session_id, messages_fts.rank AS rank, messages_fts.rowid AS message_id
+                FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+                WHERE messages_fts MATCH ? AND messages_fts.rowid >= ?
+                UNION ALL
+                SELECT session_id, rank * ?, NULL FROM sessions_fts WHERE sessions_fts MATCH ?
+            )
+            GROUP BY session_id
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        ''', (match, start, SEARCH_TITLE_WEIGHT, match, limit, offset))]
+
+        # 2b. Past the last ranked session: the sessions whose hits are all older than the window,
+        #     newest hit first. The older hits are walked by id (nothing ranked) and only until the
+        #     page is full, so the first pages cost nothing extra.
+        if window_start and len(ranked) < limit:
+            ranked_ids = {row[0] for row in conn.execute('''
+                SELECT m.session_id FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+                WHERE messages_fts MATCH ? AND messages_fts.rowid >= ?
+                UNION
+                SELECT session_id FROM sessions_fts WHERE sessions_fts MATCH ?
+            ''', (match, start, match))}
+            skip = max(0, offset - len(ranked_ids))
+            older = conn.execute('''
+                SELECT m.session_id, messages_fts.rowid FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+                WHERE messages_fts MATCH ? AND messages_fts.rowid < ?
+                ORDER BY messages_fts.rowid DESC
+            ''', (match, start))
+            for session_id, message_id in older:
+                if session_id in ranked_ids:
+                    continue
+                ranked_ids.add(session_id)
+                if skip:
+                    skip -= 1
+                    continue
+                ranked.append({"session_id": session_id, "rank": None, "message_id": message_id})
+                if len(ranked) == limit:
+                    break
+
+        # 3. Only for this page: session details and highlighted snippets
+        session_ids = [r["session_id"] for r in ranked]
+        message_ids = [r["message_id"] for r in ranked if r["message_id"] is not None]
+        marks = lambda values: ",".join("?" * len(values))
+        sessions = {
+            row["id"]: row for row in conn.execute(
+                f"SELECT id, title, created_at FROM sessions WHERE id IN ({marks(session_ids)})", session_ids
+            )
+        }
+        words = re.findall(r"\w+", text)
+        snippets = {
+            row["id"]: _snippet(row["content"], words) for row in conn.execute(
+                f"SELECT id, content FROM messages WHERE id IN ({marks(message_ids)})", message_ids
+            )
+        } if message_ids else {}
+
+    rows = []
+    for r in ranked:
+        session = sessions.get(r["session_id"])
+        if session:
+            rows.append({"id": session["id"], "title": session["title"], "created_at": session["created_at"],
+                         "snippet": snippets.get(r["message_id"], "")})
+
+    with _cache_lock:
+        if len(_archive_cache) >= ARCHIVE_CACHE_ENTRIES:
+            _archive_cache.clear()
+        _archive_cache[cache_key] = (version, rows)
     return [dict(row) for row in rows]
 
+# Messages joined with their typed metrics (NULL metrics for user messages)
+_MESSAGE_SELECT = (
+    f"SELECT m.id, m.role, m.content, mm.message_id AS has_metrics, "
+    f"{', '.join('mm.' + n for n, _ in METRIC_COLUMNS)} "
+    f"FROM messages m LEFT JOIN message_metrics mm ON mm.message_id = m.id"
+)
+
+def _row_to_message(row) -> Dict:
+    """Converts a 'messages' row (with its metrics columns) into the dict format used by the frontend."""
+    msg = {"role": row["role"], "content": row["content"]}
+    # Rebuild the usage dictionary from the typed columns for the frontend to use
+    if row["has_metrics"] is not None:
+        usage = {name: row[name] for name, _ in METRIC_COLUMNS if row[name] is not None}
+        for name in BOOLEAN_METRICS & usage.keys():
+            usage[name] = bool(usage[name])
+        msg["usage"] = usage
+    return msg
+
+@timed()
 def get_session_history(session_id: str) -> List[Dict]:
     """
     Fetches the full chat history for the main chat window.
     """
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM messages WHERE session_id = ? ORDER BY id ASC", (session_id,))
-    rows = c.fetchall()
-    conn.close()
-    
-    history = []
+    with get_connection() as conn:
+        rows = conn.execute(f"{_MESSAGE_SELECT} WHERE m.session_id = ? ORDER BY m.id ASC", (session_id,)).fetchall()
+    return [_row_to_message(row) for row in rows]
+
+def get_message(message_id: int) -> Dict:
+    """A single message (with its usage metrics), or None if it does not exist."""
+    with get_connection() as conn:
+        row = conn.execute(f"{_MESSAGE_SELECT} WHERE m.id = ?", (message_id,)).fetchone()
+    return _row_to_message(row) if row else None
+
+@timed()
+def get_messages_since(session_id: str, after_id: int = 0) -> List[Dict]:
+    """
+    Fetches only the messages newer than 'after_id' (all of them when after_id is 0).
+    Each message includes its 'id', so the caller can remember where it stopped.
+    Used by app.py to sync the chat incrementally instead of reloading the whole history.
+    """
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"{_MESSAGE_SELECT} WHERE m.session_id = ? AND m.id > ? ORDER BY m.id ASC",
+            (session_id, after_id)
+        ).fetchall()
+
+    messages = []
     for row in rows:
-        msg = {"role": row["role"], "content": row["content"]}
-        # Parse the JSON string back into a Python dictionary for the frontend to use
-        if row["usage_data"]:
-            msg["usage"] = json.loads(row["usage_data"])
-        history.append(msg)
-    return history
+        msg = _row_to_message(row)
+        msg["id"] = row["id"]
+        messages.append(msg)
+    return messages
 
 def update_session_title(session_id: str, new_title: str):
     """
     Manually renames a session.
     Triggered when the user types a new name in the Sidebar 'Session Options'.
     """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("UPDATE sessions SET title = ? WHERE id = ?", (new_title, session_id))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        conn.execute("UPDATE sessions SET title = ? WHERE id = ?", (new_title, session_id))
+    _bump_versions(session_id)
 
 def delete_session(session_id: str):
     """
     Deletes a session completely.
-    Crucially, this also cleans up the local storage by deleting the image file.
-    """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    # Step 1: Find the image path associated with this session
-    c.execute("SELECT image_path FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
-    
-    # Step 2: Delete the actual file from the computer's hard drive
-    if row and row[0]:
-        image_path = row[0]
-        if os.path.exists(image_path):
-            try:
-                os.remove(image_path)
-            except Exception as e:
-                print(f"Error deleting file: {e}")
+    Crucially, this also cleans up the local storage: the session's image reference is released,
+    and the image file (plus its thumbnail) is deleted once no other session uses it.
+    """
+    flush_writes()  # A turn still in the write-behind queue must not land after the session is gone
+    with image_files_lock:
+        with get_connection() as conn:
+            c = conn.cursor()
+
+            # Step 1: Delete all messages belonging to this session (and their extracted defects)
+            c.execute("DELETE FROM defects WHERE session_id = ?", (session_id,))
+            c.execute("DELETE FROM defect_reports WHERE session_id = ?", (session_id,))
+            c.execute("DELETE FROM message_metrics WHERE session_id = ?", (session_id,))
+            c.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            # (and its background analyses, whose rows point at those messages)
+            c.execute("DELETE FROM jobs WHERE session_id = ?", (session_id,))
+
+            # Step 2: Find the image path associated with this session
+            c.execute("SELECT image_path FROM sessions WHERE id = ?", (session_id,))
+            row = c.fetchone()
+
+            # Step 3: Delete the session record itself
+            c.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+            # Step 4: Release the image (its files are deleted below if this was the last reference)
+            orphaned = _release_image(c, row[0]) if row and row[0] else []
+
+        # Step 5: Delete the unused files, only now that the transaction is committed (see _remove_files)
+        _remove_files(orphaned)
+    _bump_versions(session_id)
+
+# --- DEFECT ANALYTICS ---
+# Structured Defect Inspection results (written by add_message / save_batch_results).
+# Dates are SQLite timestamps ('YYYY-MM-DD HH:MM:SS', UTC); a date like '2025-01-01' also works as a bound.
+
+def _insert_defect_report(conn, session_id: str, message_id: int, report: Dict):
+    """Writes one answer's verdict and defect rows (inside the caller's transaction)."""
+    conn.execute(
+        "INSERT OR REPLACE INTO defect_reports (message_id, session_id, qa_status) VALUES (?, ?, ?)",
+        (message_id, session_id, report.get("qa_status"))
+    )
+    conn.executemany(
+        "INSERT INTO defects (message_id, session_id, zone, anomaly, severity, rejection_criteria) VALUES (?, ?, ?, ?, ?, ?)",
+        [(message_id, session_id, d.get("zone"), d.get("anomaly"), d.get("severity"), d.get("rejection_criteria"))
+         for d in report.get("defects", [])]
+    )
+
+def _defect_filters(severity: str = None, zone: str = None, since: str = None, until: str = None):
+    """Builds the WHERE clause shared by the defect queries (each filter is optional)."""
+    clauses, params = [], []
+    if severity:
+        clauses.append("severity = ?")
+        params.append(severity)
+    if zone:
+        clauses.append("zone = ? COLLATE NOCASE")
+        params.append(zone)
+    if since:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("created_at < ?")
+        params.append(until)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def query_defects(severity: str = None, zone: str = None, since: str = None, until: str = None,
+                  limit: int = 500) -> List[Dict]:
+    """
+    Lists extracted defects, newest first.
+    Example: all Critical anomalies on dies this month ->
+        query_defects(severity="Crit", zone="Die", since="2025-06-01")
+    """
+    where, params = _defect_filters(severity, zone, since, until)
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"SELECT * FROM defects{where} ORDER BY created_at DESC, id DESC LIMIT ?", params + [limit]
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def count_defects(group_by: str = "severity", severity: str = None, zone: str = None,
+                  since: str = None, until: str = None) -> Dict[str, int]:
+    """Counts defects per severity or per zone (group_by = 'severity' or 'zone'), with the same filters as query_defects."""
+    if group_by not in ("severity", "zone"):
+        raise ValueError(f"Cannot group defects by {group_by!r}")
+    where, params = _defect_filters(severity, zone, since, until)
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"SELECT {group_by} AS key, COUNT(*) AS n FROM defects{where} GROUP BY {group_by} ORDER BY n DESC", params
+        ).fetchall()
+    return {row["key"]: row["n"] for row in rows}
+
+def count_qa_status(since: str = None, until: str = None) -> Dict[str, int]:
+    """How many analyzed answers were PASS / FAIL in a date range."""
+    where, params = _defect_filters(since=since, until=until)
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"SELECT qa_status, COUNT(*) AS n FROM defect_reports{where} GROUP BY qa_status", params
+        ).fetchall()
+    return {row["qa_status"]: row["n"] for row in rows}
+
+def get_unparsed_assistant_messages(after_id: int = 0, limit: int = 500,
+                                    modes: List[str] = ("Defect Inspection",)) -> List[Dict]:
+    """
+    Assistant messages that have no structured defect report yet (used to backfill old answers).
+    Only sessions whose mode is one of 'modes' are read: answers of other protocols have no Defect Log.
+    Returns dicts with id, session_id, content and timestamp, in id order.
+    """
+    modes = list(modes)
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT m.id, m.session_id, m.content, m.timestamp FROM messages m "
+            "JOIN sessions s ON s.id = m.session_id "
+            f"WHERE m.role = 'assistant' AND m.id > ? AND s.mode IN ({', '.join('?' * len(modes))}) "
+            "AND NOT EXISTS (SELECT 1 FROM defect_reports r WHERE r.message_id = m.id) "
+            "ORDER BY m.id LIMIT ?",
+            [after_id, *modes, limit]
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def save_defect_reports(reports: List[Dict]):
+    """
+    Saves structured reports for existing messages in one transaction.
+    Each item: {"session_id", "message_id", "timestamp" (the message's), "report": {...}}.
+    """
+    with get_connection() as conn:
+        for item in reports:
+            _insert_defect_report(conn, item["session_id"], item["message_id"], item["report"])
+            # Backfilled rows keep the date of the original answer, so date filters stay correct
+            if item.get("timestamp"):
+                conn.execute("UPDATE defect_reports SET created_at = ? WHERE message_id = ?", (item["timestamp"], item["message_id"]))
+                conn.execute("UPDATE defects SET created_at = ? WHERE message_id = ?", (item["timestamp"], item["message_id"]))
+
+# --- PERFORMANCE ANALYTICS ---
+# Latency / speed percentiles over the typed message_metrics table (see _migration_message_metrics).
+
+# What get_performance_stats can group by -> the SQL expression for it
+PERFORMANCE_GROUPS = {
+    "protocol": "COALESCE(protocol, 'unknown')",
+    "day": "date(created_at)",
+    "model": "COALESCE(NULLIF(model, ''), 'unknown')",  # Answers saved before the model was recorded
+}
+
+def _percentile_sql(column: str, rank_column: str, p: float) -> str:
+    """
+    Nearest-rank percentile of 'column' within each group: the value at rank ceil(p * n),
+    where 'rank_column' is the row's position when the group is sorted by 'column'.
+    """
+    return (f"MAX(CASE WHEN {rank_column} = MAX(1, CAST({p} * n AS INTEGER) + ({p} * n > CAST({p} * n AS INTEGER))) "
+            f"THEN {column} END)")
+
+def get_performance_stats(group_by: str = "protocol", since: str = None, until: str = None) -> List[Dict]:
+    """
+    p50 / p95 / p99 of latency (seconds) and throughput (tokens/sec) per protocol, day or model,
+    computed inside SQLite with window functions. Answers served from the response cache are
+    excluded (they measure the cache, not the model).
+
+    Returns one dict per group:
+        {"group", "requests", "latency_p50", "latency_p95", "latency_p99",
+         "tps_p50", "tps_p95", "tps_p99", "avg_ttft", "avg_tokens"}
+    Groups are sorted by name (so 'day' is chronological).
+
+    Results are cached until any session changes.
+    """
+    if group_by not in PERFORMANCE_GROUPS:
+        raise ValueError(f"Cannot group performance stats by {group_by!r}")
+    group_sql = PERFORMANCE_GROUPS[group_by]
+
+    cache_key = ("performance", group_by, since, until)
+    version = _archive_cache_version()  # Read BEFORE the query, so a concurrent write invalidates it
+    with _cache_lock:
+        cached = _archive_cache.get(cache_key)
+    if cached and cached[0] == version:
+        return [dict(row) for row in cached[1]]
+
+    clauses, params = ["cached = 0", "latency > 0"], []
+    if since:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("created_at < ?")
+        params.append(until)
+
+    percentiles = ",\n".join(
+        f"{_percentile_sql(column, rank, p)} AS {prefix}_p{int(p * 100)}"
+        for column, rank, prefix in (("latency", "latency_rank", "latency"), ("throughput", "tps_rank", "tps"))
+        for p in (0.5, 0.95, 0.99)
+    )
+    query = f'''
+        WITH ranked AS (
+            SELECT {group_sql} AS grp, latency, throughput, ttft, total_tokens,
+                   ROW_NUMBER() OVER (PARTITION BY {group_sql} ORDER BY latency) AS latency_rank,
+                   ROW_NUMBER() OVER (PARTITION BY {group_sql} ORDER BY throughput) AS tps_rank,
+                   COUNT(*) OVER (PARTITION BY {group_sql}) AS n
+            FROM message_metrics
+            WHERE {" AND ".join(clauses)}
+        )
+        SELECT grp AS "group", COUNT(*) AS requests,
+{percentiles},
+               ROUND(AVG(NULLIF(ttft, 0)), 2) AS avg_ttft,
+               ROUND(AVG(total_tokens)) AS avg_tokens
+        FROM ranked
+        GROUP BY grp
+        ORDER BY grp
+    '''
+    with get_connection() as conn:
+        rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+
+    with _cache_lock:
+        if len(_archive_cache) >= ARCHIVE_CACHE_ENTRIES:
+            _archive_cache.clear()
+        _archive_cache[cache_key] = (version, rows)
+    return [dict(row) for row in rows]
+
+# --- RESPONSE CACHE STORAGE ---
+# Low-level storage for backend/response_cache.py. Times are Unix timestamps (time.time()).
+
+def get_cached_response(key: str, min_created_at: float, now: float):
+    """
+    Returns (content, usage dict or None) for a cache key that is newer than 'min_created_at',
+    and records the hit. Returns None on a miss (or if the entry has expired).
+    """
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT content, usage_data FROM response_cache WHERE key = ? AND created_at >= ?",
+            (key, min_created_at)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE response_cache SET hits = hits + 1, last_hit_at = ? WHERE key = ?", (now, key))
+    return row["content"], (json.loads(row["usage_data"]) if row["usage_data"] else None)
+
+def put_cached_response(key: str, content: str, usage: Dict, now: float):
+    """Stores (or replaces) a cached answer."""
+    usage_json = json.dumps(usage) if usage else None
+    size_bytes = len(content.encode("utf-8")) + len(usage_json or "") + len(key)
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, content, usage_data, created_at, last_hit_at, hits, size_bytes) "
+            "VALUES (?, ?, ?, ?, ?, 0, ?)",
+            (key, content, usage_json, now, now, size_bytes)
+        )
+
+def evict_response_cache(min_created_at: float, max_bytes: int) -> int:
+    """
+    Removes expired entries (created before 'min_created_at'), then the least recently
+    used ones until the cache fits in 'max_bytes'. Returns how many rows were deleted.
+    """
+    with get_connection() as conn:
+        deleted = conn.execute("DELETE FROM response_cache WHERE created_at < ?", (min_created_at,)).rowcount
+
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM response_cache").fetchone()[0]
+        if total > max_bytes:
+            # Walk from the least recently used entry and find how many must go
+            to_delete = []
+            for row in conn.execute("SELECT key, size_bytes FROM response_cache ORDER BY last_hit_at ASC"):
+                if total <= max_bytes:
+                    break
+                to_delete.append((row["key"],))
+                total -= row["size_bytes"] or 0
+            conn.executemany("DELETE FROM response_cache WHERE key = ?", to_delete)
+            deleted += len(to_delete)
+    return deleted
+
+# --- BACKGROUND JOBS ---
+# Status rows of background analyses (backend/jobs.py). Writes go through the write-behind queue,
+# so they are committed in the order they were made and never block the thread that makes them.
 
-    # Step 3: Delete all messages belonging to this session
-    c.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
-    # Step 4: Delete the session record itself
-    c.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+JOB_COLUMNS = ("id", "session_id", "question", "protocol", "status", "error", "owner",
+               "question_message_id", "answer_message_id", "started_at", "finished_at")
+
+def _write_job(conn, job: Dict):
+    conn.execute(
+        f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' * len(JOB_COLUMNS))}) "
+        f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in JOB_COLUMNS[1:])}",
+        tuple(job.get(c) for c in JOB_COLUMNS)
+    )
+    return None, []
+
+def save_job(job: Dict) -> Future:
+    """Inserts or updates a job row (a dict with the JOB_COLUMNS keys). Returns the write's Future."""
+    return _writer.submit(_write_job, job)
+
+def get_jobs(session_id: str = None, statuses: List[str] = None, limit: int = 50) -> List[Dict]:
+    """Job rows, newest first, optionally for one session and/or only in the given statuses."""
+    conditions, params = [], []
+    if session_id:
+        conditions.append("session_id = ?")
+        params.append(session_id)
+    if statuses:
+        conditions.append(f"status IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"SELECT * FROM jobs {where} ORDER BY created_at DESC, rowid DESC LIMIT ?", params + [limit]
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def get_job_row(job_id: str) -> Dict:
+    """One job row, or None (rows are written behind: a job submitted a moment ago may not be there yet)."""
+    with get_connection() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+def fail_jobs(job_ids: List[str], error: str):
+    """Marks jobs as failed (used for jobs whose process died before finishing them)."""
+    if not job_ids:
+        return
+    with get_connection() as conn:
+        conn.executemany(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            [(error, job_id) for job_id in job_ids]
+        )
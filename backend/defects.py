@@ -0,0 +1,142 @@
+import argparse  # Command line interface for backfilling old answers
+import json  # Parsing the structured JSON block
+import re  # Finding the JSON block, the QA status line and the Markdown table
+from typing import Optional, Tuple  # Type hinting
+from backend.schemas import STRUCTURED_PROTOCOLS, DefectReport, DefectRow  # The structured result models (and which protocols have them)
+from backend.database import init_db, get_unparsed_assistant_messages, save_defect_reports
+
+# The fenced ```json block the structured-output prompt asks for (the last one in the answer wins)
+JSON_BLOCK = re.compile(r"```json\s*(\{.*?\})\s*```", re.DOTALL | re.IGNORECASE)
+# "## QA Status: FAIL" (also tolerates bold markers and brackets: "**QA Status:** [PASS]")
+QA_STATUS_LINE = re.compile(r"QA\s*Status\W*(PASS|FAIL)", re.IGNORECASE)
+# A Markdown table separator row, e.g. "| :--- | :--- |"
+TABLE_SEPARATOR = re.compile(r"^\|?\s*:?-{3,}")
+
+# Free-text severities mapped onto the three levels used by the Defect Inspection persona
+SEVERITY_ALIASES = {
+    "low": "Low", "minor": "Low",
+    "med": "Med", "medium": "Med", "moderate": "Med",
+    "crit": "Crit", "critical": "Crit", "high": "Crit", "severe": "Crit",
+}
+
+def normalize_severity(value) -> Optional[str]:
+    """'Critical', '[Crit]', 'HIGH' -> 'Crit'. Returns None for anything unrecognized."""
+    word = re.sub(r"[^a-z]", " ", str(value or "").lower()).split()
+    return SEVERITY_ALIASES.get(word[0]) if word else None
+
+def _clean_cell(value) -> str:
+    """Strips Markdown emphasis and placeholder brackets from a table cell."""
+    return re.sub(r"[*_`]", "", str(value or "")).strip().strip("[]").strip()
+
+def _row_from_dict(item: dict) -> DefectRow:
+    return DefectRow(
+        zone=_clean_cell(item.get("zone")),
+        anomaly=_clean_cell(item.get("anomaly")),
+        severity=normalize_severity(item.get("severity")),
+        rejection_criteria=_clean_cell(item.get("rejection_criteria"))
+    )
+
+def _status(value) -> Optional[str]:
+    value = str(value or "").strip().upper()
+    return value if value in ("PASS", "FAIL") else None
+
+def parse_markdown_report(content: str) -> Optional[DefectReport]:
+    """
+    Fallback parser for answers without a JSON block: reads the "QA Status" line and the
+    first Markdown table (Zone | Anomaly | Severity | Rejection Criteria).
+    Returns None if neither is present.
+    """
+    status_match = QA_STATUS_LINE.search(content)
+    rows = []
+    in_table = False
+    for line in content.splitlines():
+        line = line.strip()
+        if not line.startswith("|"):
+            if in_table:
+                break  # Only the first table is the Defect Log
+            continue
+        if TABLE_SEPARATOR.match(line):
+            in_table = True
+            continue
+        if not in_table:
+            continue  # Header row
+        cells = [_clean_cell(c) for c in line.strip("|").split("|")]
+        if len(cells) >= 3 and any(cells):
+            cells += [""] * (4 - len(cells))
+            rows.append(DefectRow(zone=cells[0], anomaly=cells[1],
+                                  severity=normalize_severity(cells[2]), rejection_criteria=cells[3]))
+
+    if not status_match and not rows:
+        return None
+    return DefectReport(qa_status=status_match.group(1).upper() if status_match else None,
+                        defects=rows, source="markdown")
+
+def extract_defect_report(content: str) -> Tuple[str, Optional[DefectReport]]:
+    """
+    Splits an answer into (Markdown to display, structured report).
+
+    The JSON block requested by STRUCTURED_OUTPUT_PROMPT is removed from the displayed text,
+    so the chat, the stored history and the PDF show only the Markdown report.
+    If the block is missing or invalid, the Markdown table is parsed instead.
+    """
+    matches = list(JSON_BLOCK.finditer(content))
+    if matches:
+        match = matches[-1]
+        display = (content[:match.start()] + content[match.end():]).strip()
+        try:
+            data = json.loads(match.group(1))
+            report = DefectReport(
+                qa_status=_status(data.get("qa_status")),
+                defects=[_row_from_dict(d) for d in data.get("defects") or [] if isinstance(d, dict)],
+                source="json"
+            )
+            return display, report
+        except (ValueError, AttributeError):
+            return display, parse_markdown_report(display)
+    return content, parse_markdown_report(content)
+
+def strip_partial_json(text: str) -> str:
+    """Hides a JSON block that is still streaming in, so the operator only sees the Markdown while typing."""
+    index = text.lower().find("```json")
+    return text[:index] if index != -1 else text
+
+def backfill(batch_size: int = 500) -> int:
+    """
+    Parses answers saved before structured extraction existed (Markdown table fallback)
+    and stores their defects. Only sessions of the structured protocols (Defect Inspection)
+    are read. Returns how many answers produced a report.
+    """
+    init_db()
+    found = 0
+    after_id = 0
+    while True:
+        messages = get_unparsed_assistant_messages(after_id, batch_size, sorted(STRUCTURED_PROTOCOLS))
+        if not messages:
+            return found
+        reports = []
+        for msg in messages:
+            _, report = extract_defect_report(msg["content"] or "")
+            if report:
+                reports.append({"session_id": msg["session_id"], "message_id": msg["id"],
+                                "timestamp": msg["timestamp"], "report": report.model_dump()})
+        save_defect_reports(reports)
+        found += len(reports)
+        after_id = messages[-1]["id"]
+
+def main():
+    """
+    Command line entry point.
+
+    Example:
+        python -m backend.defects --backfill
+    """
+    parser = argparse.ArgumentParser(description="DiagnostiQ defect extraction")
+    parser.add_argument("--backfill", action="store_true", help="Extract defects from previously saved answers")
+    args = parser.parse_args()
+    if args.backfill:
+        print(f"Extracted defect reports from {backfill()} answers")
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
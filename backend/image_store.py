@@ -0,0 +1,103 @@
+import io  # Treats the uploaded bytes like a file for Pillow
+import os  # Paths, existence checks and atomic renames
+import tempfile  # Temporary files for atomic (all-or-nothing) writes
+from PIL import Image, ImageOps  # Pillow: thumbnail generation
+from config.settings import settings  # Assets folder and thumbnail size
+from backend.schemas import StoredImage  # Result of storing an image
+from backend.utils import image_content_hash, image_cache, _sniff_mime_type  # Hashing + prepared-image cache
+from backend.database import image_files_lock, retain_image, update_session_image  # Reference counting
+from backend.timing import timed  # Per-call latency histograms (debug panel)
+
+# File extension for each stored MIME type (the original format is kept, never converted)
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+}
+
+def _store_dirs(assets_dir: str = None):
+    """Returns (images folder, thumbnails folder) inside the assets folder, creating them if needed."""
+    root = os.path.join(assets_dir or settings.ASSETS_DIR, "store")
+    thumbs = os.path.join(root, "thumbs")
+    os.makedirs(thumbs, exist_ok=True)
+    return root, thumbs
+
+def _write_once(path: str, data: bytes):
+    """
+    Writes a file only if it does not exist yet.
+    The content is written to a temporary file first and then renamed, so readers never
+    see a half-written image.
+    """
+    if os.path.exists(path):
+        return
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def make_thumbnail(raw: bytes):
+    """
+    Shrinks an image to settings.THUMBNAIL_MAX_EDGE for on-screen display (JPEG bytes).
+    Returns None if Pillow cannot decode the image.
+    """
+    try:
+        img = ImageOps.exif_transpose(Image.open(io.BytesIO(raw)))
+        img.thumbnail((settings.THUMBNAIL_MAX_EDGE, settings.THUMBNAIL_MAX_EDGE))
+        buffer = io.BytesIO()
+        img.convert("RGB").save(buffer, format="JPEG", quality=80, optimize=True)
+        return buffer.getvalue()
+    except Exception:
+        return None
+
+@timed()
+def store_image(raw: bytes, assets_dir: str = None) -> StoredImage:
+    """
+    Saves an image into the content-addressed store: the file is named after the SHA-256 of its bytes,
+    so the same photo is stored once however many sessions use it, and re-uploading it writes nothing.
+
+    One reference is taken for the caller, in the same locked step as the write, so the file cannot be
+    released by another session before the caller links it (update_session_image / save_batch_results
+    take the reference over; release_images gives it back if the link never happens).
+    """
+    content_hash = image_content_hash(raw)
+    root, thumbs = _store_dirs(assets_dir)
+    path = os.path.join(root, content_hash + EXTENSIONS[_sniff_mime_type(raw)])
+    thumb_path = os.path.join(thumbs, content_hash + ".jpg")
+
+    with image_files_lock:
+        _write_once(path, raw)
+        if not os.path.exists(thumb_path):
+            thumb = make_thumbnail(raw)
+            if thumb:
+                _write_once(thumb_path, thumb)
+            else:
+                thumb_path = None
+        retain_image(content_hash, path, thumb_path, len(raw))
+
+    # The prepared-image cache can now find this file's payload without re-reading it
+    image_cache.remember_path(path, content_hash)
+    return StoredImage(hash=content_hash, path=path, thumb_path=thumb_path, size_bytes=len(raw))
+
+def attach_image(session_id: str, raw: bytes, assets_dir: str = None) -> StoredImage:
+    """
+    Stores an uploaded image and makes it the session's image.
+    The session's previous image is released (and deleted once no session uses it).
+    """
+    # Held across both steps, so the files can't be released by another session in between
+    with image_files_lock:
+        stored = store_image(raw, assets_dir)
+        update_session_image(session_id, stored.path, stored.hash, stored.thumb_path, stored.size_bytes)
+    return stored
+
+def thumbnail_for(image_path: str) -> str:
+    """
+    Returns the display-size thumbnail of a stored image, or the image itself
+    for images saved before the store existed (which have no thumbnail).
+    """
+    folder, file_name = os.path.split(image_path)
+    thumb_path = os.path.join(folder, "thumbs", os.path.splitext(file_name)[0] + ".jpg")
+    return thumb_path if os.path.exists(thumb_path) else image_path
@@ -0,0 +1,348 @@
+import os  # Process id (job ownership)
+import socket  # Host name (job ownership)
+import threading  # Cancel flags and the registry lock
+import time  # Finished-job retention
+import uuid  # Job IDs
+from concurrent.futures import ThreadPoolExecutor  # The process-wide job workers
+from datetime import datetime, timezone  # started_at / finished_at timestamps
+from typing import Callable, Dict, List, Optional  # Type hinting
+from config.settings import settings  # Worker count and whether answers are streamed
+from backend.api_client import chat_with_industrial_ai  # The analysis itself
+from backend.database import init_db, save_job, get_jobs, fail_jobs, submit_turn, submit_audit  # Job rows + the saved turns
+from backend.defects import extract_defect_report  # Structured defect rows from Defect Inspection answers
+from backend.schemas import PROMPTS, ChatResponse, build_system_prompt, is_cacheable, wants_structured_output  # Full audit personas
+from backend.utils import get_prepared_image  # Prepares the audited image once for all personas
+
+# --- BACKGROUND ANALYSIS JOBS ---
+# A question used to be answered inside the Streamlit script (under st.spinner), so the script
+# thread was blocked for the whole generation: a sidebar click either waited or killed the run,
+# and nothing could be cancelled. Analyses now run as jobs on a process-wide thread pool:
+# - submit_analysis() returns at once with a Job (id, status, the text streamed so far).
+# - The status is persisted in the 'jobs' table, so it is visible from any rerun, session or process.
+# - cancel() stops a job: the streamed HTTP response is closed at the next token, which aborts
+#   the upstream request (the provider stops generating once the connection is gone).
+#   There is no token to stop at while waiting for the first one (time to first token), nor at all
+#   with QUBRID_STREAM=false: the request then runs to its end, and its answer is discarded.
+# - When the answer is complete, the turn (question + answer) is saved before the job is marked done.
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# Finished jobs stay in memory this long (seconds), so the UI can show how they ended
+FINISHED_RETENTION = 600
+
+# Identifies this app process in the jobs table
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+class JobCancelled(Exception):
+    """Raised from the streaming callback to abort a job's upstream request."""
+
+class Job:
+    """Live state of one analysis (the database row holds the same fields minus the streamed text)."""
+
+    def __init__(self, session_id: str, question: str, protocol: str = ""):
+        self.id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.question = question
+        self.protocol = protocol
+        self.status = QUEUED
+        self.error = None
+        self.parts = []  # Streamed text so far (appended by the worker, read by the UI)
+        self.usage = None
+        self.question_message_id = None
+        self.answer_message_id = None
+        self.started_at = None
+        self.finished_at = None
+        self.finished_monotonic = None
+        self.cancel_requested = threading.Event()
+        self.on_cancel = None  # Also called by cancel(), for an answer produced outside this job (a speculation)
+        self.audit = None  # The Audit this job belongs to (None for an ordinary question)
+        self.defect_report = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+    def to_row(self) -> Dict:
+        return {
+            "id": self.id, "session_id": self.session_id, "question": self.question, "protocol": self.protocol,
+            "status": self.status, "error": self.error, "owner": OWNER,
+            "question_message_id": self.question_message_id, "answer_message_id": self.answer_message_id,
+            "started_at": self.started_at, "finished_at": self.finished_at,
+        }
+
+_executor = None
+_jobs: Dict[str, Job] = {}
+_lock = threading.Lock()
+
+def _reset_after_fork():
+    # A forked worker process (service.py --processes N) owns its own jobs and starts its own pool
+    global OWNER, _executor, _jobs, _lock
+    OWNER = f"{socket.gethostname()}:{os.getpid()}"
+    _executor = None
+    _jobs = {}
+    _lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _now() -> str:
+    # Same format as SQLite's CURRENT_TIMESTAMP (UTC)
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Creates the worker pool on first use, after failing the jobs that dead app processes left behind."""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                init_db()
+                _fail_orphaned_jobs()
+                _executor = ThreadPoolExecutor(max_workers=settings.JOB_WORKERS, thread_name_prefix="analysis-job")
+    return _executor
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
+
+def _fail_orphaned_jobs():
+    """Jobs still 'queued'/'running' whose process (on this host) no longer exists will never finish."""
+    host = socket.gethostname()
+    orphaned = []
+    for row in get_jobs(statuses=list(ACTIVE_STATUSES), limit=10000):
+        owner_host, _, pid = (row["owner"] or "").rpartition(":")
+        if row["owner"] == OWNER or owner_host != host or not pid.isdigit():
+            continue
+        if not _process_alive(int(pid)):
+            orphaned.append(row["id"])
+    fail_jobs(orphaned, "Interrupted: the app process stopped before the analysis finished.")
+
+def _finish(job: Job, status: str, error: str = None):
+    job.status = status
+    job.error = error
+    job.finished_at = _now()
+    job.finished_monotonic = time.monotonic()
+    save_job(job.to_row())
+
+def _save_failed(job: Job, status: str, error: str = None):
+    """Records a job that got no answer. The question is still saved, as the interactive path always did."""
+    try:
+        if status == FAILED:
+            job.question_message_id, _ = submit_turn(job.session_id, job.question).result()
+    finally:
+        _finish(job, status, error)
+
+def _ask_model(job: Job, image, chat_history: list, system_prompt: str, cacheable: bool):
+    """
+    The usual source of a job's answer: a model call (see _run's 'answer' argument), streamed unless
+    QUBRID_STREAM=false, in which case the whole answer appears at once and cancel() only takes
+    effect when the call returns.
+    """
+    return lambda on_token: chat_with_industrial_ai(
+        current_question=job.question,
+        image_file=image,
+        chat_history=chat_history,
+        system_prompt=system_prompt,
+        on_token=on_token if settings.STREAM_RESPONSES else None,
+        cacheable=cacheable
+    )
+
+def _run(job: Job, answer: Callable[[Callable[[str], None]], ChatResponse]):
+    """
+    Worker body: stream the answer into job.parts, save the turn, then record how the job ended.
+    'answer(on_token)' produces the ChatResponse, calling on_token with each piece of text.
+    """
+    if job.cancel_requested.is_set():
+        if job.audit:
+            job.audit.member_finished(job, CANCELLED)
+        else:
+            _finish(job, CANCELLED)
+        return
+
+    job.status = RUNNING
+    job.started_at = _now()
+    save_job(job.to_row())
+
+    def on_token(delta: str):
+        # Raising here unwinds the SSE loop, which closes the response (and the upstream request)
+        if job.cancel_requested.is_set():
+            raise JobCancelled()
+        job.parts.append(delta)
+
+    try:
+        if job.cancel_requested.is_set():
+            raise JobCancelled()  # Cancelled while being marked running: don't send the request at all
+        response = answer(on_token)
+        if job.cancel_requested.is_set():
+            raise JobCancelled()  # Cancelled before any token arrived (or not streamed): drop the answer
+    except Exception as e:
+        status, error = (CANCELLED, None) if job.cancel_requested.is_set() else (FAILED, str(e))
+        if job.audit:
+            job.audit.member_finished(job, status, error)
+        else:
+            _save_failed(job, status, error)
+        return
+
+    # Split off the structured defect data (the JSON block is not shown or stored as text).
+    # Only protocols asked for a Defect Log are parsed: a table in any other answer is not a defect list.
+    answer, defect_report = response.content, None
+    if wants_structured_output(job.protocol):
+        answer, defect_report = extract_defect_report(response.content)
+    job.parts = [answer]
+    job.usage = response.usage.model_dump()
+    if job.audit:
+        job.defect_report = defect_report.model_dump() if defect_report else None
+        job.audit.member_finished(job, DONE)
+        return
+    try:
+        # Wait for the commit, so "done" always means the answer is in the session history
+        job.question_message_id, job.answer_message_id = submit_turn(
+            job.session_id, job.question, answer, job.usage,
+            defect_report.model_dump() if defect_report else None
+        ).result()
+    except Exception as e:
+        _finish(job, FAILED, f"The answer could not be saved: {e}")
+        return
+    _finish(job, DONE)
+
+def submit_analysis(session_id: str, question: str, image, chat_history: list, system_prompt: str,
+                    protocol: str = "", cacheable: bool = False) -> Job:
+    """
+    Starts an analysis in the background and returns its Job immediately.
+    'chat_history' is copied, so the caller may keep changing its own list.
+    """
+    executor = _get_executor()
+    job = Job(session_id, question, protocol)
+    with _lock:
+        _forget_old_jobs()
+        _jobs[job.id] = job
+    save_job(job.to_row())
+    executor.submit(_run, job, _ask_model(job, image, list(chat_history), system_prompt, cacheable))
+    return job
+
+def submit_speculated(session_id: str, question: str, speculation, protocol: str = "") -> Job:
+    """
+    Starts a job whose answer is an adopted speculative pre-analysis (see backend/speculative.py)
+    instead of a new model call: the text generated so far is replayed at once, the rest follows live.
+    """
+    executor = _get_executor()
+    job = Job(session_id, question, protocol)
+    with _lock:
+        _forget_old_jobs()
+        _jobs[job.id] = job
+    job.on_cancel = speculation.cancel  # Cancelling the job aborts the speculation's request
+    save_job(job.to_row())
+    executor.submit(_run, job, speculation.follow)
+    return job
+
+# --- FULL AUDIT ---
+# One click runs every PROMPTS persona on the same image at once (one job each, on the same pool),
+# so the wait is that of the slowest persona instead of the sum of all three. The answers are
+# saved together when the last one ends: one question message, then one answer per protocol.
+
+AUDIT_QUESTION = "FULL AUDIT: " + " · ".join(PROMPTS)  # Shown and saved as the turn's question
+PROTOCOL_QUESTION = "Run the {protocol} protocol on this image."  # What each persona is asked
+
+class Audit:
+    """A group of jobs (one per protocol) whose answers are saved in a single transaction."""
+
+    def __init__(self, session_id: str, protocols: List[str]):
+        self.id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.question = AUDIT_QUESTION
+        self.jobs = {protocol: Job(session_id, PROTOCOL_QUESTION.format(protocol=protocol), protocol)
+                     for protocol in protocols}
+        self._outcomes = {}  # job id -> (status, error), filled in as the members end
+        self._lock = threading.Lock()
+        for job in self.jobs.values():
+            job.audit = self
+
+    def member_finished(self, job: Job, status: str, error: str = None):
+        """Called by each member's worker when its model call ends; the last one saves the whole audit."""
+        with self._lock:
+            self._outcomes[job.id] = (status, error)
+            if len(self._outcomes) < len(self.jobs):
+                return
+        answered = [j for j in self.jobs.values() if self._outcomes[j.id][0] == DONE]
+        if all(status == CANCELLED for status, _ in self._outcomes.values()):
+            for j in self.jobs.values():
+                _finish(j, CANCELLED)  # Nothing to save, as for a cancelled question
+            return
+        try:
+            question_id, answer_ids = submit_audit(self.session_id, self.question, [
+                {"content": f"**[{j.protocol.upper()}]**\n\n{j.text}", "usage": j.usage, "defect_report": j.defect_report}
+                for j in answered
+            ]).result()
+        except Exception as e:
+            for j in self.jobs.values():
+                _finish(j, FAILED, f"The audit could not be saved: {e}")
+            return
+        for j in self.jobs.values():
+            j.question_message_id = question_id
+        for j, answer_id in zip(answered, answer_ids):
+            j.answer_message_id = answer_id
+        for j in self.jobs.values():
+            _finish(j, *self._outcomes[j.id])
+
+    def outcome(self, job: Job) -> tuple:
+        """(status, error) of a member whose model call has ended, else (None, None). Set before the audit is saved."""
+        return self._outcomes.get(job.id, (None, None))
+
+    def cancel(self):
+        for job in self.jobs.values():
+            cancel(job.id)
+
+def submit_full_audit(session_id: str, image, chat_history: list, user_requirements: str = "") -> Audit:
+    """
+    Starts one analysis per PROMPTS persona on 'image' and returns their Audit immediately.
+    The image is prepared once here, so every persona sends the very same payload.
+    """
+    executor = _get_executor()
+    prepared = get_prepared_image(image)
+    audit = Audit(session_id, list(PROMPTS))
+    with _lock:
+        _forget_old_jobs()
+        _jobs.update((job.id, job) for job in audit.jobs.values())
+    for protocol, job in audit.jobs.items():
+        save_job(job.to_row())
+        system_prompt = build_system_prompt(PROMPTS[protocol], user_requirements, structured=wants_structured_output(protocol))
+        executor.submit(_run, job, _ask_model(job, prepared, list(chat_history), system_prompt, is_cacheable(protocol)))
+    return audit
+
+def cancel(job_id: str) -> bool:
+    """Requests cancellation. Returns False if the job is unknown here or already finished."""
+    job = _jobs.get(job_id)
+    if job is None or not job.active:
+        return False
+    job.cancel_requested.set()
+    if job.on_cancel:
+        job.on_cancel()
+    return True
+
+def get_job(job_id: str) -> Optional[Job]:
+    """A job started by this process (kept until FINISHED_RETENTION after it ends)."""
+    return _jobs.get(job_id)
+
+def count_active_jobs() -> int:
+    """How many of this process's jobs are queued or running (the service's backpressure measure)."""
+    with _lock:
+        return sum(1 for job in _jobs.values() if job.active)
+
+def get_session_jobs(session_id: str) -> List[Job]:
+    """This process's jobs for a session, oldest first (active ones and recently finished ones)."""
+    with _lock:
+        return [job for job in _jobs.values() if job.session_id == session_id]  # Dicts keep insertion order
+
+def _forget_old_jobs():
+    """Drops finished jobs older than FINISHED_RETENTION from memory (their rows stay in SQLite). Caller holds _lock."""
+    cutoff = time.monotonic() - FINISHED_RETENTION
+    for job_id in [j.id for j in _jobs.values() if j.finished_monotonic and j.finished_monotonic < cutoff]:
+        del _jobs[job_id]
@@ -0,0 +1,270 @@
+import bisect  # Finds the histogram bucket of an observation
+import threading  # Locks for the metric values + the exporter thread
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # The /metrics endpoint
+from typing import Callable, Dict, List, Sequence, Tuple  # Type hinting
+from config.settings import settings  # Exporter host/port
+from backend import timing  # Stage timings (database.* stages become SQLite latency histograms)
+from backend import response_cache  # Answer cache hit/miss counters
+from backend.utils import image_cache  # Prepared-image cache hit/miss counters
+
+# --- METRIC TYPES ---
+# A minimal implementation of the Prometheus data model (counters, histograms and gauges read at
+# scrape time), rendered in the text exposition format. Recording a value is one dict update
+# under a lock, cheap enough for the chat_with_industrial_ai and database hot paths.
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """A value that only goes up (requests, errors, tokens), optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class Histogram:
+    """Counts observations (seconds, bytes) into cumulative buckets, plus their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, list] = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)  # First bucket with upper bound >= value
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(float(bound))
+                labels = _format_labels(self.labelnames, key, extra='le="%s"' % le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class CallbackMetric:
+    """
+    A value read from elsewhere at scrape time (cache counters kept by their own modules).
+    'read' returns {label values tuple: value}.
+    """
+
+    def __init__(self, kind: str, name: str, documentation: str, labelnames: Sequence[str],
+                 read: Callable[[], Dict[Tuple, float]]):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.read = read
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self.read().items())]
+
+class Registry:
+    """The set of metrics served on /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# --- APPLICATION METRICS ---
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 10)
+IMAGE_BYTES_BUCKETS = (32 * 1024, 64 * 1024, 128 * 1024, 256 * 1024, 512 * 1024, 1024 * 1024, 2 * 1024 * 1024)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+API_REQUESTS = REGISTRY.register(Counter(
+    "diagnostiq_api_requests_total", "Analyses requested from the model, by delivery mode and result (ok, cached, error).",
+    ["mode", "result"]))
+API_ERRORS = REGISTRY.register(Counter(
+    "diagnostiq_api_errors_total", "Failed upstream attempts (including retried ones), by HTTP status, 'connection' or 'timeout'.",
+    ["status"]))
+API_LATENCY = REGISTRY.register(Histogram(
+    "diagnostiq_api_latency_seconds", "Upstream answer latency (request sent to last token), retries included.",
+    LATENCY_BUCKETS, ["mode"]))
+API_TTFT = REGISTRY.register(Histogram(
+    "diagnostiq_api_ttft_seconds", "Time to the first streamed token.", TTFT_BUCKETS))
+API_TOKENS = REGISTRY.register(Counter(
+    "diagnostiq_api_tokens_total", "Tokens billed by the model, by direction (prompt = in, completion = out).",
+    ["direction"]))
+API_IMAGE_BYTES = REGISTRY.register(Histogram(
+    "diagnostiq_api_image_bytes", "Size of the image payload sent with each analysis (after preprocessing).",
+    IMAGE_BYTES_BUCKETS))
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    "diagnostiq_db_query_seconds", "Duration of backend.database operations (SQLite), by function.",
+    DB_BUCKETS, ["operation"]))
+SPECULATIVE = REGISTRY.register(Counter(
+    "diagnostiq_speculative_analyses_total", "Speculative pre-analyses on upload, by outcome (started, adopted, discarded).",
+    ["result"]))
+SPECULATIVE_WASTED_TOKENS = REGISTRY.register(Counter(
+    "diagnostiq_speculative_wasted_tokens_total", "Tokens billed for speculative pre-analyses that were discarded.",
+    ["direction"]))
+
+def _cache_counts() -> Dict[Tuple, float]:
+    response_stats = response_cache.get_stats()
+    return {
+        ("response", "hit"): response_stats["hits"],
+        ("response", "miss"): response_stats["misses"],
+        ("image", "hit"): image_cache.hits,
+        ("image", "miss"): image_cache.misses,
+    }
+
+def _cache_hit_ratios() -> Dict[Tuple, float]:
+    counts = _cache_counts()
+    ratios = {}
+    for cache in ("response", "image"):
+        lookups = counts[(cache, "hit")] + counts[(cache, "miss")]
+        ratios[(cache,)] = round(counts[(cache, "hit")] / lookups, 4) if lookups else 0.0
+    return ratios
+
+REGISTRY.register(CallbackMetric(
+    "counter", "diagnostiq_cache_lookups_total", "Cache lookups by cache (response, image) and result (hit, miss).",
+    ["cache", "result"], _cache_counts))
+REGISTRY.register(CallbackMetric(
+    "gauge", "diagnostiq_cache_hit_ratio", "Share of cache lookups that were hits since the process started.",
+    ["cache"], _cache_hit_ratios))
+
+# --- RECORDING HELPERS (called from backend.api_client) ---
+
+def _mode(stream: bool) -> str:
+    return "stream" if stream else "blocking"
+
+def observe_answer(usage, stream: bool):
+    """Records one successful model answer from its UsageMetrics."""
+    API_REQUESTS.inc(mode=_mode(stream), result="ok")
+    API_LATENCY.observe(usage.latency, mode=_mode(stream))
+    if usage.ttft:
+        API_TTFT.observe(usage.ttft)
+    API_TOKENS.inc(usage.prompt_tokens, direction="prompt")
+    API_TOKENS.inc(usage.completion_tokens, direction="completion")
+    if usage.image_bytes:
+        API_IMAGE_BYTES.observe(usage.image_bytes)
+
+def observe_cached(stream: bool):
+    """Records an analysis answered from the response cache (no upstream call)."""
+    API_REQUESTS.inc(mode=_mode(stream), result="cached")
+
+def observe_failure(stream: bool):
+    """Records an analysis that failed after all retries."""
+    API_REQUESTS.inc(mode=_mode(stream), result="error")
+
+def observe_upstream_error(status):
+    """Records one failed upstream attempt: an HTTP status code, 'connection' or 'timeout'."""
+    API_ERRORS.inc(status=str(status))
+
+def observe_speculation(result: str):
+    """Records a speculative pre-analysis being started, adopted or discarded (backend.speculative)."""
+    SPECULATIVE.inc(result=result)
+
+def observe_speculation_waste(usage):
+    """Records the tokens of a discarded speculative pre-analysis (its UsageMetrics)."""
+    SPECULATIVE_WASTED_TOKENS.inc(usage.prompt_tokens, direction="prompt")
+    SPECULATIVE_WASTED_TOKENS.inc(usage.completion_tokens, direction="completion")
+
+def _observe_stage(name: str, ms: float):
+    # Every backend.database function decorated with @timed() reports as 'database.<function>'
+    if name.startswith("database."):
+        DB_QUERY_SECONDS.observe(ms / 1000, operation=name[len("database."):])
+
+timing.add_observer(_observe_stage)
+
+# --- EXPORTER ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves GET /metrics in the Prometheus text format."""
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per scrape would flood the app log
+
+_server = None
+_server_attempted = False  # A failed start (port taken) is not retried on every rerun
+_server_lock = threading.Lock()
+
+def start_metrics_server(host: str = None, port: int = None):
+    """
+    Starts the /metrics endpoint in a background thread (once per process; later calls are no-ops).
+    Returns the server, or None if the exporter is disabled (METRICS_PORT=0) or the port is taken
+    (e.g. a second app process on the same machine).
+    """
+    global _server, _server_attempted
+    port = settings.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    with _server_lock:
+        if not _server_attempted:
+            _server_attempted = True
+            try:
+                _server = ThreadingHTTPServer((host or settings.METRICS_HOST, port), _MetricsHandler)
+            except OSError as e:
+                print(f"Metrics exporter not started on port {port}: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return _server
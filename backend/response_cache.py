@@ -0,0 +1,71 @@
+import hashlib  # Builds the cache key (SHA-256 of the request)
+import json  # Serializes the request payload in a stable (sorted) form before hashing
+import threading  # Protects the hit/miss counters shared by every Streamlit thread
+import time  # Timestamps for TTL expiry and LRU eviction
+from typing import Optional  # Type hinting
+from config.settings import settings  # TTL and size limits
+from backend.database import init_db, get_cached_response, put_cached_response, evict_response_cache
+from backend.schemas import ChatResponse, UsageMetrics  # The cached answer is returned in the usual shape
+
+# Payload fields that change how the answer is delivered, not what it says (excluded from the key)
+_TRANSPORT_FIELDS = ("stream", "stream_options")
+
+# How many new entries are stored between two eviction passes
+EVICT_EVERY = 50
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0}
+
+def cache_key(payload: dict) -> str:
+    """
+    Hashes everything that determines the answer: model, system prompt, history, question,
+    image bytes (embedded as a data: URL) and generation parameters (temperature, max_tokens).
+    Streaming and non-streaming calls for the same question share one key.
+    """
+    keyed = {k: v for k, v in payload.items() if k not in _TRANSPORT_FIELDS}
+    raw = json.dumps(keyed, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+def lookup(key: str) -> Optional[ChatResponse]:
+    """Returns the cached answer for 'key' (marked usage.cached=True), or None on a miss."""
+    init_db()
+    now = time.time()
+    row = get_cached_response(key, now - settings.RESPONSE_CACHE_TTL, now)
+    if row is None:
+        _count("misses")
+        return None
+
+    _count("hits")
+    content, usage = row
+    # The original token counts are kept (what the answer cost), but no time was spent on it now
+    metrics = UsageMetrics(**(usage or {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}))
+    metrics.latency = 0.0
+    metrics.throughput = 0.0
+    metrics.ttft = 0.0
+    metrics.decode_tps = 0.0
+    metrics.cached = True
+    return ChatResponse(content=content, usage=metrics)
+
+def store(key: str, response: ChatResponse):
+    """Saves a fresh answer, running an eviction pass every EVICT_EVERY stores."""
+    init_db()
+    now = time.time()
+    put_cached_response(key, response.content, response.usage.model_dump() if response.usage else None, now)
+
+    with _stats_lock:
+        _stats["stores"] += 1
+        run_eviction = _stats["stores"] % EVICT_EVERY == 0
+    if run_eviction:
+        evict_response_cache(now - settings.RESPONSE_CACHE_TTL, settings.RESPONSE_CACHE_MAX_BYTES)
+
+def get_stats() -> dict:
+    """Hit/miss counters for this process, plus the hit rate (0.0 - 1.0)."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    return stats
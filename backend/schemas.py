@@ -1,5 +1,6 @@
 from pydantic import BaseModel  # Library for defining strict data structures
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable
+from config.settings import settings  # Feature switches (e.g. structured defect extraction)
 
 # --- GLOBAL GUARDRAIL (THE "IDENTITY" PROMPT) ---
 # This is the most critical part of the AI's instruction set.
@@ -78,6 +79,51 @@ PROMPTS = {
     """
 }
 
+# --- RESPONSE CACHE OPT-IN ---
+# Answers are generated at temperature 0.6, so asking twice can give slightly different wording.
+# For these protocols a repeated identical question on the same image returns the stored answer instead
+# of a new model call. Safety Audit is excluded so every audit is a fresh, independent review.
+CACHEABLE_PROTOCOLS = {
+    "General Analysis": True,
+    "Defect Inspection": True,
+    "Safety Audit": False,
+}
+
+def is_cacheable(protocol: str) -> bool:
+    """True if answers for this protocol (a PROMPTS key) may be served from the response cache."""
+    return CACHEABLE_PROTOCOLS.get(protocol, False)
+
+# --- STRUCTURED OUTPUT (DEFECT EXTRACTION) ---
+# For these protocols the AI is also asked for a machine-readable copy of its verdict and Defect Log,
+# which backend/defects.py parses into the 'defects' table. The Markdown answer is unchanged.
+STRUCTURED_PROTOCOLS = {"Defect Inspection"}
+
+STRUCTURED_OUTPUT_PROMPT = """
+    STRUCTURED OUTPUT:
+    After the Markdown report, append ONE fenced ```json code block with exactly this shape:
+    {"qa_status": "PASS" or "FAIL",
+     "defects": [{"zone": "...", "anomaly": "...", "severity": "Low" | "Med" | "Crit", "rejection_criteria": "..."}]}
+    Use one entry per row of the Defect Log and an empty list if there are no defects.
+    Do not write anything after the JSON block.
+"""
+
+def wants_structured_output(protocol: str) -> bool:
+    """True if answers for this protocol (a PROMPTS key) should carry the structured JSON block."""
+    return settings.STRUCTURED_DEFECTS and protocol in STRUCTURED_PROTOCOLS
+
+def build_system_prompt(base_instruction: str, user_requirements: str = "", structured: bool = False) -> str:
+    """
+    Constructs the "Super Prompt" sent as the system message.
+    Combine: Persona (from PROMPTS) + Global Guardrails + optional Operator Instructions
+    (+ the structured-output instruction when 'structured' is True).
+    """
+    final_system_prompt = f"{base_instruction}\n\n{GUARDRAIL_PROMPT}"
+    if structured:
+        final_system_prompt += f"\n{STRUCTURED_OUTPUT_PROMPT}"
+    if user_requirements:
+        final_system_prompt += f"\n\nADDITIONAL OPERATOR INSTRUCTIONS:\n{user_requirements}"
+    return final_system_prompt
+
 # --- DATA MODELS (PYDANTIC) ---
 # These classes define the exact "Shape" of the data moving through the app.
 # This prevents bugs where data is missing or in the wrong format.
@@ -91,6 +137,84 @@ class UsageMetrics(BaseModel):
     total_tokens: int        # Total cost (prompt + completion)
     latency: float = 0.0     # Time taken in seconds
     throughput: float = 0.0  # Speed (Tokens per second)
+    ttft: float = 0.0        # Time-To-First-Token in seconds (streaming only)
+    decode_tps: float = 0.0  # Generation speed after the first token (streaming only)
+    image_bytes: int = 0        # Size of the image actually uploaded (after preprocessing)
+    image_bytes_saved: int = 0  # How many bytes preprocessing removed from the original upload
+    cached: bool = False        # True if the answer was served from the response cache (no model call)
+    context_dropped: int = 0      # Older messages left out of the prompt to stay within the token budget
+    context_summarized: bool = False  # True if the left-out messages were replaced by a short summary
+    context_tokens_est: int = 0   # Estimated text tokens actually sent (system prompt + history + question)
+    model: str = ""               # Which model produced the answer (for per-model performance stats)
+
+class PreparedImage(BaseModel):
+    """
+    An image that has been resized/re-encoded and is ready to be embedded in an API request.
+    """
+    data: str            # The Base64 string of the (re-encoded) image
+    mime_type: str       # e.g. 'image/jpeg' or 'image/webp' (used in the data: URL)
+    original_bytes: int  # Size of the file the operator uploaded
+    prepared_bytes: int  # Size of the image after preprocessing (before Base64)
+    width: int = 0       # Final pixel width (0 if the image could not be decoded)
+    height: int = 0      # Final pixel height
+
+    @property
+    def bytes_saved(self) -> int:
+        """How many bytes preprocessing removed from the upload."""
+        return max(0, self.original_bytes - self.prepared_bytes)
+
+    @property
+    def data_url(self) -> str:
+        """The 'data:' URL format expected by the vision API."""
+        return f"data:{self.mime_type};base64,{self.data}"
+
+class StoredImage(BaseModel):
+    """
+    An image saved in the content-addressed image store (see backend/image_store.py).
+    """
+    hash: str                         # SHA-256 of the image bytes (also the file name)
+    path: str                         # The full-resolution file, in its original format
+    thumb_path: Optional[str] = None  # Display-size JPEG thumbnail (None if it could not be generated)
+    size_bytes: int = 0               # Size of the original file
+
+class DefectRow(BaseModel):
+    """
+    One line of a Defect Inspection's Defect Log.
+    """
+    zone: str = ""                # Where on the component (e.g. 'Die', 'Weld seam')
+    anomaly: str = ""             # What was found (e.g. 'Crack')
+    severity: Optional[str] = None  # Normalized to 'Low', 'Med' or 'Crit' (None if unrecognized)
+    rejection_criteria: str = ""  # The standard / rule it fails (e.g. 'ISO-9001 Fail')
+
+class DefectReport(BaseModel):
+    """
+    The structured result of one Defect Inspection answer (see backend/defects.py).
+    """
+    qa_status: Optional[str] = None  # 'PASS' / 'FAIL' (None if the answer did not state one)
+    defects: List[DefectRow] = []    # The Defect Log rows
+    source: str = "json"             # 'json' (structured block) or 'markdown' (parsed from the table)
+
+class ChatRequest(BaseModel):
+    """
+    One analysis to run, used by the concurrent fan-out helpers in api_client (chat_many).
+    Mirrors the arguments of chat_with_industrial_ai.
+    """
+    current_question: str             # The operator's question
+    image_file: Any = None            # Uploaded file, saved image path, or PreparedImage
+    chat_history: List[Dict] = []     # Previous messages ({"role", "content"})
+    system_prompt: str                # Persona + guardrails (see build_system_prompt)
+    on_token: Optional[Callable[[str], None]] = None  # Optional streaming callback
+    cacheable: bool = False           # Allow serving/storing this answer in the response cache
+
+class ContextWindow(BaseModel):
+    """
+    The conversation actually sent to the model after token budgeting (see backend/context_window.py).
+    """
+    system_prompt: str               # Persona + guardrails, plus a summary of dropped messages if any
+    messages: List[Dict]             # The recent history that fit in the budget ({"role", "content"})
+    dropped_messages: int = 0        # How many older messages were left out
+    summarized: bool = False         # True if a rolling summary replaced the dropped messages
+    estimated_tokens: int = 0        # Estimated text tokens of the final prompt
 
 class ChatResponse(BaseModel):
     """
@@ -98,4 +222,31 @@ class ChatResponse(BaseModel):
     Contains both the text answer and the performance stats.
     """
     content: str          # The actual AI text response
-    usage: UsageMetrics   # The performance stats object defined above
\ No newline at end of file
+    usage: UsageMetrics   # The performance stats object defined above
+
+class BatchItemResult(BaseModel):
+    """
+    The outcome of analyzing one image in a batch run.
+    Exactly one of 'content' (success) or 'error' (failure) is set.
+    """
+    name: str                             # Original file name (e.g. 'lot42/flange_007.jpg')
+    session_id: Optional[str] = None      # The inspection session created for this image
+    image_path: Optional[str] = None      # Where the image was saved locally
+    image: Optional[StoredImage] = None   # The image store entry (hash, thumbnail) it references
+    content: Optional[str] = None         # The AI answer
+    usage: Optional[UsageMetrics] = None  # Performance stats of the call
+    error: Optional[str] = None           # Error message if the analysis failed
+
+class BatchProgress(BaseModel):
+    """
+    A live snapshot of a running batch, passed to the progress callback after every image.
+    """
+    total: int                # Number of images in the lot
+    completed: int = 0        # Finished successfully
+    failed: int = 0           # Finished with an error
+    elapsed: float = 0.0      # Seconds since the batch started
+    throughput: float = 0.0   # Images finished per minute
+
+    @property
+    def done(self) -> int:
+        return self.completed + self.failed
@@ -0,0 +1,226 @@
+import re  # Normalizes questions before comparing them with the default intents
+import threading  # Registry lock + the condition followers wait on for new tokens
+import time  # Expiry of unclaimed speculations
+from concurrent.futures import ThreadPoolExecutor  # Runs speculations beside (not inside) the job pool
+from typing import Dict, Optional  # Type hinting
+from config.settings import settings  # Opt-in switch, worker count, expiry
+from backend.api_client import chat_with_industrial_ai  # The speculative analysis itself
+from backend.schemas import ChatResponse, UsageMetrics  # What a follower receives; estimated cost of an aborted one
+from backend.context_window import estimate_tokens  # Tokens an aborted speculation had already streamed
+from backend.jobs import PROTOCOL_QUESTION, JobCancelled  # The question asked; raised to abort a cancelled one
+from backend.batch import BATCH_QUESTION  # The other standard "analyze this" question
+from backend import metrics  # Adopted / discarded counters and the tokens discarded speculations cost
+
+# --- SPECULATIVE PRE-ANALYSIS ---
+# Almost every session starts with "analyze this" under the current protocol, so with
+# SPECULATIVE_ANALYSIS=true that analysis is started as soon as an image is uploaded, while the
+# operator is still typing. At most one speculation per session is kept:
+# - the first question is the standard protocol question (the app's "RUN <protocol>" button sends it,
+#   see is_default_intent) and nothing else
+#   changed (image, protocol, instructions, history): the speculation is adopted as that question's
+#   answer, already complete or still streaming (backend.jobs.submit_speculated),
+# - anything else: it is discarded and its request aborted at the next token (like a cancelled job),
+#   and what it cost in tokens is counted (get_stats / metrics).
+# Cancelling the job that adopted a speculation aborts the speculation's request the same way.
+# The key includes the stored image path, which is named after the content hash (backend/image_store.py),
+# so uploading the same picture again does not start a second analysis.
+
+# The standard questions the speculation answers (compared after normalize_question). Only the exact
+# default prompt texts: a typed "go", "analyze this" or "what is this?" may well expect a different answer.
+# PROTOCOL_QUESTION is added per protocol (see is_default_intent).
+DEFAULT_INTENTS = {BATCH_QUESTION}
+
+# Words that do not change the intent ("Please analyze this component ..." == "Analyze this component ...")
+_FILLER_WORDS = {"please", "pls", "can", "could", "you", "now", "for", "me", "kindly"}
+
+def normalize_question(question: str) -> str:
+    words = re.sub(r"[^a-z0-9]+", " ", question.lower()).split()
+    return " ".join(w for w in words if w not in _FILLER_WORDS)
+
+def is_default_intent(question: str, protocol: str) -> bool:
+    """True if the question is one of the default prompt texts asking for the protocol's standard analysis."""
+    defaults = DEFAULT_INTENTS | {PROTOCOL_QUESTION.format(protocol=protocol)}
+    return normalize_question(question) in {normalize_question(text) for text in defaults}
+
+class Speculation:
+    """One speculative analysis: the streamed text so far, then the response (or the error)."""
+
+    def __init__(self, key: tuple, session_id: str, question: str):
+        self.key = key  # (image path, protocol, system prompt, history length)
+        self.session_id = session_id
+        self.question = question
+        self.parts = []
+        self.response: Optional[ChatResponse] = None
+        self.error: Optional[Exception] = None
+        self.finished = threading.Event()
+        self.adopted = False
+        self.discarded = False
+        self.cost_recorded = False
+        self.cancel_requested = threading.Event()  # Set when discarded, or when the adopting job is cancelled
+        self.created_monotonic = time.monotonic()
+        self._changed = threading.Condition()
+
+    def cancel(self):
+        """Aborts the request at its next token (a no-op once it has ended)."""
+        self.cancel_requested.set()
+
+    def _on_token(self, delta: str):
+        # Raising here unwinds the SSE loop, which closes the response (and the upstream request)
+        if self.cancel_requested.is_set():
+            raise JobCancelled()
+        with self._changed:
+            self.parts.append(delta)
+            self._changed.notify_all()
+
+    def _run(self, image, chat_history: list, system_prompt: str, cacheable: bool):
+        try:
+            if self.cancel_requested.is_set():
+                raise JobCancelled()  # Discarded while it was still waiting for a worker
+            self.response = chat_with_industrial_ai(
+                current_question=self.question,
+                image_file=image,
+                chat_history=chat_history,
+                system_prompt=system_prompt,
+                on_token=self._on_token,
+                cacheable=cacheable
+            )
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._changed:
+                self.finished.set()
+                self._changed.notify_all()
+        _record_cost(self)
+
+    def follow(self, on_token) -> ChatResponse:
+        """
+        Replays the text generated so far through on_token, then keeps forwarding new text until the
+        analysis ends. Returns its response (raises its error). Used as an adopted job's answer.
+        """
+        sent = 0
+        while True:
+            with self._changed:
+                while len(self.parts) == sent and not self.finished.is_set():
+                    self._changed.wait()
+                new_parts = self.parts[sent:]
+                finished = self.finished.is_set()
+            try:
+                for delta in new_parts:
+                    on_token(delta)
+            except Exception:
+                self.cancel()  # The adopting job was cancelled: stop generating what nobody reads
+                raise
+            sent += len(new_parts)
+            if finished and sent == len(self.parts):
+                break
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+_executor = None
+_speculations: Dict[str, Speculation] = {}  # session_id -> its pending speculation
+_lock = threading.Lock()
+_stats = {"started": 0, "adopted": 0, "discarded": 0, "wasted_prompt_tokens": 0, "wasted_completion_tokens": 0}
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.SPECULATIVE_WORKERS, thread_name_prefix="speculative")
+    return _executor
+
+def _record_cost(speculation: Speculation):
+    """
+    Counts the tokens of a discarded speculation once it has ended (answers from the cache cost nothing).
+    One aborted mid-stream has no usage report: the text it had streamed is counted (an estimate;
+    its prompt tokens are unknown).
+    """
+    with _lock:
+        if not (speculation.discarded and speculation.finished.is_set()) or speculation.cost_recorded:
+            return
+        speculation.cost_recorded = True
+        usage = speculation.response.usage if speculation.response else None
+        if usage is None and speculation.parts:
+            completion_tokens = estimate_tokens("".join(speculation.parts))
+            usage = UsageMetrics(prompt_tokens=0, completion_tokens=completion_tokens, total_tokens=completion_tokens)
+        if usage is None or usage.cached:
+            return
+        _stats["wasted_prompt_tokens"] += usage.prompt_tokens
+        _stats["wasted_completion_tokens"] += usage.completion_tokens
+    metrics.observe_speculation_waste(usage)
+
+def _discard(speculation: Speculation):
+    """Caller holds _lock and has removed it from _speculations. A running one is aborted (and counted) later."""
+    speculation.discarded = True
+    speculation.cancel()
+    _stats["discarded"] += 1
+    metrics.observe_speculation("discarded")
+
+def _expire_old() -> list:
+    """Discards (and returns) the speculations nobody claimed within SPECULATIVE_TTL seconds. Caller holds _lock."""
+    cutoff = time.monotonic() - settings.SPECULATIVE_TTL
+    expired = [_speculations.pop(sid) for sid, s in list(_speculations.items()) if s.created_monotonic < cutoff]
+    for speculation in expired:
+        _discard(speculation)
+    return expired
+
+def speculate(session_id: str, image_path: str, protocol: str, system_prompt: str,
+              chat_history: list, cacheable: bool = False) -> Optional[Speculation]:
+    """
+    Starts the session's protocol analysis of a newly uploaded image in the background
+    (a no-op unless SPECULATIVE_ANALYSIS is on). Replaces the session's previous speculation,
+    unless that one was for the same image and settings.
+    """
+    if not settings.SPECULATIVE_ANALYSIS:
+        return None
+    key = (image_path, protocol, system_prompt, len(chat_history))
+    executor = _get_executor()
+    with _lock:
+        replaced = _expire_old()
+        previous = _speculations.pop(session_id, None)
+        if previous is not None and previous.key == key:
+            _speculations[session_id] = previous  # Same picture again (same content hash): keep it
+            return previous
+        if previous is not None:
+            _discard(previous)
+            replaced.append(previous)
+        speculation = Speculation(key, session_id, PROTOCOL_QUESTION.format(protocol=protocol))
+        _speculations[session_id] = speculation
+        _stats["started"] += 1
+    for old in replaced:
+        _record_cost(old)  # Counted now if it has already finished, else when it does
+    metrics.observe_speculation("started")
+    executor.submit(speculation._run, image_path, list(chat_history), system_prompt, cacheable)
+    return speculation
+
+def claim(session_id: str, question: str, image_path: str, protocol: str, system_prompt: str,
+          history_length: int) -> Optional[Speculation]:
+    """
+    Called with the session's next question. Returns the speculation if it answers that question
+    (default intent, same image/protocol/instructions/history, not failed); otherwise discards it
+    and returns None, and the question is asked as usual.
+    """
+    with _lock:
+        speculation = _speculations.pop(session_id, None)
+        if speculation is None:
+            return None
+        usable = (
+            speculation.key == (image_path, protocol, system_prompt, history_length)
+            and speculation.error is None
+            and is_default_intent(question, protocol)
+        )
+        if not usable:
+            _discard(speculation)
+        else:
+            speculation.adopted = True
+            _stats["adopted"] += 1
+    if not usable:
+        _record_cost(speculation)
+        return None
+    metrics.observe_speculation("adopted")
+    return speculation
+
+def get_stats() -> dict:
+    """Started / adopted / discarded counts and the tokens discarded speculations were billed (this process)."""
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,205 @@
+import contextvars  # Per-rerun stage list (each Streamlit session runs its script on its own thread)
+import functools  # Keeps the name/docstring of decorated functions
+import json  # Structured log lines
+import logging  # Where the per-rerun log lines go
+import os  # Profile output folder
+import sys  # sys._current_frames() for the sampling profiler
+import threading  # Lock for the shared histograms + the sampler thread
+import time  # perf_counter timing
+from collections import Counter, deque  # Folded stack counts / rolling windows
+from contextlib import contextmanager  # Context-manager timers
+from typing import Callable, Dict, List, Optional  # Type hinting
+from config.settings import settings  # Window size, logging and profiler switches
+
+# Per-rerun log lines (one JSON object each) go to this logger
+logger = logging.getLogger("diagnostiq.timing")
+
+def _configure_logger():
+    """Sends the timing lines to stderr unless the host application already routes this logger somewhere."""
+    if settings.TIMING_LOG and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+_configure_logger()
+
+class StageStats:
+    """
+    Rolling window of the last 'window' durations (milliseconds) of one stage.
+
+    Percentiles are computed from the window on demand (only when the debug panel is open),
+    so recording a sample is just an append.
+    """
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.count = 0  # All-time number of samples (the window only keeps the latest ones)
+        self.last = 0.0
+
+    def add(self, ms: float):
+        self.samples.append(ms)
+        self.count += 1
+        self.last = ms
+
+    def snapshot(self) -> Dict:
+        ordered = sorted(self.samples)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2) if ordered else 0.0
+
+        return {"count": self.count, "last_ms": round(self.last, 2), "p50_ms": pct(0.50),
+                "p95_ms": pct(0.95), "p99_ms": pct(0.99), "max_ms": round(ordered[-1], 2) if ordered else 0.0}
+
+# Process-wide histograms, shared by every operator (stage name -> StageStats)
+_stats: Dict[str, StageStats] = {}
+_stats_lock = threading.Lock()
+
+# Stages of the rerun currently executing on this thread: [(name, ms), ...] in finishing order
+_current_rerun: contextvars.ContextVar = contextvars.ContextVar("timing_rerun", default=None)
+
+# Breakdown of the most recently finished reruns (newest last), for the debug panel
+_recent_reruns = deque(maxlen=20)
+
+# Other sinks for every recorded duration, called as observer(name, ms) (e.g. backend.metrics)
+_observers: List[Callable[[str, float], None]] = []
+
+def add_observer(observer: Callable[[str, float], None]):
+    """Registers a function that receives every recorded stage duration."""
+    _observers.append(observer)
+
+def record(name: str, ms: float):
+    """Adds one duration to the stage's rolling histogram (and to the current rerun, if any)."""
+    with _stats_lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = StageStats(settings.TIMING_WINDOW)
+        stats.add(ms)
+    stages = _current_rerun.get()
+    if stages is not None:
+        stages.append((name, round(ms, 2)))
+    for observer in _observers:
+        observer(name, ms)
+
+@contextmanager
+def stage(name: str):
+    """
+    Times the enclosed block as stage 'name'.
+
+    Usage:
+        with stage("sidebar"):
+            render_sidebar()
+
+    The time is recorded even when the block raises (st.rerun() and st.stop() work by raising).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - started) * 1000)
+
+def timed(name: str = None):
+    """Decorator form of stage() for backend functions. Defaults to 'module.function'."""
+    def decorator(func):
+        label = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class StackSampler:
+    """
+    Minimal sampling profiler: a background thread records the call stack of one thread every
+    'interval' seconds. The result is in "folded" format (one 'outer;inner;leaf count' line per
+    distinct stack), which speedscope, flamegraph.pl and inferno render as a flame graph.
+
+    Unlike cProfile it does not slow down the profiled code, so it can stay armed on every rerun.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="timing-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+def _write_profile(name: str, total_ms: float, counts: Counter) -> Optional[str]:
+    """Saves a folded-stack profile to settings.PROFILE_DIR. Returns the file path."""
+    if not counts:
+        return None
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    path = os.path.join(settings.PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{int(total_ms)}ms.folded")
+    with open(path, "w") as f:
+        for stack, samples in counts.most_common():
+            f.write(f"{stack} {samples}\n")
+    return path
+
+@contextmanager
+def rerun(name: str = "rerun"):
+    """
+    Wraps one full script run (app.main): collects its stages, records the total as stage 'name',
+    writes one structured log line, and, when the run takes longer than
+    settings.PROFILE_SLOW_RERUN_MS, saves a flame profile of it.
+    """
+    stages: List = []
+    token = _current_rerun.set(stages)
+    sampler = None
+    if settings.PROFILE_SLOW_RERUN_MS > 0:
+        sampler = StackSampler(threading.get_ident(), settings.PROFILE_INTERVAL_MS / 1000).start()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        total_ms = (time.perf_counter() - started) * 1000
+        _current_rerun.reset(token)
+        record(name, total_ms)
+
+        profile_path = None
+        if sampler is not None:
+            counts = sampler.stop()
+            if total_ms >= settings.PROFILE_SLOW_RERUN_MS:
+                profile_path = _write_profile(name, total_ms, counts)
+
+        entry = {"event": name, "total_ms": round(total_ms, 2), "stages": stages, "profile": profile_path}
+        _recent_reruns.append(dict(entry, at=time.time()))
+        if settings.TIMING_LOG:
+            logger.info(json.dumps(entry))
+
+def get_stage_stats() -> Dict[str, Dict]:
+    """Snapshot of every stage's rolling histogram, slowest p95 first."""
+    with _stats_lock:
+        snapshot = {name: stats.snapshot() for name, stats in _stats.items()}
+    return dict(sorted(snapshot.items(), key=lambda item: item[1]["p95_ms"], reverse=True))
+
+def get_recent_reruns() -> List[Dict]:
+    """The breakdown of the last finished reruns, newest first."""
+    return list(reversed(_recent_reruns))
+
+def reset():
+    """Clears all histograms (the debug panel's "Reset" button)."""
+    with _stats_lock:
+        _stats.clear()
+    _recent_reruns.clear()
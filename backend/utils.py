@@ -1,5 +1,25 @@
 import base64  # Standard library to convert binary image data into text strings
+import copy  # Used to snapshot an open PDF document before finalizing it
+import io  # Used to treat bytes in memory like a file (for Pillow)
+import os  # Used to read file size / modification time for cache keys
+import hashlib  # Used to fingerprint image content for the cache
+import threading  # Protects the shared image and PDF caches from concurrent Streamlit sessions
+from collections import OrderedDict  # Remembers insertion/usage order for LRU eviction
 from fpdf import FPDF  # Lightweight library for generating PDF files programmatically
+from PIL import Image, ImageOps  # Pillow: decoding, rotating and resizing images
+from config.settings import settings  # Image size/quality limits and cache sizes
+from backend.schemas import PreparedImage  # Data model for an upload-ready image
+from backend.timing import timed  # Per-call latency histograms (debug panel)
+
+# Maps Pillow format names to the MIME types used in the API 'data:' URL
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+# EXIF tag that says how a photo must be rotated to be upright (1 = as stored)
+ORIENTATION_TAG = 0x0112
 
 def encode_image_to_base64(image_file) -> str:
     """
@@ -14,6 +34,201 @@ def encode_image_to_base64(image_file) -> str:
     # .decode('utf-8') converts those bytes into a standard string
     return base64.b64encode(image_file.getvalue()).decode('utf-8')
 
+def _sniff_mime_type(raw: bytes) -> str:
+    """
+    Guesses the MIME type from the first bytes of the file ("magic numbers").
+    Only used as a fallback when Pillow cannot decode the image.
+    """
+    if raw.startswith(b"\x89PNG"):
+        return "image/png"
+    if raw[:4] == b"RIFF" and raw[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    """Re-encodes a Pillow image into the given format and returns the bytes."""
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        # JPEG has no transparency, so RGBA / palette images must be flattened to RGB first
+        img = img.convert("RGB") if img.mode != "RGB" else img
+        img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    else:
+        img.save(buffer, format=fmt, quality=quality)
+    return buffer.getvalue()
+
+@timed()
+def prepare_image(image_file) -> PreparedImage:
+    """
+    Shrinks an uploaded image into an upload-ready payload.
+
+    Steps:
+    1. Apply the EXIF orientation (phone photos are often stored sideways with a "rotate me" tag).
+    2. Downscale so the longest edge is at most settings.IMAGE_MAX_EDGE pixels.
+    3. Re-encode to settings.IMAGE_FORMAT at settings.IMAGE_QUALITY, stepping the quality down
+       until the result fits under settings.IMAGE_MAX_BYTES.
+    4. Base64-encode and record the correct MIME type and the bytes saved.
+
+    If the re-encoded file would be bigger than the original (small, already-compressed images),
+    the original bytes are sent unchanged, as long as they are already upright (no EXIF rotation).
+    """
+    raw = image_file.getvalue()
+
+    try:
+        img = Image.open(io.BytesIO(raw))
+        original_format = (img.format or "").upper()
+        # Orientation 1 (or no tag) means the stored pixels are already upright
+        upright = img.getexif().get(ORIENTATION_TAG, 1) == 1
+        img = ImageOps.exif_transpose(img)
+    except Exception:
+        # Not something Pillow understands: send it as-is and let the API decide
+        return PreparedImage(
+            data=base64.b64encode(raw).decode('utf-8'),
+            mime_type=_sniff_mime_type(raw),
+            original_bytes=len(raw),
+            prepared_bytes=len(raw),
+        )
+
+    # 1 & 2. Orientation is fixed above; now downscale (thumbnail() keeps the aspect ratio)
+    resized = max(img.size) > settings.IMAGE_MAX_EDGE
+    if resized:
+        img.thumbnail((settings.IMAGE_MAX_EDGE, settings.IMAGE_MAX_EDGE), Image.LANCZOS)
+
+    # 3. Re-encode, lowering quality in steps of 10 until the payload fits under the cap
+    fmt = settings.IMAGE_FORMAT if settings.IMAGE_FORMAT in MIME_TYPES else "JPEG"
+    quality = settings.IMAGE_QUALITY
+    encoded = _encode(img, fmt, quality)
+    while len(encoded) > settings.IMAGE_MAX_BYTES and quality > 30:
+        quality -= 10
+        encoded = _encode(img, fmt, quality)
+
+    # Keep the original if re-encoding didn't help and nothing else had to change
+    # (a rotated photo's original bytes are still sideways: the re-encoded, upright copy is sent)
+    if (not resized and upright and len(encoded) >= len(raw) and original_format in MIME_TYPES
+            and len(raw) <= settings.IMAGE_MAX_BYTES):
+        encoded, fmt = raw, original_format
+
+    # 4. Package the result
+    return PreparedImage(
+        data=base64.b64encode(encoded).decode('utf-8'),
+        mime_type=MIME_TYPES[fmt],
+        original_bytes=len(raw),
+        prepared_bytes=len(encoded),
+        width=img.size[0],
+        height=img.size[1],
+    )
+
+class PreparedImageCache:
+    """
+    A thread-safe, size-bounded LRU cache of PreparedImage objects keyed by content hash.
+
+    Why this is needed:
+    Every chat turn sends the same image again. Without a cache, each turn re-reads the file
+    and repeats the decode/resize/Base64 work. One instance is shared by the whole process,
+    so two operators looking at the same photo also share the work.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # content hash -> PreparedImage (oldest first)
+        self._path_index = {}          # (path, mtime, size) -> content hash, to skip re-reading files
+        self._lock = threading.Lock()
+        self.hits = 0                  # Lookup counters (exported by backend.metrics)
+        self.misses = 0
+
+    def get(self, content_hash: str):
+        """Returns the cached image (and marks it as recently used), or None."""
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            if entry is not None:
+                self._entries.move_to_end(content_hash)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def put(self, content_hash: str, image: PreparedImage):
+        """Stores an image, evicting the least recently used ones if over the byte budget."""
+        size = len(image.data)
+        if size > self.max_bytes:
+            return  # Larger than the whole cache: not worth keeping
+        with self._lock:
+            if content_hash in self._entries:
+                self.current_bytes -= len(self._entries.pop(content_hash).data)
+            self._entries[content_hash] = image
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted.data)
+
+    def hash_for_path(self, path: str):
+        """Returns the content hash of a file seen before, if it hasn't changed on disk since."""
+        with self._lock:
+            return self._path_index.get(_path_key(path))
+
+    def remember_path(self, path: str, content_hash: str):
+        """Links a file path (at its current size/mtime) to the hash of its content."""
+        with self._lock:
+            self._path_index[_path_key(path)] = content_hash
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._path_index.clear()
+            self.current_bytes = 0
+
+def _path_key(path: str):
+    """A cheap identity for a file on disk: if the size or modification time changes, so does the key."""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+def image_content_hash(raw: bytes) -> str:
+    """SHA-256 fingerprint of the raw image bytes."""
+    return hashlib.sha256(raw).hexdigest()
+
+# The process-wide cache instance (shared across all Streamlit sessions)
+image_cache = PreparedImageCache(settings.IMAGE_CACHE_MAX_BYTES)
+
+@timed()
+def get_prepared_image(image_source) -> PreparedImage:
+    """
+    Returns the upload-ready version of an image, using the shared cache.
+
+    'image_source' can be:
+    - a PreparedImage (returned unchanged),
+    - a file path (str) to a saved image, or
+    - a file-like object with .getvalue() (Streamlit UploadedFile / BytesIO).
+
+    For file paths that were seen before, the file is not even re-read from disk.
+    """
+    if isinstance(image_source, PreparedImage):
+        return image_source
+
+    if isinstance(image_source, str):
+        # Fast path: same file, unchanged since last time -> no disk read, no hashing
+        known_hash = image_cache.hash_for_path(image_source)
+        if known_hash:
+            cached = image_cache.get(known_hash)
+            if cached is not None:
+                return cached
+        with open(image_source, "rb") as f:
+            raw = f.read()
+        content_hash = image_content_hash(raw)
+        image_cache.remember_path(image_source, content_hash)
+        image_file = io.BytesIO(raw)
+    else:
+        raw = image_source.getvalue()
+        content_hash = image_content_hash(raw)
+        image_file = image_source
+
+    cached = image_cache.get(content_hash)
+    if cached is not None:
+        return cached
+
+    prepared = prepare_image(image_file)
+    image_cache.put(content_hash, prepared)
+    return prepared
+
 def clean_text(text: str) -> str:
     """
     Sanitizes text to remove emojis and unsupported characters.
@@ -30,11 +245,8 @@ def clean_text(text: str) -> str:
     # 3. Decode back: Convert bytes back to a Python string safe for PDF generation.
     return text.encode('latin-1', 'replace').decode('latin-1')
 
-def generate_pdf_report(chat_history):
-    """
-    Generates a professional PDF report from the chat history list.
-    Returns the raw PDF bytes to be downloaded by the user.
-    """
+def _start_pdf() -> FPDF:
+    """Creates a new report document with the title header already drawn."""
     # Initialize the PDF object
     pdf = FPDF()
     pdf.add_page()
@@ -49,45 +261,155 @@ def generate_pdf_report(chat_history):
     
     # --- CONTENT SECTION ---
     pdf.set_font("Arial", size=11)  # Standard reading font
+    return pdf
+
+def _write_message(pdf: FPDF, msg: dict):
+    """Lays out a single chat message (and its metrics line) at the end of the document."""
+    role = msg["role"].upper()
     
-    # Loop through every message in the conversation history
-    for msg in chat_history:
-        role = msg["role"].upper()
+    # CRITICAL: Clean the text before writing to prevent PDF crashes
+    content = clean_text(msg["content"])
+    
+    if role == "USER":
+        # Style User messages in Dark Grey to distinguish them
+        pdf.set_text_color(100, 100, 100) 
+        pdf.cell(0, 10, f"OPERATOR: {content}", ln=True)
+    else:
+        # Style AI messages in Standard Black
+        pdf.set_text_color(0, 0, 0)
         
-        # CRITICAL: Clean the text before writing to prevent PDF crashes
-        content = clean_text(msg["content"])
+        # 'multi_cell' automatically wraps long text to the next line
+        pdf.multi_cell(0, 10, f"ANALYSIS: {content}")
+        pdf.ln(5)  # Add small spacing after the AI response
         
-        if role == "USER":
-            # Style User messages in Dark Grey to distinguish them
-            pdf.set_text_color(100, 100, 100) 
-            pdf.cell(0, 10, f"OPERATOR: {content}", ln=True)
-        else:
-            # Style AI messages in Standard Black
-            pdf.set_text_color(0, 0, 0)
-            
-            # 'multi_cell' automatically wraps long text to the next line
-            pdf.multi_cell(0, 10, f"ANALYSIS: {content}")
-            pdf.ln(5)  # Add small spacing after the AI response
+        # --- METRICS SECTION (Token Usage) ---
+        # Checks if this message has performance data attached
+        if "usage" in msg and msg["usage"] is not None:
+            u = msg["usage"]
             
-            # --- METRICS SECTION (Token Usage) ---
-            # Checks if this message has performance data attached
-            if "usage" in msg and msg["usage"] is not None:
-                u = msg["usage"]
-                
-                # Robust Logic: Handle metrics whether they are a Dict (from Database)
-                # or a Pydantic Object (fresh from API).
-                if isinstance(u, dict):
-                    tokens = u.get('total_tokens', 0)
-                else:
-                    tokens = getattr(u, 'total_tokens', 0)
-
-                # Switch to a monospace font (Courier) for technical data
-                pdf.set_font("Courier", size=8)
-                pdf.cell(0, 5, f"[METRICS: {tokens} Tokens used]", ln=True)
-                pdf.set_font("Arial", size=11) # Reset font back to normal for next loop
-        
-        pdf.ln(2)  # Small gap between messages
+            # Robust Logic: Handle metrics whether they are a Dict (from Database)
+            # or a Pydantic Object (fresh from API).
+            if isinstance(u, dict):
+                tokens = u.get('total_tokens', 0)
+            else:
+                tokens = getattr(u, 'total_tokens', 0)
+
+            # Switch to a monospace font (Courier) for technical data
+            pdf.set_font("Courier", size=8)
+            pdf.cell(0, 5, f"[METRICS: {tokens} Tokens used]", ln=True)
+            pdf.set_font("Arial", size=11) # Reset font back to normal for next loop
+    
+    pdf.ln(2)  # Small gap between messages
 
+def _pdf_bytes(pdf: FPDF) -> bytes:
+    """Finalizes the document and returns its bytes."""
     # Return the PDF file content as a binary string (latin-1 encoded)
     # dest='S' returns the document as a string.
-    return pdf.output(dest='S').encode('latin-1')
\ No newline at end of file
+    return pdf.output(dest='S').encode('latin-1')
+
+@timed()
+def generate_pdf_report(chat_history):
+    """
+    Generates a professional PDF report from the chat history list.
+    Returns the raw PDF bytes to be downloaded by the user.
+    """
+    pdf = _start_pdf()
+    
+    # Loop through every message in the conversation history
+    for msg in chat_history:
+        _write_message(pdf, msg)
+
+    return _pdf_bytes(pdf)
+
+class PdfReportBuilder:
+    """
+    Keeps a report "open" so new messages can be appended without re-laying-out old ones.
+
+    Why this is needed:
+    FPDF's text layout (line wrapping in multi_cell) is the expensive part of a report.
+    A long inspection only gains one or two messages per turn, so the builder lays out just
+    those, and finalizes a *copy* of the document for each download.
+    """
+
+    def __init__(self):
+        self.pdf = _start_pdf()
+        self.messages = []  # The messages already laid out, in order
+
+    def add_messages(self, messages: list):
+        for msg in messages:
+            _write_message(self.pdf, msg)
+            self.messages.append(msg)
+
+    def render(self) -> bytes:
+        """Returns the finished PDF bytes while keeping self.pdf open for more messages."""
+        try:
+            snapshot = copy.deepcopy(self.pdf)
+        except Exception:
+            # Some FPDF versions hold objects that cannot be copied: rebuild from scratch instead
+            return generate_pdf_report(self.messages)
+        return _pdf_bytes(snapshot)
+
+class PdfReportCache:
+    """
+    A bounded, process-wide cache of report builders, keyed by session id.
+
+    Each entry remembers the id of the last message it contains, so:
+    - same (session id, last message id)  -> the cached bytes are returned instantly,
+    - the session gained new messages      -> only the new messages are laid out,
+    - anything else (e.g., history edited)  -> the report is rebuilt from scratch.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # session_id -> {"last_id", "builder", "pdf"}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, last_message_id):
+        """Returns the cached PDF bytes if the report is up to date, otherwise None (no work done)."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry and entry["last_id"] == last_message_id:
+                self._entries.move_to_end(session_id)
+                return entry["pdf"]
+        return None
+
+    def build(self, session_id: str, messages: list) -> bytes:
+        """
+        Returns the PDF for 'messages', reusing (and extending) the cached builder when possible.
+        The lock is only held to look the entry up and to store the result: laying out and rendering
+        run outside it, so one long report does not hold up every other session's download.
+        """
+        last_id = messages[-1].get("id") if messages else None
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry and entry["last_id"] == last_id:
+                self._entries.move_to_end(session_id)
+                return entry["pdf"]
+            # Taken out of the entry, so no other thread extends the same builder meanwhile
+            # (a concurrent build of this session starts from scratch instead)
+            builder = entry["builder"] if entry else None
+            if entry:
+                entry["builder"] = None
+
+        done = len(builder.messages) if builder else 0
+        # Only extend if the messages we already laid out are still the start of the history
+        is_prefix = (
+            builder is not None
+            and done <= len(messages)
+            and (done == 0 or messages[done - 1].get("id") == builder.messages[-1].get("id"))
+        )
+        if not is_prefix or last_id is None:
+            builder, done = PdfReportBuilder(), 0
+
+        builder.add_messages(messages[done:])
+        pdf = builder.render()
+
+        with self._lock:
+            self._entries[session_id] = {"last_id": last_id, "builder": builder, "pdf": pdf}
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return pdf
+
+# The process-wide report cache
+pdf_report_cache = PdfReportCache(settings.PDF_CACHE_MAX_ENTRIES)
@@ -0,0 +1,91 @@
+"""
+Database rerun benchmark.
+
+Simulates the database work of one Streamlit rerun (init_db, history + meta for the active
+session, the sidebar archive list, and the sidebar's own meta lookup) and reports how many
+reruns per second the backend can sustain, single-threaded and with several concurrent operators.
+
+Usage (from the repository root):
+    python benchmarks/bench_database.py --sessions 500 --messages 20 --seconds 5 --threads 8
+"""
+import argparse  # Command line options
+import os  # Paths and temp-file cleanup
+import sys  # To make the repository root importable
+import tempfile  # The benchmark uses a throwaway database file
+import threading  # Simulates several operators using the app at once
+import time  # Timing
+import uuid  # Session IDs
+
+# Ensure Python can find our local modules (same trick as app.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import database  # noqa: E402
+
+
+def seed(num_sessions: int, messages_per_session: int) -> list:
+    """Creates sessions with alternating user/assistant messages and returns their IDs."""
+    session_ids = []
+    usage = {"prompt_tokens": 900, "completion_tokens": 400, "total_tokens": 1300, "latency": 6.1, "throughput": 213.1}
+    for i in range(num_sessions):
+        sid = str(uuid.uuid4())
+        database.create_session(sid)
+        for j in range(messages_per_session):
+            if j % 2 == 0:
+                database.add_message(sid, "user", f"Inspect weld seam {i}-{j} for porosity and cracks.")
+            else:
+                database.add_message(sid, "assistant", "## QA Status: FAIL\n" + "Detail line. " * 40, usage)
+        session_ids.append(sid)
+    return session_ids
+
+
+def one_rerun(session_id: str):
+    """The database calls made by a single rerun of app.main + frontend.sidebar.render_sidebar."""
+    database.init_db()
+    database.get_session_history(session_id)
+    database.get_session_meta(session_id)
+    database.get_session_meta(session_id)  # render_sidebar looks it up again
+    database.get_all_sessions(limit=25)  # First archive page, as rendered by the sidebar
+
+
+def run(session_ids: list, seconds: float, threads: int) -> float:
+    """Runs reruns for 'seconds' on 'threads' threads and returns the total reruns per second."""
+    counts = [0] * threads
+    stop_at = time.perf_counter() + seconds
+
+    def worker(index: int):
+        sid = session_ids[index % len(session_ids)]
+        while time.perf_counter() < stop_at:
+            one_rerun(sid)
+            counts[index] += 1
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="diagnostiq-bench-")
+    database.DB_NAME = os.path.join(workdir, "bench.db")
+    database.init_db()
+    session_ids = seed(args.sessions, args.messages)
+
+    single = run(session_ids, args.seconds, 1)
+    concurrent = run(session_ids, args.seconds, args.threads)
+    print(f"sessions={args.sessions} messages/session={args.messages}")
+    print(f"1 thread:  {single:8.1f} reruns/sec")
+    print(f"{args.threads} threads: {concurrent:8.1f} reruns/sec")
+
+
+if __name__ == "__main__":
+    main()
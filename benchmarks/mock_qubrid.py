@@ -0,0 +1,193 @@
+"""
+Local stand-in for the Qubrid chat API.
+
+Speaks the same OpenAI-compatible protocol as settings.API_URL: a JSON answer with a 'usage'
+block, or Server-Sent Events when the request has "stream": true (with the usage chunk when
+"stream_options": {"include_usage": true} is set). Latency, generation speed and failures are
+configurable, so api_client can be exercised and benchmarked without the real service.
+
+Usage (from the repository root):
+    python benchmarks/mock_qubrid.py --port 8808 --ttft 0.3 --tps 80 --tokens 300 --error-rate 0.05
+    QUBRID_API_URL=http://127.0.0.1:8808/chat streamlit run app.py
+
+Or in-process (as the benchmark suite does):
+    server, url = start_mock_server(ttft=0.05, tps=2000)
+    ...
+    server.shutdown()
+"""
+import argparse  # Command line options
+import json  # Request and response bodies
+import random  # Error injection
+import threading  # Serves in a background thread when used in-process
+import time  # Simulated latency
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Standard library HTTP server
+
+
+class MockConfig:
+    """How the mock server behaves. Every value can be changed while it runs."""
+
+    def __init__(self, ttft: float = 0.2, tps: float = 100.0, tokens: int = 200,
+                 error_rate: float = 0.0, error_status: int = 503, retry_after: float = None):
+        self.ttft = ttft                  # Seconds before the first token
+        self.tps = tps                    # Generated tokens per second after the first one
+        self.tokens = tokens              # Completion length in tokens
+        self.error_rate = error_rate      # Fraction of requests answered with 'error_status'
+        self.error_status = error_status  # e.g. 429 (rate limited) or 503 (overloaded)
+        self.retry_after = retry_after    # Optional 'Retry-After' header (seconds) on errors
+        self.requests = 0                 # Counters, for the benchmark report
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            fail = random.random() < self.error_rate
+            self.errors += fail
+            return fail
+
+
+# A report-shaped answer, so the app renders something realistic (one "token" per word here)
+ANSWER_WORDS = (
+    "## QA Status: FAIL\n## Defect Log\n| Zone | Anomaly Detected | Severity (Low/Med/Crit) | Rejection Criteria |\n"
+    "| :--- | :--- | :--- | :--- |\n| Flange face | Pitting corrosion | Crit | ASME B16.5 |\n"
+    "## Remediation\n- Replace the gasket and resurface the flange face. "
+).split(" ")
+
+
+def _answer_tokens(count: int):
+    """The answer split into 'count' tokens (words, repeating the report text as needed)."""
+    return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(count)]
+
+
+def _prompt_tokens(payload: dict) -> int:
+    """A rough prompt size: ~4 characters per token of text, plus a fixed cost per image."""
+    chars, images = 0, 0
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                chars += len(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                images += 1
+    return chars // 4 + images * 1024
+
+
+class MockQubridHandler(BaseHTTPRequestHandler):
+    """Answers POST requests on any path like the Qubrid chat endpoint."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API (the client pools connections)
+    config: MockConfig = None       # Set by make_server
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        payload = json.loads(body or b"{}")
+        config = self.config
+
+        if config.should_fail():
+            self._send_json(config.error_status, {"error": {"message": "Injected failure"}},
+                            {"Retry-After": str(config.retry_after)} if config.retry_after is not None else {})
+            return
+
+        tokens = _answer_tokens(config.tokens)
+        usage = {
+            "prompt_tokens": _prompt_tokens(payload),
+            "completion_tokens": len(tokens),
+            "total_tokens": _prompt_tokens(payload) + len(tokens),
+        }
+        time.sleep(config.ttft)
+
+        if payload.get("stream"):
+            self._stream(tokens, usage, include_usage=(payload.get("stream_options") or {}).get("include_usage"))
+        else:
+            time.sleep(len(tokens) / config.tps if config.tps else 0)
+            self._send_json(200, {
+                "id": "mock-completion",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+    def _send_json(self, status: int, data: dict, extra_headers: dict = None):
+        raw = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _stream(self, tokens, usage: dict, include_usage: bool):
+        """Sends the answer as Server-Sent Events, one token per event, paced at config.tps."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        interval = 1.0 / self.config.tps if self.config.tps else 0
+        for token in tokens:
+            self._write_event({"choices": [{"index": 0, "delta": {"content": token}}]})
+            if interval:
+                time.sleep(interval)
+        if include_usage:
+            self._write_event({"choices": [], "usage": usage})
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")  # End of the chunked body
+
+    def _write_event(self, data: dict):
+        self._write_chunk(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, raw: bytes):
+        self.wfile.write(f"{len(raw):X}\r\n".encode("ascii") + raw + b"\r\n")
+        self.wfile.flush()
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, config: MockConfig = None) -> ThreadingHTTPServer:
+    """Creates (but does not start) a mock server. Port 0 picks a free port."""
+    handler = type("ConfiguredHandler", (MockQubridHandler,), {"config": config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_mock_server(port: int = 0, **config):
+    """
+    Starts a mock server in a background thread.
+    Returns (server, url); server.config holds the live MockConfig, server.shutdown() stops it.
+    """
+    server = make_server(port=port, config=MockConfig(**config))
+    server.config = server.RequestHandlerClass.config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, bound_port = server.server_address[:2]
+    return server, f"http://{host}:{bound_port}/chat"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tps", type=float, default=100.0, help="Generated tokens per second")
+    parser.add_argument("--tokens", type=int, default=200, help="Completion length")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(args.ttft, args.tps, args.tokens, args.error_rate, args.error_status, args.retry_after)
+    server = make_server(args.host, args.port, config)
+    print(f"Mock Qubrid API on http://{args.host}:{args.port}/chat (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+"""
+End-to-end benchmark suite.
+
+Measures, against a local mock of the Qubrid API (benchmarks/mock_qubrid.py) and throwaway
+databases, so results are repeatable and no API credits are spent:
+
+- api:      chat_with_industrial_ai (blocking + streaming) and chat_many at several concurrencies
+- images:   encode_image_to_base64 and prepare_image on realistic photo sizes
+- database: every backend/database.py operation at 10k / 100k (/ 1M) message rows
+- pdf:      generate_pdf_report on long sessions
+- service:  the headless REST service (service.py): submit -> done latency and throughput of analyses
+            through 1..N worker processes, with the 429 rejections counted
+
+Results are written as JSON. Passing an earlier result file with --compare prints the change per
+benchmark and exits with status 1 if anything got slower than --threshold (for CI).
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --suites database --db-sizes 10000,100000,1000000 --output big.json
+    python benchmarks/run_benchmarks.py --compare bench.json --output new.json
+    python benchmarks/run_benchmarks.py --suites service --service-processes 1,4 --concurrency 16,64
+"""
+import argparse  # Command line options
+import io  # In-memory image files
+import json  # Result file format
+import os  # Paths and temp files
+import platform  # Machine description in the result metadata
+import random  # Seed data
+import shutil  # Removes the temporary databases
+import socket  # Finds a free port for the service
+import statistics  # Percentiles
+import subprocess  # Reads the current git commit for the result metadata; runs the service
+import sys  # To make the repository root importable
+import tempfile  # Throwaway databases
+import time  # Timing
+import uuid  # Session IDs
+from concurrent.futures import ThreadPoolExecutor  # Concurrent API calls
+from datetime import datetime, timezone  # Result timestamp
+
+# Ensure Python can find our local modules (same trick as app.py)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image  # noqa: E402
+from config.settings import settings  # noqa: E402
+from backend import database  # noqa: E402
+from backend.schemas import ChatRequest  # noqa: E402
+from backend.utils import encode_image_to_base64, prepare_image, generate_pdf_report  # noqa: E402
+from benchmarks.mock_qubrid import start_mock_server  # noqa: E402
+
+SUITES = ("api", "images", "database", "pdf", "service")
+
+
+# --- MEASUREMENT HELPERS ---
+
+def summarize(durations: list, total_seconds: float = None) -> dict:
+    """Turns a list of per-operation durations (seconds) into the numbers stored in the report."""
+    durations = sorted(durations)
+    total = total_seconds if total_seconds is not None else sum(durations)
+
+    def pct(p):
+        return round(durations[min(len(durations) - 1, int(p * len(durations)))] * 1000, 3)
+
+    return {
+        "ops": len(durations),
+        "seconds": round(total, 4),
+        "ops_per_sec": round(len(durations) / total, 2) if total > 0 else None,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": round(statistics.fmean(durations) * 1000, 3),
+    }
+
+
+def time_calls(fn, repeat: int, setup=None) -> dict:
+    """Calls fn() 'repeat' times (running setup() untimed before each call) and summarizes."""
+    durations = []
+    for i in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return summarize(durations)
+
+
+class Report:
+    """Collects benchmark results and prints one line per result as it goes."""
+
+    def __init__(self):
+        self.results = []
+
+    def add(self, suite: str, name: str, params: dict, stats: dict):
+        self.results.append({"suite": suite, "name": name, "params": params, **stats})
+        label = f"{suite}.{name} {json.dumps(params, sort_keys=True)}"
+        print(f"{label:<70} p50={stats['p50_ms']:>10.3f} ms  p95={stats['p95_ms']:>10.3f} ms  {stats['ops_per_sec']} ops/s")
+
+
+# --- API ---
+
+def bench_api(report: Report, concurrencies: list, requests_per_worker: int, ttft: float, tps: float, tokens: int):
+    """Throughput and latency of the API client against the mock server."""
+    from backend import api_client
+
+    server, url = start_mock_server(ttft=ttft, tps=tps, tokens=tokens)
+    settings.API_URL = url
+    settings.API_KEY = settings.API_KEY or "mock-key"
+    settings.HTTP_POOL_SIZE = max(concurrencies)  # Read once, when the shared session is created
+    api_client._http_session = None
+
+    question = "Inspect the flange face for corrosion."
+    history = [{"role": "user", "content": "Previous question"}, {"role": "assistant", "content": "Previous answer " * 50}]
+    system_prompt = "You are a QA analyst. " * 20
+
+    try:
+        for stream in (False, True):
+            def one_call():
+                started = time.perf_counter()
+                api_client.chat_with_industrial_ai(
+                    question, None, history, system_prompt, on_token=(lambda delta: None) if stream else None
+                )
+                return time.perf_counter() - started
+
+            for concurrency in concurrencies:
+                total_requests = concurrency * requests_per_worker
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    durations = list(executor.map(lambda _: one_call(), range(total_requests)))
+                stats = summarize(durations, time.perf_counter() - started)
+                report.add("api", "chat_with_industrial_ai", {"concurrency": concurrency, "stream": stream, "tokens": tokens}, stats)
+
+        for concurrency in concurrencies:
+            total_requests = concurrency * requests_per_worker
+            requests_list = [ChatRequest(current_question=question, chat_history=history, system_prompt=system_prompt)
+                             for _ in range(total_requests)]
+            started = time.perf_counter()
+            results = api_client.chat_many(requests_list, concurrency=concurrency)
+            elapsed = time.perf_counter() - started
+            failures = [r for r in results if isinstance(r, Exception)]
+            if failures:
+                raise failures[0]
+            # chat_many reports no per-request timings, so every request is credited with the average
+            stats = summarize([elapsed / total_requests * concurrency] * total_requests, elapsed)
+            report.add("api", "chat_many", {"concurrency": concurrency, "tokens": tokens}, stats)
+    finally:
+        server.shutdown()
+
+
+# --- IMAGES ---
+
+def make_photo(width: int, height: int, quality: int = 90) -> bytes:
+    """A photo-like JPEG (noise + gradient, which compresses about as badly as a real photo)."""
+    noise = Image.effect_noise((width, height), 48).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    buffer = io.BytesIO()
+    Image.blend(noise, gradient, 0.5).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def bench_images(report: Report, repeat: int):
+    """Base64 encoding and full preprocessing (resize + re-encode) on typical upload sizes."""
+    for label, (width, height) in {"1MP": (1280, 960), "12MP": (4000, 3000)}.items():
+        raw = make_photo(width, height)
+        params = {"image": label, "bytes": len(raw)}
+        report.add("images", "encode_image_to_base64", params,
+                   time_calls(lambda: encode_image_to_base64(io.BytesIO(raw)), repeat))
+        report.add("images", "prepare_image", params,
+                   time_calls(lambda: prepare_image(io.BytesIO(raw)), max(3, repeat // 5)))
+
+
+# --- DATABASE ---
+
+WORDS = ("flange weld crack corrosion rust die pin oxidation bearing housing seam porosity fatigue bolt gasket "
+         "valve pump shaft pitting thermal discoloration connector solder joint capacitor motor coil pipe gear").split()
+USAGE = {"prompt_tokens": 900, "completion_tokens": 400, "total_tokens": 1300, "latency": 6.1,
+         "throughput": 213.1, "ttft": 0.8, "model": "Qwen/Qwen3-VL-30B-A3B-Instruct"}
+REPORT = {"qa_status": "FAIL", "defects": [{"zone": "Die", "anomaly": "Crack", "severity": "Crit", "rejection_criteria": "ISO-9001"}]}
+PROTOCOLS = ["General Analysis", "Defect Inspection", "Safety Audit"]
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed_database(rows: int, messages_per_session: int = 10, chunk: int = 20000) -> list:
+    """
+    Fills the current database with 'rows' messages (half of them answers with metrics and defects),
+    using bulk SQL so even 1M rows seed in minutes. Returns the session IDs.
+    """
+    rng = random.Random(42)
+    session_ids = [str(uuid.uuid4()) for _ in range(max(1, rows // messages_per_session))]
+    metric_names = [name for name, _ in database.METRIC_COLUMNS]
+
+    with database.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO sessions (id, title, mode, created_at) VALUES (?, ?, ?, datetime('now', ?))",
+            [(sid, _text(rng, 3), rng.choice(PROTOCOLS), f"-{rng.randint(0, 90 * 24 * 60)} minutes") for sid in session_ids]
+        )
+
+    for start in range(0, rows, chunk):
+        with database.get_connection() as conn:
+            first_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]) + 1
+            messages, metrics, defects = [], [], []
+            for i in range(start, min(rows, start + chunk)):
+                message_id = first_id + (i - start)
+                sid = session_ids[i // messages_per_session % len(session_ids)]
+                if i % 2 == 0:
+                    messages.append((message_id, sid, "user", _text(rng, 12)))
+                    continue
+                messages.append((message_id, sid, "assistant", "## QA Status: FAIL\n" + _text(rng, 120)))
+                usage = dict(USAGE, latency=round(rng.lognormvariate(1.6, 0.4), 2))
+                metrics.append((message_id, sid, rng.choice(PROTOCOLS)) + tuple(usage.get(n) for n in metric_names))
+                if i % 6 == 1:
+                    defects.append((message_id, sid, rng.choice(["Die", "Pin", "Weld", "Flange"]), "Crack",
+                                    rng.choice(["Low", "Med", "Crit"]), "ISO-9001"))
+            conn.executemany("INSERT INTO messages (id, session_id, role, content) VALUES (?, ?, ?, ?)", messages)
+            conn.executemany(
+                f"INSERT INTO message_metrics (message_id, session_id, protocol, {', '.join(metric_names)}) "
+                f"VALUES ({', '.join('?' * (3 + len(metric_names)))})", metrics
+            )
+            conn.executemany(
+                "INSERT INTO defects (message_id, session_id, zone, anomaly, severity, rejection_criteria) VALUES (?, ?, ?, ?, ?, ?)",
+                defects
+            )
+    return session_ids
+
+
+def bench_database(report: Report, sizes: list, repeat: int):
+    """Every database operation, uncached (read caches are cleared before each call)."""
+    original_db = database.DB_NAME
+    for rows in sizes:
+        workdir = tempfile.mkdtemp(prefix="diagnostiq-bench-")
+        try:
+            database.DB_NAME = os.path.join(workdir, "bench.db")
+            database.init_db()
+            started = time.perf_counter()
+            session_ids = seed_database(rows)
+            print(f"-- seeded {rows} messages in {time.perf_counter() - started:.1f}s")
+
+            rng = random.Random(7)
+            params = {"rows": rows}
+            pick = lambda: rng.choice(session_ids)
+            fresh = database._reset_read_caches  # Measure SQLite, not the in-process caches
+            created = []
+
+            def new_session():
+                sid = str(uuid.uuid4())
+                database.create_session(sid)
+                created.append(sid)
+
+            operations = {
+                "create_session": (new_session, None),
+                "add_message.user": (lambda: database.add_message(pick(), "user", _text(rng, 12)), None),
+                "add_message.answer": (lambda: database.add_message(pick(), "assistant", _text(rng, 120), USAGE, REPORT), None),
+                "update_session_title": (lambda: database.update_session_title(pick(), _text(rng, 3)), None),
+                "update_session_mode": (lambda: database.update_session_mode(pick(), rng.choice(PROTOCOLS)), None),
+                "get_session_meta": (lambda: database.get_session_meta(pick()), fresh),
+                "get_session_history": (lambda: database.get_session_history(pick()), fresh),
+                "get_messages_since": (lambda: database.get_messages_since(pick(), 0), fresh),
+                "get_all_sessions.first_page": (lambda: database.get_all_sessions(limit=25), fresh),
+                "search_sessions.common": (lambda: database.search_sessions("corrosion"), fresh),
+                "search_sessions.prefix": (lambda: database.search_sessions("flange pi"), fresh),
+                "query_defects": (lambda: database.query_defects(severity="Crit", zone="Die"), fresh),
+                "count_defects": (lambda: database.count_defects("zone"), fresh),
+                "get_performance_stats.protocol": (lambda: database.get_performance_stats("protocol"), fresh),
+                "get_performance_stats.day": (lambda: database.get_performance_stats("day"), fresh),
+                "save_batch_results.25": (lambda: database.save_batch_results([
+                    {"session_id": str(uuid.uuid4()), "title": "[BATCH] part.jpg", "image_path": None, "mode": "Defect Inspection",
+                     "question": "Analyze", "answer": _text(rng, 120), "usage": USAGE, "defect_report": REPORT}
+                    for _ in range(25)
+                ]), None),
+                "delete_session": (lambda: database.delete_session(created.pop() if created else pick()), None),
+            }
+            for name, (fn, setup) in operations.items():
+                # The slow aggregate queries are run fewer times on big tables
+                runs = repeat if not name.startswith(("get_performance_stats", "count_defects")) else max(3, repeat // 10)
+                report.add("database", name, params, time_calls(fn, runs, setup))
+        finally:
+            database.DB_NAME = original_db
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+# --- PDF ---
+
+def bench_pdf(report: Report, lengths: list, repeat: int):
+    """Full PDF report generation for sessions of increasing length."""
+    rng = random.Random(3)
+    for length in lengths:
+        history = []
+        for i in range(length):
+            if i % 2 == 0:
+                history.append({"role": "user", "content": _text(rng, 15)})
+            else:
+                history.append({"role": "assistant", "content": "## QA Status: FAIL\n" + _text(rng, 200), "usage": USAGE})
+        report.add("pdf", "generate_pdf_report", {"messages": length},
+                   time_calls(lambda: generate_pdf_report(history), repeat))
+
+
+# --- SERVICE ---
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"service.py exited with status {process.returncode}")
+        try:
+            requests.get(f"{url}/health", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError("service.py did not start")
+
+
+def bench_service(report: Report, process_counts: list, concurrencies: list, requests_per_worker: int,
+                  ttft: float, tps: float, tokens: int):
+    """
+    End-to-end analyses through service.py (run as a real server process, like in production) against the
+    mock API: each client submits an image, follows the event stream to the 'done' event, and retries after
+    a 429. Latency is submit -> done; 'rejected' counts the 429 answers (backpressure at work).
+    """
+    import requests
+
+    server, api_url = start_mock_server(ttft=ttft, tps=tps, tokens=tokens)
+    photo = make_photo(1280, 960)
+    try:
+        for processes in process_counts:
+            workdir = tempfile.mkdtemp(prefix="diagnostiq_service_bench_")
+            port = _free_port()
+            url = f"http://127.0.0.1:{port}"
+            env = dict(os.environ, QUBRID_API_URL=api_url, QUBRID_API_KEY=settings.API_KEY or "mock-key",
+                       ASSETS_DIR=os.path.join(workdir, "assets"), METRICS_PORT="0", RESPONSE_CACHE="false",
+                       JOB_POLL_SECONDS="0.05")
+            process = subprocess.Popen(
+                [sys.executable, os.path.join(ROOT, "service.py"), "--port", str(port),
+                 "--processes", str(processes), "--db", os.path.join(workdir, "bench.db")],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                _wait_until_up(url, process)
+                for concurrency in concurrencies:
+                    rejected = []
+
+                    def one_analysis(_):
+                        started = time.perf_counter()
+                        while True:
+                            response = requests.post(f"{url}/analyses?protocol=Defect%20Inspection", data=photo,
+                                                     headers={"Content-Type": "image/jpeg"})
+                            if response.status_code != 429:
+                                break
+                            rejected.append(1)
+                            time.sleep(0.05)  # Much shorter than Retry-After: keeps the service saturated
+                        response.raise_for_status()
+                        with requests.get(url + response.json()["links"]["events"], stream=True) as events:
+                            for line in events.iter_lines():
+                                if line == b"event: done":
+                                    break
+                        return time.perf_counter() - started
+
+                    total_requests = concurrency * requests_per_worker
+                    started = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                        durations = list(executor.map(one_analysis, range(total_requests)))
+                    stats = summarize(durations, time.perf_counter() - started)
+                    stats["rejected"] = len(rejected)
+                    report.add("service", "analysis", {"processes": processes, "concurrency": concurrency,
+                                                       "tokens": tokens}, stats)
+            finally:
+                process.terminate()
+                process.wait(30)
+                shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        server.shutdown()
+
+
+# --- COMPARISON ---
+
+def _key(result: dict) -> str:
+    return f"{result['suite']}.{result['name']} {json.dumps(result['params'], sort_keys=True)}"
+
+
+def compare(baseline_path: str, results: list, threshold: float) -> int:
+    """Prints the p50 change of every benchmark present in both runs. Returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {_key(r): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"\nCompared with {baseline_path} (regression = p50 more than {threshold:.0%} slower):")
+    for result in results:
+        old = baseline.get(_key(result))
+        if not old or not old["p50_ms"]:
+            continue
+        change = result["p50_ms"] / old["p50_ms"] - 1
+        flag = "REGRESSION" if change > threshold else ""
+        regressions += bool(flag)
+        print(f"{_key(result):<70} {old['p50_ms']:>10.3f} -> {result['p50_ms']:>10.3f} ms ({change:+.1%}) {flag}")
+    return regressions
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"Comma-separated subset of: {', '.join(SUITES)}")
+    parser.add_argument("--output", help="Write the JSON results to this file (default: print them)")
+    parser.add_argument("--compare", help="An earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed p50 slowdown before --compare fails")
+    parser.add_argument("--repeat", type=int, default=50, help="Calls per micro-benchmark")
+    parser.add_argument("--concurrency", default="1,4,16", help="API concurrency levels")
+    parser.add_argument("--requests", type=int, default=4, help="API requests per concurrent worker")
+    parser.add_argument("--mock-ttft", type=float, default=0.05, help="Mock server seconds to first token")
+    parser.add_argument("--mock-tps", type=float, default=2000.0, help="Mock server tokens per second")
+    parser.add_argument("--mock-tokens", type=int, default=200, help="Mock server answer length")
+    parser.add_argument("--db-sizes", default="10000,100000", help="Message row counts (e.g. 10000,100000,1000000)")
+    parser.add_argument("--pdf-messages", default="20,100,300", help="Session lengths for the PDF benchmark")
+    parser.add_argument("--service-processes", default="1,2", help="Worker process counts for the service benchmark")
+    args = parser.parse_args()
+
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(sorted(unknown))}")
+
+    report = Report()
+    started = time.perf_counter()
+    if "api" in suites:
+        bench_api(report, [int(c) for c in args.concurrency.split(",")], args.requests,
+                  args.mock_ttft, args.mock_tps, args.mock_tokens)
+    if "images" in suites:
+        bench_images(report, args.repeat)
+    if "database" in suites:
+        bench_database(report, [int(n) for n in args.db_sizes.split(",")], args.repeat)
+    if "pdf" in suites:
+        bench_pdf(report, [int(n) for n in args.pdf_messages.split(",")], max(3, args.repeat // 10))
+    if "service" in suites:
+        bench_service(report, [int(n) for n in args.service_processes.split(",")],
+                      [int(c) for c in args.concurrency.split(",")], args.requests,
+                      args.mock_ttft, args.mock_tps, args.mock_tokens)
+
+    output = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "duration_seconds": round(time.perf_counter() - started, 1),
+            "args": vars(args),
+        },
+        "results": report.results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nWrote {len(report.results)} results to {args.output}")
+    else:
+        print(json.dumps(output, indent=2))
+
+    if args.compare and compare(args.compare, report.results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
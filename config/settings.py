@@ -25,6 +25,134 @@ class Settings:
     # We hardcode this here to ensure we always use the specific Qwen3-VL version tested.
     MODEL_NAME = "Qwen/Qwen3-VL-30B-A3B-Instruct" 
 
+    # Local folder where uploaded images are stored
+    ASSETS_DIR = os.getenv("ASSETS_DIR", os.path.join("frontend", "assets"))
+
+    # 4. Streaming
+    # When enabled, answers are rendered token-by-token as the model generates them.
+    # Set QUBRID_STREAM=false to fall back to waiting for the full answer.
+    STREAM_RESPONSES = os.getenv("QUBRID_STREAM", "true").lower() == "true"
+
+    # 5. HTTP Connection Pool
+    # One shared keep-alive session is reused for every API call (no new TCP+TLS handshake per question).
+    # HTTP_POOL_SIZE caps how many connections to the Qubrid host are kept open at once.
+    HTTP_POOL_SIZE = int(os.getenv("QUBRID_HTTP_POOL_SIZE", "10"))
+
+    # 6. Timeouts (seconds)
+    # CONNECT: how long to wait for the server to accept the connection.
+    # READ: how long to wait between bytes of the answer. A hung upstream fails after this instead of forever.
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("QUBRID_CONNECT_TIMEOUT", "5"))
+    HTTP_READ_TIMEOUT = float(os.getenv("QUBRID_READ_TIMEOUT", "120"))
+
+    # 7. Retry Budget
+    # Retries on 429 (rate limited) and 5xx, with jittered exponential backoff.
+    # BACKOFF_BASE is the first delay; every retry doubles it, up to BACKOFF_MAX.
+    HTTP_MAX_RETRIES = int(os.getenv("QUBRID_MAX_RETRIES", "3"))
+    HTTP_BACKOFF_BASE = float(os.getenv("QUBRID_BACKOFF_BASE", "0.5"))
+    HTTP_BACKOFF_MAX = float(os.getenv("QUBRID_BACKOFF_MAX", "20"))
+
+    # 8. Image Preprocessing
+    # Phone photos (8-12 MB) are shrunk before upload. The vision model does not benefit from
+    # more pixels than IMAGE_MAX_EDGE on the longest side, so anything larger is downscaled.
+    # IMAGE_FORMAT is the re-encode format ("JPEG" or "WEBP"), IMAGE_QUALITY its starting quality,
+    # and IMAGE_MAX_BYTES a hard cap: quality is stepped down until the image fits under it.
+    IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1280"))
+    IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+    IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+    IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(1024 * 1024)))
+
+    # 9. Prepared Image Cache
+    # Upload-ready images are cached in memory (shared by every operator in this process),
+    # so follow-up questions on the same image skip all decoding/resizing/Base64 work.
+    # Oldest entries are evicted once the cache holds more than this many bytes.
+    IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+    # 10. PDF Report Cache
+    # Reports are built only when requested and kept for this many sessions (least recently used are dropped).
+    PDF_CACHE_MAX_ENTRIES = int(os.getenv("PDF_CACHE_MAX_ENTRIES", "32"))
+
+    # 11. Batch Inspection
+    # BATCH_CONCURRENCY: how many images are analyzed at the same time.
+    # BATCH_RATE_LIMIT: max new API requests started per second (stay under the provider's rate limit).
+    # BATCH_FLUSH_SIZE: how many finished results are written to SQLite per transaction.
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    BATCH_RATE_LIMIT = float(os.getenv("BATCH_RATE_LIMIT", "4"))
+    BATCH_FLUSH_SIZE = int(os.getenv("BATCH_FLUSH_SIZE", "25"))
+
+    # 12. Response Cache
+    # Answers for protocols marked cacheable (see backend.schemas.CACHEABLE_PROTOCOLS) are stored in SQLite,
+    # keyed on the image, prompts, history, question and generation settings.
+    # RESPONSE_CACHE_TTL: seconds an answer stays valid. RESPONSE_CACHE_MAX_BYTES: least recently used
+    # answers are evicted once the cache grows past this size. Set RESPONSE_CACHE=false to disable it entirely.
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "true").lower() == "true"
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+    # 13. Context Window
+    # Long inspections are trimmed so every question costs about the same number of prompt tokens.
+    # CONTEXT_TOKEN_BUDGET: estimated text tokens per request (system prompt + history + question; the image is extra).
+    # CONTEXT_KEEP_MESSAGES: the most recent messages that are always sent, even over budget.
+    # CONTEXT_SUMMARY_TOKENS: room reserved for the summary of older, dropped messages.
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+    CONTEXT_KEEP_MESSAGES = int(os.getenv("CONTEXT_KEEP_MESSAGES", "4"))
+    CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "400"))
+
+    # 14. Image Store
+    # Uploads are stored once per unique content (ASSETS_DIR/store/<sha256>.<ext>), with a thumbnail
+    # of at most THUMBNAIL_MAX_EDGE pixels that is shown on screen instead of the full-resolution file.
+    THUMBNAIL_MAX_EDGE = int(os.getenv("THUMBNAIL_MAX_EDGE", "640"))
+
+    # 15. Structured Defect Extraction
+    # Defect Inspection answers also carry a JSON copy of the verdict and Defect Log, which is saved
+    # to the 'defects' table for fleet-wide analytics. Set STRUCTURED_DEFECTS=false to turn it off.
+    STRUCTURED_DEFECTS = os.getenv("STRUCTURED_DEFECTS", "true").lower() == "true"
+
+    # 16. Stage Timing & Profiling
+    # Every rerun of the app (and the hot backend functions) is timed stage by stage into rolling histograms
+    # of the last TIMING_WINDOW samples per stage. DEBUG_PANEL=true shows them in the UI (also: ?debug=1 in the URL).
+    # TIMING_LOG=true writes one JSON log line per rerun with its stage breakdown.
+    # PROFILE_SLOW_RERUN_MS > 0 arms a sampling profiler (one stack sample every PROFILE_INTERVAL_MS) and saves a
+    # flame profile (folded stacks, open with speedscope.app) to PROFILE_DIR for reruns slower than that.
+    TIMING_WINDOW = int(os.getenv("TIMING_WINDOW", "500"))
+    DEBUG_PANEL = os.getenv("DEBUG_PANEL", "false").lower() == "true"
+    TIMING_LOG = os.getenv("TIMING_LOG", "false").lower() == "true"
+    PROFILE_SLOW_RERUN_MS = float(os.getenv("PROFILE_SLOW_RERUN_MS", "0"))
+    PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+    # 17. Metrics Exporter
+    # Request/error counts, upstream latency, tokens, image bytes, SQLite latency and cache hit ratios are
+    # served in the Prometheus text format on http://METRICS_HOST:METRICS_PORT/metrics. METRICS_PORT=0 disables it.
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+    # 18. Background Analysis Jobs
+    # Questions are answered by a process-wide pool of JOB_WORKERS threads instead of the Streamlit script,
+    # so the UI stays usable (and the analysis can be cancelled) while the model is generating.
+    # JOB_POLL_SECONDS: how often the chat pane refreshes a running job's streamed text.
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+
+    # 19. Headless REST Service (service.py)
+    # Lets MES systems and line cameras submit images without the UI. SERVICE_PROCESSES worker processes share
+    # the port and the SQLite file; each runs JOB_WORKERS analyses at a time and queues at most SERVICE_QUEUE_SIZE
+    # more. Beyond that, new submissions get '429 Too Many Requests' with a Retry-After of SERVICE_RETRY_AFTER seconds.
+    SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+    SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8600"))
+    SERVICE_PROCESSES = int(os.getenv("SERVICE_PROCESSES", "1"))
+    SERVICE_QUEUE_SIZE = int(os.getenv("SERVICE_QUEUE_SIZE", "16"))
+    SERVICE_RETRY_AFTER = int(os.getenv("SERVICE_RETRY_AFTER", "5"))
+    SERVICE_MAX_UPLOAD_BYTES = int(os.getenv("SERVICE_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+
+    # 20. Speculative Pre-Analysis (opt-in)
+    # SPECULATIVE_ANALYSIS=true starts the session's protocol analysis as soon as an image is uploaded. If the first
+    # question is the standard one (the "RUN <protocol>" button under the image, which asks "Run the <protocol>
+    # protocol on this image."), its answer is already there (or streaming). Any typed question, even "analyze this",
+    # aborts it and its token cost is counted. SPECULATIVE_WORKERS bounds parallel speculations; unclaimed ones expire after SPECULATIVE_TTL seconds.
+    SPECULATIVE_ANALYSIS = os.getenv("SPECULATIVE_ANALYSIS", "false").lower() == "true"
+    SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", "2"))
+    SPECULATIVE_TTL = int(os.getenv("SPECULATIVE_TTL", "600"))
+
 # Instantiate the settings class.
 # Other files will import this specific instance 'settings', not the class itself.
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,99 @@
+import streamlit as st  # Main library for the UI
+from backend.schemas import PROMPTS  # The protocols a lot can be analyzed under
+from backend.batch import start_batch, load_images_from_zip  # The batch pipeline (on a background thread)
+from config.settings import settings  # Default concurrency / rate limit, progress poll interval
+
+def _render_progress(p):
+    st.progress(p.done / p.total if p.total else 1.0, text=f"{p.done}/{p.total}")
+    st.markdown(f"""
+    <div style="display: flex; gap: 10px;">
+        <div class='tech-pill'>✔ {p.completed} OK</div>
+        <div class='tech-pill'>✖ {p.failed} FAILED</div>
+        <div class='tech-pill'>⚡ {p.throughput} IMG/MIN</div>
+        <div class='tech-pill'>⏱ {p.elapsed}s</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+def _render_outcome(run):
+    if run.error:
+        st.error(f"BATCH FAILED: {run.error}")
+        return
+    failures = [r for r in run.results if r.error]
+    if failures:
+        st.error(f"{len(failures)} image(s) failed:")
+        for r in failures:
+            st.caption(f"{r.name}: {r.error}")
+    else:
+        st.success(f"✔ LOT COMPLETE: {len(run.results)} images saved to the archive")
+
+# While the lot runs, only the progress is redrawn every JOB_POLL_SECONDS (not the whole page)
+@st.fragment(run_every=settings.JOB_POLL_SECONDS)
+def _render_live_progress(run):
+    if run.finished.is_set():
+        st.rerun()  # Full rerun: the outcome below, and the new sessions in the ARCHIVES list
+    _render_progress(run.progress)
+
+def render_batch_panel(user_requirements: str = ""):
+    """
+    Renders the "Batch Inspection" panel: upload many images (or ZIP archives of images),
+    pick a protocol, and analyze the whole lot concurrently with a live progress bar.
+
+    The lot runs on a background thread (backend.batch.start_batch) kept in session_state, so the
+    rest of the app stays usable meanwhile; this panel polls its progress.
+    Every analyzed image becomes its own session in the ARCHIVES list.
+
+    Args:
+        user_requirements (str): The operator's FOCUS instructions from the sidebar, applied to every image.
+    """
+    run = st.session_state.get("batch_run")
+    running = run is not None and not run.finished.is_set()
+
+    with st.expander("📦 BATCH INSPECTION", expanded=running):
+        files = st.file_uploader(
+            "Lot",
+            type=["jpg", "png", "jpeg", "zip"],
+            accept_multiple_files=True,
+            key="batch_files",
+            label_visibility="collapsed"
+        )
+
+        protocol = st.selectbox("Protocol", list(PROMPTS.keys()), key="batch_protocol")
+        c1, c2 = st.columns(2)
+        with c1:
+            concurrency = st.number_input("Parallel requests", min_value=1, max_value=64,
+                                          value=settings.BATCH_CONCURRENCY, key="batch_concurrency")
+        with c2:
+            rate_limit = st.number_input("Max requests / sec", min_value=0.1, max_value=100.0,
+                                         value=float(settings.BATCH_RATE_LIMIT), key="batch_rate")
+
+        # One lot at a time per browser session
+        if st.button("▶ RUN BATCH", type="primary", disabled=not files or running, width="stretch"):
+            # Expand ZIP archives into individual images
+            images = []
+            for f in files:
+                if f.name.lower().endswith(".zip"):
+                    images.extend(load_images_from_zip(f))
+                else:
+                    images.append((f.name, f.getvalue()))
+
+            if not images:
+                st.warning("No images found in the selected files.")
+                return
+
+            run = start_batch(
+                images,
+                protocol,
+                user_requirements=user_requirements,
+                concurrency=int(concurrency),
+                rate_limit=float(rate_limit)
+            )
+            st.session_state.batch_run = run
+            running = True
+
+        if run is None:
+            return
+        if running:
+            _render_live_progress(run)
+        else:
+            _render_progress(run.progress)
+            _render_outcome(run)
@@ -0,0 +1,45 @@
+import os  # Profile file names
+import streamlit as st  # Main library for the UI
+from backend.timing import get_stage_stats, get_recent_reruns, reset  # Rolling stage histograms
+from config.settings import settings  # Opt-in switch and profiler threshold
+
+def debug_panel_enabled() -> bool:
+    """The panel is opt-in: DEBUG_PANEL=true in the environment, or ?debug=1 in the page URL."""
+    return settings.DEBUG_PANEL or st.query_params.get("debug") == "1"
+
+def render_debug_panel():
+    """
+    Renders the "Debug: Timing" panel: where the time of a rerun goes, stage by stage.
+
+    - The table holds the rolling histograms of every timed stage in this process
+      (app.main steps and backend functions such as database.get_session_history), slowest p95 first.
+    - The chart breaks down the last finished rerun (this one is still running while the panel is drawn).
+    - Reruns slower than PROFILE_SLOW_RERUN_MS have a flame profile saved next to them.
+    """
+    with st.expander("🛠 DEBUG: TIMING", expanded=False):
+        stats = get_stage_stats()
+        if not stats:
+            st.caption("No timings recorded yet.")
+            return
+
+        st.dataframe(
+            [{"Stage": name, "Calls": s["count"], "Last (ms)": s["last_ms"], "p50 (ms)": s["p50_ms"],
+              "p95 (ms)": s["p95_ms"], "p99 (ms)": s["p99_ms"], "Max (ms)": s["max_ms"]}
+             for name, s in stats.items()],
+            hide_index=True, width="stretch"
+        )
+
+        reruns = get_recent_reruns()
+        if reruns:
+            last = reruns[0]
+            st.caption(f"Last rerun: {last['total_ms']} ms")
+            # Nested stages (a backend call inside an app step) are listed separately, so bars can overlap
+            st.bar_chart([{"Stage": name, "ms": ms} for name, ms in last["stages"]], x="Stage", y="ms", horizontal=True)
+
+        if settings.PROFILE_SLOW_RERUN_MS > 0:
+            profiles = [r["profile"] for r in reruns if r["profile"]]
+            st.caption(f"Flame profiles of reruns over {settings.PROFILE_SLOW_RERUN_MS:g} ms "
+                       f"(open in speedscope.app): " + (", ".join(os.path.basename(p) for p in profiles) or "none yet"))
+
+        if st.button("RESET TIMINGS", key="debug_reset_timings"):
+            reset()
@@ -0,0 +1,114 @@
+import streamlit as st  # Main library for the UI
+from backend.jobs import get_session_jobs, cancel, QUEUED, DONE, FAILED, CANCELLED  # Background analyses
+from backend.defects import strip_partial_json  # Hides the half-streamed JSON block of Defect Inspection answers
+from config.settings import settings  # Poll interval and streaming display switch
+
+def session_has_active_job(session_id: str) -> bool:
+    """True while an analysis for this session is queued or running (the chat input is disabled meanwhile)."""
+    return any(job.active for job in get_session_jobs(session_id))
+
+def _visible_jobs(session_id: str):
+    dismissed = st.session_state.setdefault("dismissed_jobs", set())
+    return [job for job in get_session_jobs(session_id) if job.id not in dismissed]
+
+def _render_streamed_answer(job):
+    if job.audit and job.audit.outcome(job)[0] == DONE:
+        # Full audit member: complete, saved together with the other protocols' answers
+        st.markdown(job.text)
+        st.caption("✔ COMPLETE")
+        return
+    if job.parts and settings.STREAM_RESPONSES:
+        # A cursor block shows the answer is still typing
+        st.markdown(strip_partial_json(job.text) + "▌")
+    else:
+        st.caption("⏳ QUEUED..." if job.status == QUEUED else "⚙ PROCESSING...")
+
+def _render_audit(audit):
+    """A running full audit: its question, then one tab per protocol streaming that persona's answer."""
+    with st.chat_message("user"):
+        st.markdown(audit.question)
+    with st.chat_message("assistant"):
+        members = list(audit.jobs.values())
+        for job, tab in zip(members, st.tabs([job.protocol for job in members])):
+            with tab:
+                status, error = audit.outcome(job)
+                if status == FAILED:
+                    st.error(f"SYSTEM FAILURE: {error}")
+                elif status == CANCELLED:
+                    st.caption("✖ CANCELLED")
+                else:
+                    _render_streamed_answer(job)
+        if any(job.cancel_requested.is_set() for job in members):
+            st.caption("CANCELLING...")
+        elif st.button("✖ CANCEL AUDIT", key=f"cancel_audit_{audit.id}"):
+            audit.cancel()
+
+def _render_jobs(session_id: str):
+    """
+    Draws this session's background analyses below the chat history:
+    - running: the question and the answer streamed so far, with a CANCEL button
+      (a full audit: one tab per protocol, with a single CANCEL AUDIT button),
+    - failed / cancelled: a notice the operator can dismiss,
+    - done: nothing; a full rerun picks the saved turn up into the history instead.
+    """
+    dismissed = st.session_state.setdefault("dismissed_jobs", set())
+    needs_full_rerun = False
+    drawn_audits = set()
+
+    for job in _visible_jobs(session_id):
+        if job.audit is not None and job.active:
+            # Members end together (their answers are saved in one transaction), so this shows until then
+            if job.audit.id not in drawn_audits:
+                drawn_audits.add(job.audit.id)
+                _render_audit(job.audit)
+            continue
+
+        if job.status == DONE:
+            dismissed.add(job.id)
+            needs_full_rerun = True  # The answer is committed: reload the history, re-enable the input
+            continue
+
+        if job.status in (FAILED, CANCELLED):
+            if job.status == FAILED:
+                st.error(f"SYSTEM FAILURE{f' ({job.protocol})' if job.audit else ''}: {job.error}")
+            elif job.audit:
+                dismissed.add(job.id)  # A cancelled audit member needs no notice of its own
+                continue
+            else:
+                st.warning(f"✖ ANALYSIS CANCELLED: {job.question}")
+            if st.button("DISMISS", key=f"dismiss_job_{job.id}"):
+                dismissed.add(job.id)
+                needs_full_rerun = True
+            continue
+
+        with st.chat_message("user"):
+            st.markdown(job.question)
+        with st.chat_message("assistant"):
+            _render_streamed_answer(job)
+            if job.cancel_requested.is_set():
+                st.caption("CANCELLING...")
+            elif st.button("✖ CANCEL", key=f"cancel_job_{job.id}"):
+                cancel(job.id)
+
+    # A fragment only redraws itself; the history and the chat input need a full rerun
+    if needs_full_rerun or (st.session_state.get("_job_pane_live") and not session_has_active_job(session_id)):
+        st.rerun()
+
+# While a job runs, only this pane is redrawn every JOB_POLL_SECONDS (not the whole page)
+@st.fragment(run_every=settings.JOB_POLL_SECONDS)
+def _render_live_jobs(session_id: str):
+    st.session_state._job_pane_live = True
+    _render_jobs(session_id)
+
+def render_job_panel(session_id: str):
+    """
+    Shows the session's background analyses (see backend/jobs.py). They keep running across reruns
+    and session switches, so the operator can browse the archive and come back to a running audit.
+    """
+    if not _visible_jobs(session_id):
+        return
+    if session_has_active_job(session_id):
+        _render_live_jobs(session_id)
+    else:
+        st.session_state._job_pane_live = False
+        _render_jobs(session_id)
@@ -0,0 +1,48 @@
+import streamlit as st  # Main library for the UI
+from datetime import datetime, timedelta, timezone  # Date range of the stats
+from backend.database import get_performance_stats  # Percentiles computed in SQLite
+
+# Sidebar-friendly labels -> get_performance_stats group_by values
+GROUP_OPTIONS = {"Protocol": "protocol", "Day": "day", "Model": "model"}
+# Time windows offered in the panel (days)
+RANGE_OPTIONS = {"24 hours": 1, "7 days": 7, "30 days": 30, "90 days": 90}
+
+def render_performance_panel():
+    """
+    Renders the "Performance" panel: p50 / p95 / p99 latency and tokens/sec of the AI answers,
+    grouped by protocol, day or model. Used to spot upstream slowdowns and plan capacity.
+
+    The numbers come from the typed message_metrics table and are cached until a new answer
+    is saved, so an open panel costs nothing on ordinary reruns.
+    """
+    with st.expander("📈 PERFORMANCE", expanded=False):
+        c1, c2 = st.columns(2)
+        with c1:
+            group_label = st.selectbox("Group by", list(GROUP_OPTIONS.keys()), key="perf_group")
+        with c2:
+            range_label = st.selectbox("Range", list(RANGE_OPTIONS.keys()), index=1, key="perf_range")
+
+        # SQLite timestamps are UTC 'YYYY-MM-DD HH:MM:SS'; whole days keep the cache key stable between reruns
+        since = (datetime.now(timezone.utc) - timedelta(days=RANGE_OPTIONS[range_label])).strftime("%Y-%m-%d")
+        stats = get_performance_stats(GROUP_OPTIONS[group_label], since=since)
+
+        if not stats:
+            st.caption("No answers in this range yet.")
+            return
+
+        rows = [{
+            group_label: s["group"],
+            "Requests": s["requests"],
+            "Latency p50 (s)": round(s["latency_p50"] or 0, 2),
+            "Latency p95 (s)": round(s["latency_p95"] or 0, 2),
+            "Latency p99 (s)": round(s["latency_p99"] or 0, 2),
+            "T/s p50": round(s["tps_p50"] or 0, 1),
+            "T/s p95": round(s["tps_p95"] or 0, 1),
+            "T/s p99": round(s["tps_p99"] or 0, 1),
+            "Avg TTFT (s)": s["avg_ttft"] or 0,
+        } for s in stats]
+        st.dataframe(rows, hide_index=True, width="stretch")
+
+        # Day view: plot the latency trend (a rising p95 is the first sign of upstream degradation)
+        if group_label == "Day" and len(rows) > 1:
+            st.line_chart(rows, x="Day", y=["Latency p50 (s)", "Latency p95 (s)", "Latency p99 (s)"])
@@ -1,7 +1,13 @@
 import streamlit as st  # Main library for the web interface components
 from backend.schemas import PROMPTS  # Imports the dictionary of AI Personas (General, Defect, Safety)
+from backend import response_cache  # Hit/miss counters for the AI response cache
+from backend import speculative  # Adopted/discarded counters of the speculative pre-analysis
+from config.settings import settings  # Whether speculative pre-analysis is on
 # Import database functions to handle session management (CRUD operations)
-from backend.database import get_all_sessions, update_session_title, get_session_meta, delete_session, update_session_mode
+from backend.database import get_all_sessions, search_sessions, update_session_title, get_session_meta, delete_session, update_session_mode
+
+# How many archived sessions are loaded per "Load more" click
+ARCHIVE_PAGE_SIZE = 25
 
 def render_sidebar():
     """
@@ -105,6 +111,8 @@ def render_sidebar():
 
         # Retrieve the actual system prompt text associated with the chosen name
         base_instruction = PROMPTS[selected_mode]
+        # Remember the protocol name (app.py uses it to decide if the answer may come from the response cache)
+        st.session_state.active_protocol = selected_mode
 
         # 4. CUSTOM FOCUS (User Instructions)
         st.markdown("### 2. FOCUS")
@@ -118,11 +126,39 @@ def render_sidebar():
         
         # 5. ARCHIVES (History Navigation)
         st.markdown("### 3. ARCHIVES")
-        # Fetch all valid sessions from the database
-        sessions = get_all_sessions()
-        
+        # Full-text search over titles and every message (e.g. "corroded flange")
+        search_text = st.text_input(
+            "Search",
+            placeholder="🔍 Search inspections...",
+            key="archive_search",
+            label_visibility="collapsed",
+            on_change=lambda: st.session_state.update(archive_pages=1)  # A new search starts at its first page
+        ).strip()
+
+        # Fetch page by page instead of every session ever recorded.
+        # 'archive_pages' grows by one each time the operator clicks "Load more".
+        pages_to_show = st.session_state.get("archive_pages", 1)
+        sessions = []
+        has_more = False
+        for _ in range(pages_to_show):
+            if search_text:
+                # Search results: best match first, paged by position
+                page = search_sessions(search_text, limit=ARCHIVE_PAGE_SIZE, offset=len(sessions))
+            else:
+                # Archive: newest first, each page continues right after the last session of the previous page (keyset pagination)
+                last = sessions[-1] if sessions else None
+                page = get_all_sessions(
+                    limit=ARCHIVE_PAGE_SIZE,
+                    before_created_at=last['created_at'] if last else None,
+                    before_id=last['id'] if last else None
+                )
+            sessions.extend(page)
+            has_more = len(page) == ARCHIVE_PAGE_SIZE
+            if not has_more:
+                break
+
         if not sessions:
-            st.caption("No history.")
+            st.caption("No matches." if search_text else "No history.")
         
         # Loop through past sessions and create a navigation button for each
         for s in sessions:
@@ -143,7 +179,24 @@ def render_sidebar():
                 st.session_state.active_session_id = s['id']
                 st.rerun()
 
+            # Search results show where the words were found
+            if s.get('snippet'):
+                st.caption(s['snippet'])
+
+        # Only offer more pages if the last one was full (there may be older sessions)
+        if has_more and st.button("⬇ Load more", key="archive_load_more", width="stretch"):
+            st.session_state.archive_pages = pages_to_show + 1
+            st.rerun()
+
         st.markdown("---")
+
+        # Response cache counters (this server process, all operators)
+        cache_stats = response_cache.get_stats()
+        st.caption(f"♻ RESPONSE CACHE: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        if settings.SPECULATIVE_ANALYSIS:
+            spec_stats = speculative.get_stats()
+            wasted = spec_stats["wasted_prompt_tokens"] + spec_stats["wasted_completion_tokens"]
+            st.caption(f"⚡ PRE-ANALYSIS: {spec_stats['adopted']} used / {spec_stats['discarded']} discarded ({wasted} tokens)")
         
         # 6. THEME SWITCHER
         # Allows toggling between Light and Dark CSS modes
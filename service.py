@@ -0,0 +1,446 @@
+"""
+DiagnostiQ headless REST service.
+
+The same analyses as the Streamlit UI (app.py), for machines: MES systems and line cameras submit an
+image + protocol over HTTP and poll or stream the result. Built on the same backend: analyses run as
+background jobs (backend/jobs.py), turns and job states are saved to the same SQLite file, so sessions
+created here show up in the UI archive and vice versa (the read caches in backend/database.py notice
+writes from other processes through SQLite's data_version, checked at most twice a second).
+
+Endpoints (JSON unless noted):
+    POST /analyses                      Submit an analysis -> 202 {"job_id", "session_id", ...}
+                                        JSON body: {"image": <base64>, "protocol": "Defect Inspection",
+                                        "question": "...", "instructions": "...", "session_id": "...", "title": "..."}
+                                        or the raw image bytes (Content-Type: image/*) with the same fields as query parameters.
+                                        "image" may be omitted for a follow-up question in an existing session.
+                                        429 + Retry-After when this worker's queue is full.
+    GET  /analyses/{id}                 Job status; the answer and its usage metrics once it is done
+    GET  /analyses/{id}/events          Server-Sent Events: 'token' (live text), 'status' and a final 'done'
+    GET  /sessions?limit=&q=            Archive (newest first) or full-text search
+    GET  /sessions/{id}                 Session metadata + messages
+    GET  /sessions/{id}/report.pdf      PDF report (application/pdf)
+    GET  /protocols                     Available analysis protocols
+    GET  /health                        Liveness + this worker's load
+    GET  /metrics                       Prometheus metrics of the worker that answers
+
+Usage (from the repository root):
+    python service.py --port 8600 --processes 4
+    curl -X POST --data-binary @part.jpg -H "Content-Type: image/jpeg" \\
+         "http://127.0.0.1:8600/analyses?protocol=Defect%20Inspection"
+"""
+import argparse  # Command line options
+import base64  # Images sent inside JSON bodies
+import binascii  # Error type of invalid base64
+import io  # Validates uploads in memory
+import json  # Request and response bodies
+import os  # Worker processes (fork) and file checks
+import re  # URL routing
+import signal  # Clean shutdown of the worker processes
+import sys  # Exit codes and the module search path
+import threading  # Admission lock
+import time  # Event stream polling
+import traceback  # Logs unexpected errors
+import uuid  # Session IDs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Standard library HTTP server
+from urllib.parse import urlsplit, parse_qs  # Path and query string
+
+# Ensure Python can find our local modules (same trick as app.py)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image  # Rejects uploads that are not images
+from config.settings import settings  # Service host/port, worker and queue sizes
+from backend import database  # Sessions, messages and job rows (shared SQLite file)
+from backend import jobs  # The bounded analysis worker pool
+from backend.image_store import attach_image  # Content-addressed image storage
+from backend.metrics import REGISTRY  # /metrics
+from backend.schemas import PROMPTS, build_system_prompt, is_cacheable, wants_structured_output  # Protocols
+from backend.utils import pdf_report_cache  # Incremental PDF reports
+
+# How often the event stream checks a job this worker is running for new tokens (seconds)
+STREAM_POLL_SECONDS = 0.1
+
+class ServiceError(Exception):
+    """An error answered to the client as {"error": message} with an HTTP status."""
+
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+# --- ADMISSION (BACKPRESSURE) ---
+# Each worker process accepts at most JOB_WORKERS running + SERVICE_QUEUE_SIZE queued analyses.
+# A submission is "reserved" from the capacity check until its job exists, so parallel uploads
+# cannot all pass the check before any of them is counted.
+_admission_lock = threading.Lock()
+_reserved = 0
+
+def capacity() -> int:
+    return settings.JOB_WORKERS + settings.SERVICE_QUEUE_SIZE
+
+def _reserve_slot():
+    global _reserved
+    with _admission_lock:
+        if jobs.count_active_jobs() + _reserved >= capacity():
+            raise ServiceError(429, "Analysis queue is full, retry later.",
+                               {"Retry-After": str(settings.SERVICE_RETRY_AFTER)})
+        _reserved += 1
+
+def _release_slot():
+    global _reserved
+    with _admission_lock:
+        _reserved -= 1
+
+# --- OPERATIONS ---
+
+def submit(raw_image: bytes, protocol: str, question: str = "", instructions: str = "",
+           session_id: str = None, title: str = None) -> dict:
+    """Starts an analysis and returns its job summary (the job id is the handle for polling)."""
+    if protocol not in PROMPTS:
+        raise ServiceError(400, f"Unknown protocol {protocol!r}. Available: {', '.join(PROMPTS)}")
+    question = question or jobs.PROTOCOL_QUESTION.format(protocol=protocol)  # e.g. a camera that only sends images
+    if raw_image:
+        # The UI only accepts image files; here anything can arrive, so check before storing it
+        try:
+            Image.open(io.BytesIO(raw_image)).verify()
+        except Exception:
+            raise ServiceError(400, "The upload is not a readable image.")
+
+    _reserve_slot()
+    created = False
+    try:
+        # 1. The session: continue an existing one (its history is the context) or open a new one
+        if session_id:
+            meta = database.get_session_meta(session_id)
+            if meta is None:
+                raise ServiceError(404, f"Unknown session {session_id}")
+            if meta.get("mode") != protocol:
+                database.update_session_mode(session_id, protocol)
+            history = database.get_session_history(session_id)
+        else:
+            session_id = str(uuid.uuid4())
+            database.create_session(session_id, title or "New Inspection", protocol)
+            created, meta, history = True, None, []
+
+        # 2. The image: a new upload, or the session's current one for follow-up questions
+        if raw_image:
+            image = attach_image(session_id, raw_image).path
+        elif meta and meta.get("image_path") and os.path.exists(meta["image_path"]):
+            image = meta["image_path"]
+        else:
+            raise ServiceError(400, "No image: send one, or continue a session that has one.")
+
+        # 3. Same "Super Prompt" as the UI: persona + guardrails (+ JSON defect log) + operator instructions
+        system_prompt = build_system_prompt(PROMPTS[protocol], instructions, structured=wants_structured_output(protocol))
+        job = jobs.submit_analysis(session_id, question, image=image, chat_history=history,
+                                   system_prompt=system_prompt, protocol=protocol, cacheable=is_cacheable(protocol))
+    except BaseException:
+        if created:
+            database.delete_session(session_id)  # Don't leave an empty session behind a rejected upload
+        raise
+    finally:
+        _release_slot()
+
+    # The job row is written behind; commit it now so any worker process can answer a poll for it
+    database.flush_writes()
+    return {"job_id": job.id, "session_id": session_id, "status": job.status, "protocol": protocol,
+            "links": {"self": f"/analyses/{job.id}", "events": f"/analyses/{job.id}/events",
+                      "session": f"/sessions/{session_id}", "report": f"/sessions/{session_id}/report.pdf"}}
+
+def job_view(job_id: str) -> dict:
+    """
+    A job's state. Jobs run by this worker process are read from memory (including the text streamed
+    so far); jobs of other workers are read from the jobs table, with the saved answer once done.
+    """
+    job = jobs.get_job(job_id)
+    if job is not None:
+        view = job.to_row()
+        if job.status == jobs.DONE:
+            view.update(answer=job.text, usage=job.usage)
+        elif job.active:
+            view["partial_answer"] = job.text
+        return view
+
+    row = database.get_job_row(job_id)
+    if row is None:
+        raise ServiceError(404, f"Unknown analysis {job_id}")
+    if row["status"] == jobs.DONE and row["answer_message_id"]:
+        answer = database.get_message(row["answer_message_id"]) or {}
+        row.update(answer=answer.get("content"), usage=answer.get("usage"))
+    return row
+
+def session_view(session_id: str) -> dict:
+    meta = database.get_session_meta(session_id)
+    if meta is None:
+        raise ServiceError(404, f"Unknown session {session_id}")
+    meta["messages"] = database.get_messages_since(session_id)
+    return meta
+
+def session_report(session_id: str) -> bytes:
+    if database.get_session_meta(session_id) is None:
+        raise ServiceError(404, f"Unknown session {session_id}")
+    # Messages with ids, so the cached report is only extended with the new ones
+    return pdf_report_cache.build(session_id, database.get_messages_since(session_id))
+
+# --- HTTP LAYER ---
+
+ROUTES = [
+    ("POST", re.compile(r"^/analyses$"), "_post_analysis"),
+    ("GET", re.compile(r"^/analyses/([\w-]+)$"), "_get_analysis"),
+    ("GET", re.compile(r"^/analyses/([\w-]+)/events$"), "_get_analysis_events"),
+    ("GET", re.compile(r"^/sessions$"), "_get_sessions"),
+    ("GET", re.compile(r"^/sessions/([\w-]+)$"), "_get_session"),
+    ("GET", re.compile(r"^/sessions/([\w-]+)/report\.pdf$"), "_get_report"),
+    ("GET", re.compile(r"^/protocols$"), "_get_protocols"),
+    ("GET", re.compile(r"^/health$"), "_get_health"),
+    ("GET", re.compile(r"^/metrics$"), "_get_metrics"),
+]
+
+# Members of a JSON POST /analyses body that must be strings (or null) when present
+JSON_TEXT_FIELDS = ("image", "protocol", "question", "instructions", "session_id", "title")
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Routes requests to the operations above and turns ServiceErrors into JSON error responses."""
+
+    server_version = "DiagnostiQ"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        self.query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            for route_method, pattern, handler in ROUTES:
+                match = pattern.match(url.path)
+                if match:
+                    if route_method != method:
+                        raise ServiceError(405, f"{method} is not supported on {url.path}")
+                    getattr(self, handler)(*match.groups())
+                    return
+            raise ServiceError(404, f"No route for {url.path}")
+        except ServiceError as e:
+            self._send_json(e.status, {"error": str(e)}, e.headers)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client went away (e.g. closed an event stream)
+        except Exception as e:
+            self.log_error("%s", traceback.format_exc())
+            self._send_json(500, {"error": str(e)})
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload, headers: dict = None):
+        self._send(status, json.dumps(payload, default=str).encode("utf-8"), "application/json", headers)
+
+    def _read_body(self) -> bytes:
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise ServiceError(411, "Content-Length is required")
+        if int(length) > settings.SERVICE_MAX_UPLOAD_BYTES:
+            raise ServiceError(413, f"Request body over {settings.SERVICE_MAX_UPLOAD_BYTES} bytes")
+        return self.rfile.read(int(length))
+
+    # --- Routes ---
+
+    def _post_analysis(self):
+        body = self._read_body()
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("application/json"):
+            try:
+                fields = json.loads(body or b"{}")
+            except ValueError as e:
+                raise ServiceError(400, f"Invalid JSON body: {e}")
+            if not isinstance(fields, dict):
+                raise ServiceError(400, "Invalid JSON body: expected an object")
+            not_text = [name for name in JSON_TEXT_FIELDS if fields.get(name) is not None and not isinstance(fields[name], str)]
+            if not_text:
+                raise ServiceError(400, f"Invalid JSON body: {', '.join(not_text)} must be strings")
+            try:
+                raw_image = base64.b64decode(fields["image"], validate=True) if fields.get("image") else b""
+            except (ValueError, binascii.Error) as e:
+                raise ServiceError(400, f"Invalid JSON body: {e}")
+        else:
+            fields, raw_image = self.query, body  # Raw image upload, options in the query string
+        result = submit(
+            raw_image,
+            protocol=fields.get("protocol") or "General Analysis",
+            question=fields.get("question") or "",
+            instructions=fields.get("instructions") or "",
+            session_id=fields.get("session_id"),
+            title=fields.get("title"),
+        )
+        self._send_json(202, result, {"Location": result["links"]["self"]})
+
+    def _get_analysis(self, job_id: str):
+        self._send_json(200, job_view(job_id))
+
+    def _get_analysis_events(self, job_id: str):
+        view = job_view(job_id)  # 404 before the stream starts
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def send_event(event: str, data):
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        job = jobs.get_job(job_id)
+        status = None
+        if job is not None:
+            # Running here: forward the text as it is streamed by the model
+            sent = 0
+            while True:
+                active = job.active  # Read before the parts, so the last tokens are never skipped
+                if job.status != status:
+                    status = job.status
+                    send_event("status", {"status": status})
+                parts = job.parts
+                for delta in parts[sent:]:
+                    send_event("token", {"text": delta})
+                sent = len(parts)
+                if not active:
+                    break
+                time.sleep(STREAM_POLL_SECONDS)
+        else:
+            # Running in another worker process: follow its row until it ends (status changes only)
+            while True:
+                if view["status"] != status:
+                    status = view["status"]
+                    send_event("status", {"status": status})
+                if view["status"] not in jobs.ACTIVE_STATUSES:
+                    break
+                time.sleep(settings.JOB_POLL_SECONDS)
+                view = job_view(job_id)
+        send_event("done", job_view(job_id))
+
+    def _get_sessions(self):
+        try:
+            limit = int(self.query.get("limit", 50))
+        except ValueError:
+            raise ServiceError(400, "'limit' must be an integer")
+        if self.query.get("q"):
+            sessions = database.search_sessions(self.query["q"], limit=limit)
+        else:
+            sessions = database.get_all_sessions(limit=limit, before_created_at=self.query.get("before_created_at"),
+                                                 before_id=self.query.get("before_id"))
+        self._send_json(200, {"sessions": sessions})
+
+    def _get_session(self, session_id: str):
+        self._send_json(200, session_view(session_id))
+
+    def _get_report(self, session_id: str):
+        self._send(200, session_report(session_id), "application/pdf",
+                   {"Content-Disposition": f'attachment; filename="Report-{session_id}.pdf"'})
+
+    def _get_protocols(self):
+        self._send_json(200, {"protocols": list(PROMPTS)})
+
+    def _get_health(self):
+        self._send_json(200, {"status": "ok", "pid": os.getpid(), "active_jobs": jobs.count_active_jobs(),
+                              "capacity": capacity()})
+
+    def _get_metrics(self):
+        self._send(200, REGISTRY.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+
+# --- PROCESSES ---
+# The listening socket is opened once, then shared by SERVICE_PROCESSES forked workers: the kernel
+# hands each new connection to one of them. The parent opens no database connection and starts no
+# thread before forking, so every worker starts with its own connection pool, writer and job pool.
+
+def _serve(server: ThreadingHTTPServer):
+    # SIGTERM ends the worker through SystemExit, so queued writes are still committed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.default_int_handler)  # Ctrl+C in a terminal reaches every worker
+    database.init_db()  # Safe in parallel: migrations take the write lock (see run_migrations)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def _spawn_worker(server: ThreadingHTTPServer) -> int:
+    pid = os.fork()
+    if pid == 0:
+        # The worker never returns into the parent's loop: it leaves through os._exit, which skips
+        # atexit, so its queued writes are committed here
+        code = 1
+        try:
+            _serve(server)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                database.flush_writes(10)
+            finally:
+                os._exit(code)
+    return pid
+
+def run(host: str = None, port: int = None, processes: int = None):
+    """Serves until interrupted (Ctrl+C / SIGTERM), in 'processes' worker processes."""
+    host = host or settings.SERVICE_HOST
+    port = settings.SERVICE_PORT if port is None else port
+    processes = processes or settings.SERVICE_PROCESSES
+
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    print(f"DiagnostiQ service on http://{host}:{server.server_address[1]} "
+          f"({processes} process(es) x {settings.JOB_WORKERS} workers, queue {settings.SERVICE_QUEUE_SIZE})", flush=True)
+
+    if processes <= 1:
+        _serve(server)
+        return
+
+    # Idle workers must not block in accept() when another worker took the connection
+    server.socket.setblocking(False)
+    workers = {_spawn_worker(server) for _ in range(processes)}
+
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            # A crashed worker is replaced (its unfinished jobs are failed by the next pool start)
+            print(f"Worker {pid} exited ({status}), restarting it", flush=True)
+            workers.add(_spawn_worker(server))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVICE_PORT)
+    parser.add_argument("--processes", type=int, default=settings.SERVICE_PROCESSES, help="Worker processes")
+    parser.add_argument("--db", default=database.DB_NAME, help="SQLite database file (shared with the UI)")
+    args = parser.parse_args()
+    database.DB_NAME = args.db
+    run(args.host, args.port, args.processes)
+
+if __name__ == "__main__":
+    main()
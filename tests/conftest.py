@@ -0,0 +1,62 @@
+import io  # Builds small test images in memory
+import os  # Paths
+import sys  # The module search path
+import tempfile  # Keeps the suite away from the real database file
+
+# Ensure Python can find our local modules (same trick as app.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # Test runner and fixtures
+from PIL import Image  # Test images
+from config.settings import settings  # Pointed at throwaway folders and the mock API
+from backend import database  # Pointed at a throwaway SQLite file
+from backend import api_client  # Its shared HTTP session is rebuilt per mock server
+from benchmarks.mock_qubrid import start_mock_server  # Local stand-in for the Qubrid API
+
+# Nothing in the suite may touch the operator's real database: outside the 'db' fixture (and in the
+# write-behind queue's final flush at interpreter exit) the default file is a throwaway one too
+database.DB_NAME = os.path.join(tempfile.mkdtemp(prefix="diagnostiq-tests-"), "default.db")
+
+# --- SHARED FIXTURES ---
+# Every test that touches SQLite gets its own database file (migrated from scratch by init_db),
+# and every test that calls the model talks to benchmarks/mock_qubrid.py instead of the real API,
+# so the suite runs offline and spends no API credits.
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, fully migrated database (and assets folder) for one test."""
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "test.db"))
+    monkeypatch.setattr(settings, "ASSETS_DIR", str(tmp_path / "assets"))
+    database.init_db()
+    yield database
+    database.flush_writes(10)  # Nothing queued for this file may land after the test
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """
+    A running mock Qubrid server the API client is pointed at. Yields the server:
+    server.config (MockConfig) sets latency / failures and counts the requests it received.
+    """
+    server, url = start_mock_server(ttft=0.01, tps=2000, tokens=20)
+    server.handle_error = lambda request, client_address: None  # Clients hanging up (timeouts, cancels) are expected here
+    monkeypatch.setattr(settings, "API_URL", url)
+    monkeypatch.setattr(settings, "API_KEY", settings.API_KEY or "test-key")
+    monkeypatch.setattr(settings, "HTTP_BACKOFF_BASE", 0.01)  # Retries without the real waits
+    monkeypatch.setattr(settings, "HTTP_BACKOFF_MAX", 0.05)
+    monkeypatch.setattr(api_client, "_http_session", None)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_image(color="red", size=(64, 48), fmt="PNG") -> bytes:
+    """A small solid-colour image, encoded in memory."""
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+@pytest.fixture
+def image_file(tmp_path) -> str:
+    """Path of a small PNG on disk (what the UI hands to an analysis)."""
+    path = tmp_path / "part.png"
+    path.write_bytes(make_image())
+    return str(path)
@@ -0,0 +1,117 @@
+import time  # Checks that Retry-After was waited out
+import pytest  # Expected exceptions
+import requests  # Exception types of the HTTP client
+from config.settings import settings  # Retry limits and timeouts
+from backend import api_client  # The shared HTTP session
+from backend.api_client import iter_sse_events, extract_delta, chat_with_industrial_ai, post_with_retry  # Client under test
+
+class FakeStream:
+    """Stands in for a streamed requests.Response: only iter_lines() is used by iter_sse_events."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.read = 0  # How many lines were consumed (the parser must stop at [DONE])
+
+    def iter_lines(self, decode_unicode=False):
+        for line in self.lines:
+            self.read += 1
+            yield line
+
+# --- SERVER-SENT EVENTS ---
+
+def test_sse_yields_json_chunks_until_done():
+    stream = FakeStream([
+        'data: {"choices": [{"delta": {"content": "Hel"}}]}',
+        "",
+        'data: {"choices": [{"delta": {"content": "lo"}}]}',
+        "data: [DONE]",
+        'data: {"choices": [{"delta": {"content": "after the end"}}]}',
+    ])
+    chunks = list(iter_sse_events(stream))
+    assert "".join(extract_delta(c) for c in chunks) == "Hello"
+    assert stream.read == 4  # Nothing is read past the sentinel
+
+def test_sse_skips_comments_blank_lines_and_other_fields():
+    stream = FakeStream([
+        ": keep-alive",
+        "",
+        "event: message",
+        "id: 7",
+        'data:{"content": "no space after the colon"}',
+    ])
+    assert list(iter_sse_events(stream)) == [{"content": "no space after the colon"}]
+
+def test_sse_ignores_malformed_chunks():
+    stream = FakeStream([
+        'data: {"choices": [{"delta": {"content": "ok"}}',  # Cut off mid-object
+        'data: {"choices": [{"delta": {"content": "still ok"}}]}',
+    ])
+    chunks = list(iter_sse_events(stream))
+    assert [extract_delta(c) for c in chunks] == ["still ok"]
+
+def test_sse_ends_without_done_sentinel():
+    stream = FakeStream(['data: {"content": "a"}', 'data: {"content": "b"}'])
+    assert [extract_delta(c) for c in iter_sse_events(stream)] == ["a", "b"]
+
+def test_streamed_answer_matches_tokens(mock_api):
+    tokens = []
+    response = chat_with_industrial_ai("Inspect the flange.", None, [], "You are a QA analyst.", on_token=tokens.append)
+    assert tokens and "".join(tokens) == response.content
+    assert response.usage.completion_tokens == mock_api.config.tokens
+    assert response.usage.ttft > 0
+
+# --- RETRIES ---
+
+def _fail_first(config, count: int):
+    """Makes the mock server answer its first 'count' requests with config.error_status."""
+    def should_fail():
+        with config._lock:
+            config.requests += 1
+            fail = config.requests <= count
+            config.errors += fail
+            return fail
+    config.should_fail = should_fail
+
+def test_retries_until_success(mock_api):
+    _fail_first(mock_api.config, 2)
+    response = post_with_retry({"messages": []}, {})
+    assert response.status_code == 200
+    assert mock_api.config.requests == 3
+
+def test_gives_up_after_max_retries(mock_api, monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_MAX_RETRIES", 2)
+    mock_api.config.error_rate = 1.0
+    response = post_with_retry({"messages": []}, {})
+    assert response.status_code == 503  # The last answer is handed back for the caller to report
+    assert mock_api.config.requests == 3
+
+def test_client_errors_are_not_retried(mock_api):
+    mock_api.config.error_rate, mock_api.config.error_status = 1.0, 400
+    assert post_with_retry({"messages": []}, {}).status_code == 400
+    assert mock_api.config.requests == 1
+
+def test_retry_after_is_honored(mock_api, monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_BACKOFF_MAX", 5)
+    mock_api.config.error_status, mock_api.config.retry_after = 429, 0.3
+    _fail_first(mock_api.config, 1)
+    started = time.perf_counter()
+    assert post_with_retry({"messages": []}, {}).status_code == 200
+    assert time.perf_counter() - started >= 0.3
+
+def test_connection_failures_are_retried_then_raised(mock_api, monkeypatch):
+    mock_api.shutdown()
+    mock_api.server_close()  # Nothing listens on the port any more
+    monkeypatch.setattr(settings, "HTTP_MAX_RETRIES", 2)
+    calls = []
+    original_post = api_client.get_http_session().post
+    monkeypatch.setattr(api_client.get_http_session(), "post", lambda *a, **kw: calls.append(1) or original_post(*a, **kw))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        post_with_retry({"messages": []}, {})
+    assert len(calls) == 3
+
+def test_read_timeouts_are_not_retried(mock_api, monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_READ_TIMEOUT", 0.1)
+    mock_api.config.ttft = 0.5  # The server may still be generating (and billing) this answer
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        post_with_retry({"messages": []}, {})
+    assert mock_api.config.requests == 1
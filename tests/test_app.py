@@ -0,0 +1,54 @@
+import os  # Path of app.py
+import time  # Lets the data_version check fall due
+import pytest  # Fixtures
+from streamlit.testing.v1 import AppTest  # Runs the Streamlit script headless
+from config.settings import settings  # Metrics exporter switch
+from backend import database  # Its connections are traced
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+@pytest.fixture
+def statements(monkeypatch) -> list:
+    """Every SQL statement run on a connection opened from now on (request it before 'db')."""
+    executed = []
+    open_connection = database._open_connection
+
+    def traced(db_name):
+        conn = open_connection(db_name)
+        conn.set_trace_callback(executed.append)
+        return conn
+
+    monkeypatch.setattr(database, "_open_connection", traced)
+    return executed
+
+@pytest.fixture
+def app(statements, db, monkeypatch):
+    """The app on a session with some history, after its first (loading) run."""
+    monkeypatch.setattr(settings, "METRICS_PORT", 0)
+    db.create_session("s1", "Valve body")
+    db.add_message("s1", "user", "Check the seat")
+    db.add_message("s1", "assistant", "Seat erosion found")
+    app = AppTest.from_file(APP, default_timeout=30)
+    app.session_state["active_session_id"] = "s1"
+    app.run()
+    assert not app.exception
+    return app
+
+# --- IDLE RERUNS ---
+
+def test_idle_rerun_executes_no_sql(app, statements):
+    statements.clear()
+    app.run()
+    assert statements == []
+
+def test_idle_rerun_checks_for_other_writers_at_most_once(app, statements, monkeypatch):
+    monkeypatch.setattr(database, "DATA_VERSION_CHECK_SECONDS", 1.0)
+    time.sleep(1.05)  # The last data_version check is now due
+    statements.clear()
+    app.run()
+    assert statements == ["PRAGMA data_version"]  # Shared by every cached read of the rerun
+
+def test_new_message_is_loaded_on_the_next_rerun(app, db):
+    db.add_message("s1", "user", "And the stem?")
+    app.run()
+    assert [m["content"] for m in app.session_state["messages"]][-1] == "And the stem?"
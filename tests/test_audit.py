@@ -0,0 +1,81 @@
+import time  # Polling for job state changes
+import pytest  # Fixtures
+from config.settings import settings  # Retry limits
+from backend import database, jobs  # Full audit under test
+from backend.schemas import PROMPTS  # One audit member per protocol
+
+def _wait_until(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+@pytest.fixture
+def run_audit(db, mock_api, image_file):
+    """Starts a full audit of the test image on a new session; returns a function waiting for it to end."""
+    db.create_session("s1")
+
+    def start(wait: bool = True) -> jobs.Audit:
+        audit = jobs.submit_full_audit("s1", image_file, [])
+        if wait:
+            _wait_until(lambda: not any(job.active for job in audit.jobs.values()))
+        return audit
+    return start
+
+def _statuses(audit: jobs.Audit) -> list:
+    return sorted(job.status for job in audit.jobs.values())
+
+# --- FULL AUDIT ---
+
+def test_one_answer_per_protocol_under_one_question(run_audit, db, mock_api):
+    audit = run_audit()
+    assert _statuses(audit) == [jobs.DONE] * len(PROMPTS)
+    assert mock_api.config.requests == len(PROMPTS)
+
+    history = db.get_messages_since("s1")  # (with message ids)
+    assert [m["role"] for m in history] == ["user"] + ["assistant"] * len(PROMPTS)
+    assert history[0]["content"] == jobs.AUDIT_QUESTION
+    assert sorted(m["content"].split("\n")[0] for m in history[1:]) == sorted(f"**[{p.upper()}]**" for p in PROMPTS)
+    assert {job.question_message_id for job in audit.jobs.values()} == {history[0]["id"]}
+    assert sorted(job.answer_message_id for job in audit.jobs.values()) == [m["id"] for m in history[1:]]
+
+def test_answers_are_saved_in_a_single_transaction(run_audit, db, monkeypatch):
+    insert_message = database._insert_message
+
+    def fail_on_last_answer(conn, session_id, role, content, *args):
+        if content.startswith(f"**[{list(PROMPTS)[-1].upper()}]**"):
+            raise RuntimeError("disk full")
+        return insert_message(conn, session_id, role, content, *args)
+
+    monkeypatch.setattr(database, "_insert_message", fail_on_last_answer)
+    audit = run_audit()
+    assert _statuses(audit) == [jobs.FAILED] * len(PROMPTS)
+    assert all("could not be saved" in job.error for job in audit.jobs.values())
+    assert db.get_session_history("s1") == []  # Not the question, nor the answers that were written first
+
+def test_failed_protocol_is_reported_and_the_others_are_saved(run_audit, db, mock_api, monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_MAX_RETRIES", 0)
+    config = mock_api.config
+
+    def fail_first_request():
+        with config._lock:
+            config.requests += 1
+            return config.requests == 1
+    config.should_fail = fail_first_request
+
+    audit = run_audit()
+    assert _statuses(audit) == sorted([jobs.DONE] * (len(PROMPTS) - 1) + [jobs.FAILED])
+    (failed,) = [job for job in audit.jobs.values() if job.status == jobs.FAILED]
+    assert failed.error and failed.answer_message_id is None
+    history = db.get_session_history("s1")
+    assert [m["role"] for m in history] == ["user"] + ["assistant"] * (len(PROMPTS) - 1)
+    assert not any(m["content"].startswith(f"**[{failed.protocol.upper()}]**") for m in history)
+
+def test_cancelled_audit_saves_nothing(run_audit, db, mock_api):
+    mock_api.config.ttft = 1.0
+    audit = run_audit(wait=False)
+    _wait_until(lambda: all(job.status == jobs.RUNNING for job in audit.jobs.values()))
+    audit.cancel()
+    _wait_until(lambda: not any(job.active for job in audit.jobs.values()))
+    assert _statuses(audit) == [jobs.CANCELLED] * len(PROMPTS)
+    assert db.get_session_history("s1") == []
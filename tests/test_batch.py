@@ -0,0 +1,82 @@
+import os  # File existence checks
+import pytest  # Fixtures
+from conftest import make_image  # Small test images
+from backend import batch  # Batch pipeline under test
+from backend.image_store import store_image, attach_image  # Reference-counted image store
+
+def _refcount(db, path: str) -> int:
+    with db.get_connection() as conn:
+        row = conn.execute("SELECT refcount FROM images WHERE path = ?", (path,)).fetchone()
+    return row[0] if row else 0
+
+def _lot(count: int) -> list:
+    return [(f"part_{i}.png", make_image(color=(i * 20, 0, 0))) for i in range(count)]
+
+# --- IMAGE REFERENCES ---
+
+def test_store_takes_a_reference_until_released(db):
+    stored = store_image(make_image("blue"))
+    assert _refcount(db, stored.path) == 1
+    db.release_images([stored.path])
+    assert not os.path.exists(stored.path)
+    assert not os.path.exists(stored.thumb_path)
+
+def test_stored_image_survives_release_by_another_session(db):
+    raw = make_image("green")
+    db.create_session("other")
+    attach_image("other", raw)
+    stored = store_image(raw)  # e.g. a batch image, linked to its session only later
+    db.delete_session("other")
+    assert os.path.exists(stored.path)
+    db.save_batch_results([{"session_id": "lot", "title": "[BATCH] green.png", "image_path": stored.path,
+                            "image_hash": stored.hash, "mode": "Defect Inspection", "question": "Q", "answer": "A", "usage": None}])
+    assert _refcount(db, stored.path) == 1
+
+def test_relinking_the_same_image_keeps_one_reference(db):
+    db.create_session("s1")
+    attach_image("s1", make_image("red"))
+    stored = attach_image("s1", make_image("red"))
+    assert _refcount(db, stored.path) == 1
+
+# --- BATCH RUNS ---
+
+def test_batch_saves_every_image_as_a_session(db, mock_api):
+    results = batch.run_batch(_lot(5), "Defect Inspection", concurrency=3, rate_limit=0, flush_size=2)
+    assert not [r for r in results if r.error]
+    titles = {s["title"] for s in db.get_all_sessions()}
+    assert titles == {f"[BATCH] part_{i}.png" for i in range(5)}
+
+def test_failed_flush_marks_its_group_failed_and_keeps_going(db, mock_api, monkeypatch):
+    original_save = batch.save_batch_results
+    calls = []
+
+    def save_failing_once(records):
+        calls.append(len(records))
+        if len(calls) == 1:
+            raise RuntimeError("disk full")
+        original_save(records)
+
+    monkeypatch.setattr(batch, "save_batch_results", save_failing_once)
+    progress = []
+    results = batch.run_batch(_lot(7), "Defect Inspection", concurrency=2, rate_limit=0, flush_size=3,
+                              on_progress=progress.append)
+
+    failed = [r for r in results if r.error]
+    assert len(failed) == 3 and all("disk full" in r.error for r in failed)
+    assert len(db.get_all_sessions()) == 4
+    assert (progress[-1].completed, progress[-1].failed) == (4, 3)
+    with db.get_connection() as conn:
+        # Only the saved sessions hold references: the failed group's were given back
+        assert conn.execute("SELECT SUM(refcount) FROM images").fetchone()[0] == 4
+
+def test_start_batch_runs_in_the_background(db, mock_api):
+    mock_api.config.ttft = 0.2
+    run = batch.start_batch(_lot(3), "Defect Inspection", concurrency=3, rate_limit=0)
+    assert not run.finished.is_set()  # Returned before the analyses ended
+    assert run.finished.wait(10)
+    assert run.error is None
+    assert run.progress.completed == 3 and len(run.results) == 3
+
+def test_unknown_protocol_is_rejected(db):
+    with pytest.raises(ValueError):
+        batch.run_batch(_lot(1), "No Such Protocol")
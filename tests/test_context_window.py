@@ -0,0 +1,70 @@
+from config.settings import settings  # Token budget and kept messages
+from backend.api_client import chat_with_industrial_ai  # Records the window in UsageMetrics
+from backend.context_window import SUMMARY_HEADER, estimate_tokens, fit_context  # Budget logic under test
+
+SYSTEM_PROMPT = "You are a QA analyst."
+QUESTION = "And the weld seam?"
+
+def _history(turns: int, words: int = 100) -> list:
+    """'turns' question/answer pairs; every message is about 'words' words long."""
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i}: " + "detail " * words})
+        history.append({"role": "assistant", "content": f"## QA Status: FAIL (turn {i})\n" + "finding " * words})
+    return history
+
+def _contents(window) -> list:
+    return [m["content"] for m in window.messages]
+
+# --- TOKEN BUDGET ---
+
+def test_everything_is_sent_when_it_fits():
+    history = _history(3, words=5)
+    window = fit_context(history, SYSTEM_PROMPT, QUESTION, budget=10_000)
+    assert _contents(window) == [m["content"] for m in history]
+    assert window.system_prompt == SYSTEM_PROMPT
+    assert window.dropped_messages == 0 and not window.summarized
+
+def test_recent_messages_are_kept_even_over_budget():
+    history = _history(5, words=1000)  # Each message alone is over the budget
+    window = fit_context(history, SYSTEM_PROMPT, QUESTION, budget=500, keep_recent=4, summary_tokens=100)
+    assert _contents(window) == [m["content"] for m in history[-4:]]
+    assert window.dropped_messages == 6
+
+def test_older_messages_are_added_back_newest_first_while_they_fit():
+    history = _history(5)
+    cost = estimate_tokens(history[0]["content"])
+    fixed = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(QUESTION)
+    # Room for the 4 kept messages, 2 older ones and the summary, but not for a 7th message
+    budget = fixed + 100 + 6 * cost + cost // 2
+    window = fit_context(history, SYSTEM_PROMPT, QUESTION, budget=budget, keep_recent=4, summary_tokens=100)
+    assert _contents(window) == [m["content"] for m in history[-6:]]
+    assert window.dropped_messages == 4
+
+def test_kept_history_never_starts_with_an_orphaned_answer():
+    history = _history(5)
+    cost = estimate_tokens(history[0]["content"])
+    fixed = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(QUESTION)
+    # Room for exactly 5 messages: the 5th from the end is an answer whose question does not fit
+    window = fit_context(history, SYSTEM_PROMPT, QUESTION, budget=fixed + 100 + 5 * cost, keep_recent=4, summary_tokens=100)
+    assert window.messages[0]["role"] == "user"
+    assert len(window.messages) == 4
+
+def test_dropped_messages_are_summarized_in_the_system_prompt():
+    history = _history(5)
+    window = fit_context(history, SYSTEM_PROMPT, QUESTION, budget=1000, keep_recent=4, summary_tokens=200)
+    assert window.summarized
+    assert window.system_prompt.startswith(SYSTEM_PROMPT + "\n\n" + SUMMARY_HEADER)
+    assert "AI reported: QA Status: FAIL (turn 2)" in window.system_prompt  # The newest dropped answer
+    assert window.estimated_tokens <= 1000
+
+# --- METRICS ---
+
+def test_window_is_recorded_in_usage_metrics(db, mock_api, image_file, monkeypatch):
+    monkeypatch.setattr(settings, "CONTEXT_TOKEN_BUDGET", 1000)
+    monkeypatch.setattr(settings, "CONTEXT_KEEP_MESSAGES", 4)
+    response = chat_with_industrial_ai(current_question=QUESTION, image_file=image_file, chat_history=_history(5),
+                                       system_prompt=SYSTEM_PROMPT)
+    assert response.usage.context_dropped == 6
+    assert response.usage.context_summarized
+    assert 0 < response.usage.context_tokens_est <= 1000
@@ -0,0 +1,79 @@
+import time  # Polling for job state changes
+from backend import defects, jobs  # Defect extraction under test (and the job path that applies it)
+from benchmarks.mock_qubrid import ANSWER_WORDS  # The mock's answer carries a Defect Log table
+
+DEFECT_ANSWER = """## QA Status: FAIL
+## Defect Log
+| Zone | Anomaly Detected | Severity (Low/Med/Crit) | Rejection Criteria |
+| :--- | :--- | :--- | :--- |
+| **Weld seam** | Porosity | [Critical] | ISO 5817-B |
+| Flange face | Pitting | moderate | ASME B16.5 |
+"""
+
+SPECS_ANSWER = """The part appears to be a hydraulic valve body.
+| Property | Value | Unit |
+| :--- | :--- | :--- |
+| Pressure | 250 | bar |
+"""
+
+def _wait_until(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+# --- PARSING ---
+
+def test_json_block_is_parsed_and_hidden():
+    content = DEFECT_ANSWER + (
+        '\n```json\n{"qa_status": "fail", "defects": [{"zone": "Die", "anomaly": "Crack", '
+        '"severity": "HIGH", "rejection_criteria": "ISO-9001 Fail"}]}\n```\n'
+    )
+    display, report = defects.extract_defect_report(content)
+    assert "```json" not in display and "Defect Log" in display
+    assert report.source == "json" and report.qa_status == "FAIL"
+    assert [(d.zone, d.anomaly, d.severity) for d in report.defects] == [("Die", "Crack", "Crit")]
+
+def test_markdown_table_is_the_fallback():
+    display, report = defects.extract_defect_report(DEFECT_ANSWER)
+    assert display == DEFECT_ANSWER
+    assert report.source == "markdown" and report.qa_status == "FAIL"
+    assert [(d.zone, d.anomaly, d.severity, d.rejection_criteria) for d in report.defects] == [
+        ("Weld seam", "Porosity", "Crit", "ISO 5817-B"), ("Flange face", "Pitting", "Med", "ASME B16.5")]
+
+def test_invalid_json_block_falls_back_to_the_table():
+    display, report = defects.extract_defect_report(DEFECT_ANSWER + "```json\n{not json}\n```")
+    assert "```json" not in display
+    assert report.source == "markdown" and len(report.defects) == 2
+
+# --- ONLY DEFECT INSPECTION ANSWERS ---
+
+def _answer(db, image_file, protocol: str) -> jobs.Job:
+    db.create_session("s1", mode=protocol)
+    job = jobs.submit_analysis("s1", "Inspect the part.", image=image_file, chat_history=[],
+                               system_prompt="You are a QA analyst.", protocol=protocol)
+    _wait_until(lambda: not job.active)
+    assert job.status == jobs.DONE
+    return job
+
+def test_other_protocols_are_not_extracted(db, mock_api, image_file):
+    mock_api.config.tokens = len(ANSWER_WORDS)  # The whole report, table included
+    job = _answer(db, image_file, "General Analysis")
+    assert "| Flange face |" in job.text  # The table is kept as ordinary answer text
+    assert db.query_defects() == [] and db.count_qa_status() == {}
+
+def test_defect_inspection_answers_are_extracted(db, mock_api, image_file):
+    mock_api.config.tokens = len(ANSWER_WORDS)
+    _answer(db, image_file, "Defect Inspection")
+    assert [(d["zone"], d["severity"]) for d in db.query_defects()] == [("Flange face", "Crit")]
+    assert db.count_qa_status() == {"FAIL": 1}
+
+def test_backfill_reads_only_defect_inspection_sessions(db):
+    db.create_session("inspection", mode="Defect Inspection")
+    db.add_message("inspection", "assistant", DEFECT_ANSWER)
+    db.create_session("general", mode="General Analysis")
+    db.add_message("general", "assistant", SPECS_ANSWER)
+
+    assert defects.backfill() == 1
+    assert {d["session_id"] for d in db.query_defects()} == {"inspection"}
+    assert defects.backfill() == 0  # Already parsed answers are skipped
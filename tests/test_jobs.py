@@ -0,0 +1,81 @@
+import time  # Polling for job state changes
+from config.settings import settings  # Streaming switch
+from backend import jobs  # Background analysis jobs under test
+
+def _wait_until(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def _submit(db, image_file, question: str = "Inspect the flange.") -> jobs.Job:
+    db.create_session("s1")
+    return jobs.submit_analysis("s1", question, image=image_file, chat_history=[], system_prompt="You are a QA analyst.")
+
+def _job_row_status(db, job: jobs.Job) -> str:
+    db.flush_writes(5)
+    return db.get_job_row(job.id)["status"]
+
+# --- JOBS ---
+
+def test_finished_job_saves_the_turn(db, mock_api, image_file):
+    job = _submit(db, image_file)
+    _wait_until(lambda: not job.active)
+    assert job.status == jobs.DONE
+    assert [m["role"] for m in db.get_session_history("s1")] == ["user", "assistant"]
+    assert _job_row_status(db, job) == jobs.DONE
+    assert not jobs.cancel(job.id)  # Too late to cancel
+
+def test_deleting_the_session_removes_its_job_rows(db, mock_api, image_file):
+    job = _submit(db, image_file)
+    _wait_until(lambda: not job.active)
+    assert _job_row_status(db, job) == jobs.DONE
+    db.delete_session("s1")
+    assert db.get_job_row(job.id) is None
+    assert db.get_jobs(session_id="s1") == []
+
+def test_cancel_mid_stream_aborts_the_request(db, mock_api, image_file):
+    mock_api.config.tps, mock_api.config.tokens = 50, 500  # Ten seconds of answer if nothing stops it
+    job = _submit(db, image_file)
+    _wait_until(lambda: job.parts)
+    started = time.monotonic()
+    assert jobs.cancel(job.id)
+    _wait_until(lambda: not job.active)
+    assert time.monotonic() - started < 2  # Stopped at the next token, not at the end of the answer
+    assert job.status == jobs.CANCELLED
+    assert db.get_session_history("s1") == []  # A cancelled question leaves nothing behind
+    assert _job_row_status(db, job) == jobs.CANCELLED
+
+def test_cancel_before_the_first_token(db, mock_api, image_file):
+    mock_api.config.ttft = 0.5
+    job = _submit(db, image_file)
+    _wait_until(lambda: job.status == jobs.RUNNING)
+    jobs.cancel(job.id)
+    _wait_until(lambda: not job.active)
+    assert job.status == jobs.CANCELLED
+    assert db.get_session_history("s1") == []
+
+def test_unstreamed_job_is_cancelled_when_the_call_returns(db, mock_api, image_file, monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_RESPONSES", False)  # QUBRID_STREAM=false
+    mock_api.config.ttft = 0.3
+    job = _submit(db, image_file)
+    _wait_until(lambda: job.status == jobs.RUNNING)
+    jobs.cancel(job.id)
+    _wait_until(lambda: not job.active)
+    assert job.status == jobs.CANCELLED
+    assert db.get_session_history("s1") == []
+
+def test_unstreamed_job_gets_the_whole_answer(db, mock_api, image_file, monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_RESPONSES", False)
+    job = _submit(db, image_file)
+    _wait_until(lambda: not job.active)
+    assert job.status == jobs.DONE
+    assert len(job.parts) == 1
+
+def test_failed_call_keeps_the_question(db, mock_api, image_file, monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_MAX_RETRIES", 0)
+    mock_api.config.error_rate = 1.0
+    job = _submit(db, image_file)
+    _wait_until(lambda: not job.active)
+    assert job.status == jobs.FAILED and job.error
+    assert [m["role"] for m in db.get_session_history("s1")] == ["user"]
@@ -0,0 +1,74 @@
+import re  # Checks the exposition format line by line
+import threading  # Serves the exporter in the background
+from http.server import ThreadingHTTPServer  # Same server class as start_metrics_server
+import requests  # Scrapes the exporter
+from backend import metrics  # Prometheus exporter under test
+from backend.api_client import chat_with_industrial_ai  # Produces real observations
+
+# One sample line: name, optional {labels}, value
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*"(,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*")*\})? \S+$')
+
+def _registry():
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter("test_requests_total", "Requests by result.", ["result"]))
+    histogram = registry.register(metrics.Histogram("test_latency_seconds", "Latency.", [0.5, 1, 2], ["mode"]))
+    return registry, counter, histogram
+
+# --- TEXT FORMAT ---
+
+def test_help_and_type_precede_the_samples():
+    registry, counter, _ = _registry()
+    counter.inc(result="ok")
+    counter.inc(2, result="ok")
+    counter.inc(result="error")
+    assert registry.render().splitlines()[:5] == [
+        "# HELP test_requests_total Requests by result.",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{result="error"} 1',
+        'test_requests_total{result="ok"} 3',
+        "# HELP test_latency_seconds Latency.",
+    ]
+
+def test_histogram_buckets_are_cumulative():
+    registry, _, histogram = _registry()
+    for value in (0.2, 0.5, 1.5, 7):
+        histogram.observe(value, mode="stream")
+    assert registry.render().splitlines()[-7:] == [
+        "# TYPE test_latency_seconds histogram",
+        'test_latency_seconds_bucket{mode="stream",le="0.5"} 2',  # An observation on a bound counts in that bucket
+        'test_latency_seconds_bucket{mode="stream",le="1.0"} 2',
+        'test_latency_seconds_bucket{mode="stream",le="2.0"} 3',
+        'test_latency_seconds_bucket{mode="stream",le="+Inf"} 4',
+        'test_latency_seconds_sum{mode="stream"} 9.2',
+        'test_latency_seconds_count{mode="stream"} 4',
+    ]
+
+def test_label_values_are_escaped():
+    registry, counter, _ = _registry()
+    counter.inc(result='bad "quote"\\path\nline')
+    assert 'test_requests_total{result="bad \\"quote\\"\\\\path\\nline"} 1' in registry.render().splitlines()
+
+# --- APPLICATION METRICS ---
+
+def test_exporter_serves_every_metric_after_an_analysis(db, mock_api, image_file):
+    chat_with_industrial_ai(current_question="Inspect the flange.", image_file=image_file, chat_history=[],
+                            system_prompt="You are a QA analyst.", on_token=lambda delta: None)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), metrics._MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        response = requests.get(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+
+    for metric in metrics.REGISTRY._metrics:
+        assert f"# HELP {metric.name} {metric.documentation}" in lines
+        assert f"# TYPE {metric.name} {metric.kind}" in lines
+    for line in lines:
+        assert line.startswith("# ") or SAMPLE_LINE.match(line), line
+    assert any(line.startswith('diagnostiq_api_latency_seconds_bucket{mode="stream",le="+Inf"}') for line in lines)
+    assert any(line.startswith('diagnostiq_api_requests_total{mode="stream",result="ok"}') for line in lines)
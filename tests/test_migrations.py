@@ -0,0 +1,114 @@
+import json  # Legacy usage_data column
+import sqlite3  # Builds databases the way older app versions left them
+import pytest  # Fixtures and expected exceptions
+from backend import database  # Migration runner under test
+
+EXPECTED_TABLES = {"sessions", "messages", "response_cache", "images", "defects", "defect_reports",
+                   "messages_fts", "sessions_fts", "message_metrics", "jobs"}
+
+def _tables() -> set:
+    with database.get_connection() as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch) -> str:
+    """An empty database path, NOT migrated yet (the tests decide what is in it first)."""
+    path = str(tmp_path / "legacy.db")
+    monkeypatch.setattr(database, "DB_NAME", path)
+    return path
+
+# --- MIGRATION CHAIN ---
+
+def test_fresh_database_reaches_latest_version(db_file):
+    database.init_db()
+    assert database.get_schema_version() == len(database.MIGRATIONS)
+    assert EXPECTED_TABLES <= _tables()
+
+def test_pre_versioning_database_is_adopted_and_upgraded(db_file):
+    # What the very first app version created: no version number, no 'mode' column, usage as JSON text
+    legacy = sqlite3.connect(db_file)
+    legacy.execute("CREATE TABLE sessions (id TEXT PRIMARY KEY, title TEXT, image_path TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    legacy.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, role TEXT, content TEXT, "
+                   "usage_data TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    legacy.execute("INSERT INTO sessions (id, title) VALUES ('old', 'Corroded flange')")
+    legacy.execute("INSERT INTO messages (session_id, role, content) VALUES ('old', 'user', 'Check the weld seam')")
+    legacy.execute("INSERT INTO messages (session_id, role, content, usage_data) VALUES (?, ?, ?, ?)",
+                   ("old", "assistant", "Porosity found in the weld seam", json.dumps({"prompt_tokens": 900, "completion_tokens": 120,
+                                                                                    "total_tokens": 1020, "latency": 2.5})))
+    legacy.commit()
+    legacy.close()
+
+    database.init_db()
+
+    assert database.get_schema_version() == len(database.MIGRATIONS)
+    assert database.get_session_meta("old")["mode"] == "General Analysis"
+    history = database.get_session_history("old")
+    assert [m["content"] for m in history] == ["Check the weld seam", "Porosity found in the weld seam"]
+    assert history[1]["usage"]["completion_tokens"] == 120  # Copied into the typed metrics table (v8)
+    assert [r["id"] for r in database.search_sessions("porosity")] == ["old"]  # Indexed by v7
+    assert [r["id"] for r in database.search_sessions("corroded")] == ["old"]
+
+def test_partially_migrated_database_continues_where_it_stopped(db_file, monkeypatch):
+    all_migrations = list(database.MIGRATIONS)
+    monkeypatch.setattr(database, "MIGRATIONS", all_migrations[:4])
+    database.run_migrations()
+    assert database.get_schema_version() == 4
+
+    monkeypatch.setattr(database, "MIGRATIONS", all_migrations)
+    database.run_migrations()
+    assert database.get_schema_version() == len(all_migrations)
+    assert EXPECTED_TABLES <= _tables()
+
+def test_running_again_changes_nothing(db):
+    db.create_session("s1", "Pump housing")
+    db.add_message("s1", "user", "Any cracks?")
+    db.run_migrations()
+    assert db.get_schema_version() == len(db.MIGRATIONS)
+    assert [m["content"] for m in db.get_session_history("s1")] == ["Any cracks?"]
+
+def test_failed_migration_is_rolled_back(db, monkeypatch):
+    def broken_migration(c):
+        c.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("migration bug")
+
+    monkeypatch.setattr(db, "MIGRATIONS", db.MIGRATIONS + [broken_migration])
+    with pytest.raises(RuntimeError):
+        db.run_migrations()
+    assert db.get_schema_version() == len(db.MIGRATIONS) - 1  # Still at the previous version
+    assert "half_done" not in _tables()
+
+# --- METRICS HISTORY ---
+
+def _legacy_database(path: str, latencies: list):
+    """A pre-versioning database with one answer per latency, its usage as JSON without a 'cached' key."""
+    legacy = sqlite3.connect(path)
+    legacy.execute("CREATE TABLE sessions (id TEXT PRIMARY KEY, title TEXT, image_path TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    legacy.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, role TEXT, content TEXT, "
+                   "usage_data TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    legacy.execute("INSERT INTO sessions (id, title) VALUES ('old', 'Valve body')")
+    for latency in latencies:
+        legacy.execute("INSERT INTO messages (session_id, role, content, usage_data) VALUES ('old', 'assistant', 'Seat erosion', ?)",
+                       (json.dumps({"total_tokens": 1000, "latency": latency, "throughput": 100 / latency}),))
+    legacy.commit()
+    legacy.close()
+
+def test_legacy_answers_count_in_performance_stats(db_file):
+    _legacy_database(db_file, [1.5, 1.0, 3.0, 2.0])
+    database.init_db()
+
+    (stats,) = database.get_performance_stats()
+    assert stats["group"] == "General Analysis" and stats["requests"] == 4
+    assert (stats["latency_p50"], stats["latency_p95"], stats["latency_p99"]) == (1.5, 3.0, 3.0)
+
+def test_flags_copied_as_null_by_an_earlier_v8_are_repaired(db_file, monkeypatch):
+    _legacy_database(db_file, [1.5])
+    all_migrations = list(database.MIGRATIONS)
+    monkeypatch.setattr(database, "MIGRATIONS", all_migrations[:9])
+    database.run_migrations()
+    with database.get_connection() as conn:
+        conn.execute("UPDATE message_metrics SET cached = NULL, context_summarized = NULL")  # What the first v8 left behind
+    assert database.get_performance_stats() == []
+
+    monkeypatch.setattr(database, "MIGRATIONS", all_migrations)
+    database.run_migrations()
+    assert [s["latency_p50"] for s in database.get_performance_stats()] == [1.5]
@@ -0,0 +1,56 @@
+import time  # Lets an entry outlive a short TTL
+import pytest  # Fixtures
+from config.settings import settings  # TTL and size limits
+from backend import response_cache  # Cache under test
+from backend.api_client import chat_with_industrial_ai  # Where the cache is consulted
+from backend.schemas import ChatResponse, UsageMetrics, is_cacheable  # Stored answers; the per-protocol opt-in
+
+def _ask(image_file, protocol: str = "General Analysis") -> ChatResponse:
+    return chat_with_industrial_ai(current_question="Inspect the flange.", image_file=image_file, chat_history=[],
+                                   system_prompt="You are a QA analyst.", cacheable=is_cacheable(protocol))
+
+def _answer(text: str) -> ChatResponse:
+    return ChatResponse(content=text, usage=UsageMetrics(prompt_tokens=900, completion_tokens=100, total_tokens=1000))
+
+def _cached_keys(db) -> set:
+    with db.get_connection() as conn:
+        return {row[0] for row in conn.execute("SELECT key FROM response_cache")}
+
+@pytest.fixture
+def cache(db, monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    return response_cache
+
+# --- HITS AND MISSES ---
+
+def test_repeated_question_is_served_from_the_cache(cache, mock_api, image_file):
+    first = _ask(image_file)
+    second = _ask(image_file)
+    assert mock_api.config.requests == 1
+    assert second.content == first.content
+    assert second.usage.cached and second.usage.latency == 0.0
+    assert second.usage.total_tokens == first.usage.total_tokens  # What the answer originally cost
+
+def test_expired_entry_is_a_miss(cache, monkeypatch):
+    cache.store("k", _answer("Pitting on the flange face"))
+    assert cache.lookup("k").content == "Pitting on the flange face"
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_TTL", 0)
+    time.sleep(0.01)
+    assert cache.lookup("k") is None
+
+def test_safety_audit_is_never_cached(cache, mock_api, image_file, db):
+    _ask(image_file, "Safety Audit")
+    _ask(image_file, "Safety Audit")
+    assert mock_api.config.requests == 2
+    assert _cached_keys(db) == set()
+
+# --- EVICTION ---
+
+def test_least_recently_used_entries_are_evicted_first(cache, db, monkeypatch):
+    monkeypatch.setattr(cache, "EVICT_EVERY", 1)  # An eviction pass after every store
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_MAX_BYTES", 25_000)  # Room for two 10 KB answers
+    cache.store("a", _answer("a" * 10_000))
+    cache.store("b", _answer("b" * 10_000))
+    assert cache.lookup("a")  # 'a' is now more recently used than 'b'
+    cache.store("c", _answer("c" * 10_000))
+    assert _cached_keys(db) == {"a", "c"}
@@ -0,0 +1,71 @@
+import pytest  # Fixtures
+
+@pytest.fixture
+def archive(db):
+    """A few inspections: titles and messages with overlapping words."""
+    sessions = {
+        "flange": ("Corroded flange", ["Inspect the flange face", "Heavy pitting corrosion on the flange face"]),
+        "weld": ("Weld seam", ["Check the weld", "Porosity in the weld seam, no corrosion"]),
+        "pump": ("Pump housing", ["Any cracks?", "A hairline crack near the outlet"]),
+    }
+    for session_id, (title, messages) in sessions.items():
+        db.create_session(session_id, title)
+        for role, content in zip(("user", "assistant"), messages):
+            db.add_message(session_id, role, content)
+    return db
+
+def _ids(results) -> list:
+    return [r["id"] for r in results]
+
+# --- FULL-TEXT SEARCH ---
+
+def test_finds_sessions_by_message_and_title(archive):
+    assert set(_ids(archive.search_sessions("corrosion"))) == {"flange", "weld"}
+    assert _ids(archive.search_sessions("housing")) == ["pump"]
+
+def test_title_match_ranks_first(archive):
+    # "flange" has the word in its title and twice in its messages
+    assert _ids(archive.search_sessions("flange"))[0] == "flange"
+
+def test_every_word_must_match(archive):
+    assert _ids(archive.search_sessions("weld porosity")) == ["weld"]
+    assert archive.search_sessions("weld crack") == []
+
+def test_last_word_matches_as_prefix(archive):
+    assert _ids(archive.search_sessions("hairl")) == ["pump"]
+    assert _ids(archive.search_sessions("cracks")) == ["pump"]  # Stemmed: also finds "crack"
+
+def test_snippet_highlights_hits(archive):
+    (result,) = archive.search_sessions("porosity")
+    assert "**Porosity**" in result["snippet"]
+
+def test_operator_characters_are_safe(archive):
+    assert _ids(archive.search_sessions("flange-face:")) == ["flange"]
+    assert archive.search_sessions('"AND" (OR* NEAR(') == []  # Plain words here, not FTS5 syntax errors
+    assert archive.search_sessions("   ") == []
+    assert archive.search_sessions("") == []
+
+def test_results_follow_writes(archive):
+    assert archive.search_sessions("gasket") == []
+    archive.add_message("pump", "user", "Replace the gasket")
+    assert _ids(archive.search_sessions("gasket")) == ["pump"]
+    archive.update_session_title("weld", "Gasket leak")
+    assert set(_ids(archive.search_sessions("gasket"))) == {"pump", "weld"}
+    archive.delete_session("pump")
+    assert _ids(archive.search_sessions("gasket")) == ["weld"]
+
+def test_matches_older_than_the_ranking_window_are_found(db, monkeypatch):
+    monkeypatch.setattr(db, "SEARCH_RANK_WINDOW", 2)
+    for i in range(6):
+        db.create_session(f"s{i}", f"Part {i}")
+        db.add_message(f"s{i}", "user", f"Corrosion report {i}")
+
+    results = _ids(db.search_sessions("corrosion"))
+    assert sorted(results) == [f"s{i}" for i in range(6)]
+    assert set(results[:2]) == {"s4", "s5"}  # The ranked window (the newest hits)
+    assert results[2:] == ["s3", "s2", "s1", "s0"]  # Then the older hits, newest first
+
+    # Pages of 2 cover every session exactly once
+    pages = [_ids(db.search_sessions("corrosion", limit=2, offset=offset)) for offset in range(0, 8, 2)]
+    assert sum(pages, []) == results
+    assert pages[-1] == []
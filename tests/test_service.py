@@ -0,0 +1,109 @@
+import os  # Repository root for the subprocess
+import subprocess  # A second process writing to the same database
+import sys  # The interpreter running the suite
+import threading  # Serves the API in the background
+import time  # Waiting for jobs to drain
+from http.server import ThreadingHTTPServer  # Same server class as service.run
+import pytest  # Fixtures
+import requests  # HTTP client
+from conftest import make_image  # Small test images
+from config.settings import settings  # Capacity of the service
+from backend import jobs  # Active job count
+import service  # The headless REST service under test
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def api(db, mock_api, monkeypatch):
+    """The service on a free local port (one process, in this one). Yields its base URL."""
+    monkeypatch.setattr(settings, "SERVICE_QUEUE_SIZE", 1)
+    monkeypatch.setattr(settings, "JOB_WORKERS", 1)  # Capacity: 1 running + 1 queued
+    server = ThreadingHTTPServer(("127.0.0.1", 0), service.ServiceHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    # Don't leave analyses running into the next test
+    for job in list(jobs._jobs.values()):
+        jobs.cancel(job.id)
+    deadline = time.monotonic() + 10
+    while jobs.count_active_jobs() and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+def _post_image(api: str, **params):
+    return requests.post(f"{api}/analyses", data=make_image(), headers={"Content-Type": "image/png"},
+                         params={"protocol": "Defect Inspection", **params}, timeout=5)
+
+# --- ADMISSION (BACKPRESSURE) ---
+
+def test_full_queue_answers_429_with_retry_after(api, mock_api):
+    mock_api.config.ttft = 1.0  # Keeps the accepted analyses busy
+    accepted = [_post_image(api) for _ in range(service.capacity())]
+    assert [r.status_code for r in accepted] == [202] * service.capacity()
+
+    rejected = _post_image(api)
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == str(settings.SERVICE_RETRY_AFTER)
+    assert requests.get(f"{api}/health", timeout=5).json()["active_jobs"] == service.capacity()
+
+def test_slots_free_up_when_analyses_end(api):
+    first = [_post_image(api).json()["job_id"] for _ in range(service.capacity())]
+    deadline = time.monotonic() + 10
+    while any(jobs.get_job(job_id).active for job_id in first):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert _post_image(api).status_code == 202
+
+def test_rejected_uploads_do_not_hold_slots(api):
+    for _ in range(service.capacity() + 1):
+        response = requests.post(f"{api}/analyses", data=b"not an image", headers={"Content-Type": "image/png"},
+                                 params={"protocol": "Defect Inspection"}, timeout=5)
+        assert response.status_code == 400
+    assert _post_image(api, protocol="No Such Protocol").status_code == 400
+    assert service._reserved == 0
+    assert _post_image(api).status_code == 202
+
+def test_submitted_analysis_completes(api):
+    job = _post_image(api).json()
+    deadline = time.monotonic() + 10
+    while (view := requests.get(f"{api}/analyses/{job['job_id']}", timeout=5).json())["status"] != jobs.DONE:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    session = requests.get(f"{api}{job['links']['session']}", timeout=5).json()
+    assert [m["role"] for m in session["messages"]] == ["user", "assistant"]
+
+# --- SHARED DATABASE ---
+
+def test_read_caches_see_writes_from_other_processes(db, monkeypatch):
+    monkeypatch.setattr(db, "DATA_VERSION_CHECK_SECONDS", 0)  # Check on every read instead of twice a second
+    db.create_session("s1", "Valve body")
+    db.add_message("s1", "user", "Check the seat")
+    assert db.get_session_meta("s1")["title"] == "Valve body"  # Now cached in this process
+    assert [s["title"] for s in db.get_all_sessions()] == ["Valve body"]
+    version = db.get_session_version("s1")
+
+    # e.g. a service.py worker next to the Streamlit app
+    script = (
+        "import sys; sys.path.insert(0, sys.argv[1])\n"
+        "from backend import database\n"
+        "database.DB_NAME = sys.argv[2]\n"
+        "database.update_session_title('s1', 'Renamed elsewhere')\n"
+        "database.add_message('s1', 'assistant', 'Seat erosion found')\n"
+    )
+    subprocess.run([sys.executable, "-c", script, ROOT, db.DB_NAME], check=True, timeout=30)
+
+    assert db.get_session_version("s1") != version
+    assert db.get_session_meta("s1")["title"] == "Renamed elsewhere"
+    assert [s["title"] for s in db.get_all_sessions()] == ["Renamed elsewhere"]
+    assert len(db.get_session_history("s1")) == 2
+    assert [r["id"] for r in db.search_sessions("erosion")] == ["s1"]
+
+# --- INPUT VALIDATION ---
+
+@pytest.mark.parametrize("body", ["[]", '"x"', "42", "null", '{"protocol": ["Defect Inspection"]}', '{"image": 5}', "{not json"])
+def test_malformed_json_body_is_a_400(api, body):
+    response = requests.post(f"{api}/analyses", data=body, headers={"Content-Type": "application/json"}, timeout=5)
+    assert response.status_code == 400
+    assert response.json()["error"].startswith("Invalid JSON body")
+    assert service._reserved == 0
@@ -0,0 +1,72 @@
+import time  # Polling for state changes
+import pytest  # Fixtures
+from config.settings import settings  # Opt-in switch
+from backend import jobs, speculative  # Speculative pre-analysis under test
+from backend.batch import BATCH_QUESTION  # One of the default prompt texts
+
+PROTOCOL = "Defect Inspection"
+SYSTEM_PROMPT = "You are a QA analyst."
+
+def _wait_until(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+@pytest.fixture
+def enabled(db, mock_api, monkeypatch):
+    monkeypatch.setattr(settings, "SPECULATIVE_ANALYSIS", True)
+    monkeypatch.setattr(speculative, "_speculations", {})
+    db.create_session("s1")
+
+def _speculate(image_file):
+    return speculative.speculate("s1", image_file, PROTOCOL, SYSTEM_PROMPT, [])
+
+def _claim(question: str, image_file):
+    return speculative.claim("s1", question, image_file, PROTOCOL, SYSTEM_PROMPT, 0)
+
+# --- DEFAULT INTENTS ---
+
+def test_only_the_default_prompt_texts_are_default_intents():
+    assert speculative.is_default_intent(jobs.PROTOCOL_QUESTION.format(protocol=PROTOCOL), PROTOCOL)
+    assert speculative.is_default_intent("  please " + BATCH_QUESTION.upper(), PROTOCOL)  # Case, punctuation, filler
+    for question in ("go", "start", "report", "what is this?", "analyze", "Is the weld cracked?"):
+        assert not speculative.is_default_intent(question, PROTOCOL)
+    # The protocol question of another protocol does not count
+    assert not speculative.is_default_intent(jobs.PROTOCOL_QUESTION.format(protocol="Safety Audit"), PROTOCOL)
+
+# --- ADOPT / DISCARD ---
+
+def test_disabled_by_default(db, image_file):
+    assert _speculate(image_file) is None
+
+def test_default_question_adopts_the_speculation(enabled, mock_api, image_file):
+    speculation = _speculate(image_file)
+    speculation.finished.wait(10)
+    question = jobs.PROTOCOL_QUESTION.format(protocol=PROTOCOL)
+    assert _claim(question, image_file) is speculation
+    job = jobs.submit_speculated("s1", question, speculation, protocol=PROTOCOL)
+    _wait_until(lambda: not job.active)
+    assert job.status == jobs.DONE
+    assert mock_api.config.requests == 1  # The answer was not asked for twice
+
+def test_other_question_discards_and_aborts_it(enabled, mock_api, image_file):
+    mock_api.config.tps, mock_api.config.tokens = 50, 500  # Ten seconds of answer if nothing stops it
+    speculation = _speculate(image_file)
+    _wait_until(lambda: speculation.parts)
+    assert _claim("Is the weld cracked?", image_file) is None
+    assert speculation.finished.wait(2)  # Aborted at its next token
+    assert speculation.discarded and speculation.error is not None
+    _wait_until(lambda: speculative.get_stats()["wasted_completion_tokens"] > 0)
+
+def test_cancelling_the_adopting_job_aborts_the_speculation(enabled, mock_api, image_file):
+    mock_api.config.tps, mock_api.config.tokens = 50, 500
+    speculation = _speculate(image_file)
+    _wait_until(lambda: speculation.parts)
+    question = jobs.PROTOCOL_QUESTION.format(protocol=PROTOCOL)
+    job = jobs.submit_speculated("s1", question, _claim(question, image_file), protocol=PROTOCOL)
+    _wait_until(lambda: job.parts)
+    jobs.cancel(job.id)
+    assert speculation.finished.wait(2)
+    _wait_until(lambda: not job.active)
+    assert job.status == jobs.CANCELLED
@@ -0,0 +1,100 @@
+import base64  # Decodes the prepared payload
+import io  # Images in memory
+import threading  # Holds a report build open while another session is served
+from PIL import Image  # Builds and inspects test photos
+from config.settings import settings  # Size cap of the prepared image
+from backend.utils import prepare_image, ORIENTATION_TAG, PdfReportBuilder, PdfReportCache  # Units under test
+
+def _photo(orientation=None, size=(400, 200)) -> bytes:
+    """A noisy (hard to compress) JPEG, optionally tagged with an EXIF orientation."""
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[ORIENTATION_TAG] = orientation
+    buffer = io.BytesIO()
+    Image.effect_noise(size, 90).convert("RGB").save(buffer, format="JPEG", quality=1, exif=exif.tobytes())
+    return buffer.getvalue()
+
+def _sent(prepared) -> bytes:
+    return base64.b64decode(prepared.data)
+
+# --- IMAGE PREPARATION ---
+
+def test_upright_original_is_kept_when_reencoding_does_not_help():
+    for orientation in (None, 1):
+        raw = _photo(orientation)
+        prepared = prepare_image(io.BytesIO(raw))
+        assert _sent(prepared) == raw
+        assert prepared.mime_type == "image/jpeg"
+
+def test_rotated_photo_is_sent_upright():
+    raw = _photo(orientation=6)  # "Rotate 90° clockwise": stored sideways
+    prepared = prepare_image(io.BytesIO(raw))
+    assert _sent(prepared) != raw
+    assert Image.open(io.BytesIO(_sent(prepared))).size == (200, 400)
+    assert (prepared.width, prepared.height) == (200, 400)
+
+def test_large_photo_is_downscaled():
+    raw = _photo(size=(settings.IMAGE_MAX_EDGE * 2, settings.IMAGE_MAX_EDGE))
+    prepared = prepare_image(io.BytesIO(raw))
+    assert max(Image.open(io.BytesIO(_sent(prepared))).size) == settings.IMAGE_MAX_EDGE
+    assert prepared.prepared_bytes <= settings.IMAGE_MAX_BYTES
+
+def test_undecodable_upload_is_sent_as_is():
+    raw = b"not an image at all"
+    prepared = prepare_image(io.BytesIO(raw))
+    assert _sent(prepared) == raw
+
+# --- PDF REPORT CACHE ---
+
+def _history(count: int) -> list:
+    return [{"id": i, "role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i} about the flange."}
+            for i in range(count)]
+
+def test_report_is_cached_then_extended():
+    cache = PdfReportCache(max_entries=4)
+    first = cache.build("s1", _history(4))
+    assert first.startswith(b"%PDF")
+    assert cache.get("s1", 3) is first
+    assert cache.get("s1", 5) is None  # Out of date: nothing is built by get()
+
+    longer = cache.build("s1", _history(6))
+    assert cache.get("s1", 5) is longer
+    assert len(cache._entries["s1"]["builder"].messages) == 6
+
+def test_edited_history_is_rebuilt_from_scratch():
+    cache = PdfReportCache(max_entries=4)
+    cache.build("s1", _history(4))
+    # The last laid-out message is gone (replaced): the cached layout is no longer a prefix
+    edited = _history(3) + [{"id": 99, "role": "assistant", "content": "Regenerated answer"}]
+    cache.build("s1", edited + [{"id": 100, "role": "user", "content": "More"}])
+    assert [m["id"] for m in cache._entries["s1"]["builder"].messages] == [0, 1, 2, 99, 100]
+
+def test_oldest_reports_are_evicted():
+    cache = PdfReportCache(max_entries=2)
+    for session_id in ("a", "b", "c"):
+        cache.build(session_id, _history(2))
+    assert cache.get("a", 1) is None and cache.get("c", 1) is not None
+
+def test_slow_build_does_not_block_other_sessions(monkeypatch):
+    cache = PdfReportCache(max_entries=4)
+    ready = cache.build("ready", _history(2))
+    rendering, release = threading.Event(), threading.Event()
+    original_render = PdfReportBuilder.render
+
+    def slow_render(self):
+        rendering.set()
+        release.wait(5)
+        return original_render(self)
+
+    monkeypatch.setattr(PdfReportBuilder, "render", slow_render)
+    builder = threading.Thread(target=cache.build, args=("long", _history(40)))
+    builder.start()
+    try:
+        assert rendering.wait(5)
+        # The long report is still being laid out; the cached one is served meanwhile
+        assert cache.get("ready", 1) is ready
+        assert cache.build("ready", _history(2)) is ready
+    finally:
+        release.set()
+        builder.join()
+    assert cache.get("long", 39) is not None
@@ -0,0 +1,83 @@
+import threading  # Holds the writer busy so several writes queue up into one group
+import pytest  # Fixtures and expected exceptions
+from backend.database import WriteBehindQueue  # Group-committing writer under test
+
+def _insert(conn, session_id: str, content: str):
+    cursor = conn.execute("INSERT INTO messages (session_id, role, content) VALUES (?, 'user', ?)", (session_id, content))
+    return cursor.lastrowid, [session_id]
+
+def _insert_then_fail(conn, session_id: str, content: str):
+    _insert(conn, session_id, content)
+    raise ValueError("bad write")
+
+def _contents(db) -> list:
+    with db.get_connection() as conn:
+        return [row[0] for row in conn.execute("SELECT content FROM messages ORDER BY id")]
+
+@pytest.fixture
+def writer(db):
+    """A private writer (the process-wide one is shared with the rest of the app)."""
+    db.create_session("s1")
+    return WriteBehindQueue(batch_max=64)
+
+def _hold(writer) -> threading.Event:
+    """Keeps the writer inside a write until the returned event is set, so what is queued meanwhile forms one group."""
+    started, release = threading.Event(), threading.Event()
+
+    def blocking_write(conn):
+        started.set()
+        release.wait(5)
+        return None, []
+
+    writer.submit(blocking_write)
+    assert started.wait(5)
+    return release
+
+# --- WRITE-BEHIND QUEUE ---
+
+def test_writes_are_committed_and_acknowledged(db, writer):
+    futures = [writer.submit(_insert, "s1", f"m{i}") for i in range(5)]
+    ids = [f.result(5) for f in futures]
+    assert ids == sorted(ids)  # Committed in submission order
+    assert _contents(db) == [f"m{i}" for i in range(5)]
+
+def test_failing_write_fails_alone_in_its_group(db, writer):
+    release = _hold(writer)
+    good_before = writer.submit(_insert, "s1", "before")
+    bad = writer.submit(_insert_then_fail, "s1", "half written")
+    good_after = writer.submit(_insert, "s1", "after")
+    release.set()
+
+    assert good_before.result(5) and good_after.result(5)
+    with pytest.raises(ValueError):
+        bad.result(5)
+    # The bad write's own insert was rolled back (SAVEPOINT); its neighbours were committed
+    assert _contents(db) == ["before", "after"]
+
+def test_failed_commit_fails_the_whole_group(db, writer):
+    release = _hold(writer)
+    futures = [writer.submit(_insert, "s1", f"m{i}") for i in range(3)]
+    # The next transaction cannot even start: every write of that group gets the error
+    test_db = db.DB_NAME
+    db.DB_NAME = "/nonexistent-dir/unwritable.db"
+    try:
+        release.set()
+        for future in futures:
+            with pytest.raises(Exception):
+                future.result(5)
+    finally:
+        db.DB_NAME = test_db
+    assert _contents(db) == []
+
+def test_flush_waits_for_queued_writes(db, writer):
+    release = _hold(writer)
+    future = writer.submit(_insert, "s1", "queued")
+    release.set()
+    writer.flush(5)
+    assert future.done()
+    assert _contents(db) == ["queued"]
+
+def test_commit_bumps_the_session_version(db, writer):
+    before = db.get_session_version("s1")
+    writer.submit(_insert, "s1", "new").result(5)
+    assert db.get_session_version("s1") != before